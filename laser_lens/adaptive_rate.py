@@ -0,0 +1,128 @@
+# adaptive_rate.py
+
+import threading
+import time
+from collections import deque
+from typing import Deque
+
+from config import Config
+
+
+class CircuitOpenError(Exception):
+    """Raised when the circuit breaker rejects a request."""
+
+    pass
+
+
+class AdaptiveRateController:
+    """
+    Additive-increase / multiplicative-decrease request rate.
+
+    The rate starts at *max_rpm*. Each overload response (429/503) multiplies
+    it by ``config.aimd_decrease_factor`` and each success adds
+    ``config.aimd_increase_rpm`` back, up to *max_rpm*. While below the
+    maximum, :meth:`reserve` spaces requests ``60 / rate`` seconds apart.
+    """
+
+    def __init__(self, config: Config, max_rpm: float):
+        self.max_rpm = float(max_rpm)
+        self.min_rpm = min(config.aimd_min_rpm, self.max_rpm)
+        self.increase = config.aimd_increase_rpm
+        self.decrease = config.aimd_decrease_factor
+        self.rate = self.max_rpm
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def on_success(self) -> None:
+        with self._lock:
+            self.rate = min(self.max_rpm, self.rate + self.increase)
+
+    def on_overload(self) -> None:
+        with self._lock:
+            self.rate = max(self.min_rpm, self.rate * self.decrease)
+
+    def reserve(self) -> float:
+        """Reserve the next request slot and return how long to wait for it."""
+        with self._lock:
+            now = time.time()
+            if self.rate >= self.max_rpm:
+                self._next_slot = now
+                return 0.0
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + 60.0 / self.rate
+            return slot - now
+
+
+class CircuitBreaker:
+    """
+    Fails fast while the recent error rate stays high.
+
+    Outcomes of the last ``config.breaker_window`` attempts are kept. Once at
+    least ``config.breaker_min_calls`` are recorded and the failure ratio
+    reaches ``config.breaker_failure_ratio`` the breaker opens and
+    :meth:`allow` returns False for ``config.breaker_cooldown_seconds``. After
+    that a single trial request is let through; its outcome closes or
+    re-opens the breaker.
+    """
+
+    def __init__(self, config: Config):
+        self.window = config.breaker_window
+        self.min_calls = config.breaker_min_calls
+        self.failure_ratio = config.breaker_failure_ratio
+        self.cooldown = config.breaker_cooldown_seconds
+        self.state = "closed"
+        self.opened_at = 0.0
+        self._outcomes: Deque[bool] = deque(maxlen=self.window)
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open":
+                if time.time() - self.opened_at < self.cooldown:
+                    return False
+                self.state = "half_open"
+                self._trial_in_flight = False
+            if self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def release(self) -> None:
+        """
+        Give back an allowed request that ended without an outcome, e.g. a
+        cancelled one. A half-open breaker then lets the next trial through.
+        """
+        with self._lock:
+            if self.state == "half_open":
+                self._trial_in_flight = False
+
+    def retry_after(self) -> float:
+        """Seconds until an open breaker lets a trial request through."""
+        return max(0.0, self.opened_at + self.cooldown - time.time())
+
+    def record(self, success: bool) -> None:
+        with self._lock:
+            if self.state == "half_open":
+                self._trial_in_flight = False
+                if success:
+                    self.state = "closed"
+                    self._outcomes.clear()
+                else:
+                    self._open()
+                return
+            self._outcomes.append(success)
+            failures = self._outcomes.count(False)
+            if (
+                len(self._outcomes) >= self.min_calls
+                and failures / len(self._outcomes) >= self.failure_ratio
+            ):
+                self._open()
+
+    def _open(self) -> None:
+        self.state = "open"
+        self.opened_at = time.time()
+        self._outcomes.clear()
+
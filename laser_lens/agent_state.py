@@ -6,6 +6,7 @@ from typing import Any, Dict, Optional
 
 from config import Config
 from error_logger import ErrorLogger
+from tracing import get_tracer
 
 
 class AgentState:
@@ -38,10 +39,11 @@ class AgentState:
     def save_state(self) -> None:
         """Writes the state dictionary to a JSON file (atomic write)."""
         try:
-            tmp_path = self.state_path + ".tmp"
-            with open(tmp_path, "w", encoding="utf-8") as f:
-                json.dump(self.state, f, indent=2)
-            os.replace(tmp_path, self.state_path)
+            with get_tracer().span("save_state", cat="state"):
+                tmp_path = self.state_path + ".tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(self.state, f, indent=2)
+                os.replace(tmp_path, self.state_path)
         except Exception as e:
             self.error_logger.log(
                 "ERROR", f"Failed to save agent state to {self.state_path}", e
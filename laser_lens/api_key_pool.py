@@ -0,0 +1,115 @@
+# api_key_pool.py
+
+import threading
+import time
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from config import Config
+from error_logger import ErrorLogger
+from rate_limiter import TokenBucketLimiter
+from utils import load_api_keys
+
+
+@dataclass
+class PooledKey:
+    """One API key with its own rate budget and quota cooldown."""
+
+    name: str
+    key: str
+    limiter: TokenBucketLimiter
+    cooldown_until: float = 0.0
+    strikes: int = 0
+    in_flight: int = 0
+
+    def healthy(self, now: float) -> bool:
+        return self.cooldown_until <= now
+
+
+class ApiKeyPool:
+    """
+    Spreads requests over several API keys.
+
+    :meth:`acquire` hands out the healthy key that can send soonest according
+    to its RPM/TPM buckets (ties go to the key with fewer requests in flight).
+    :meth:`mark_exhausted` puts a key on a cooldown that doubles with each
+    consecutive quota error, so a run keeps going on the remaining keys.
+    """
+
+    def __init__(
+        self,
+        config: Config,
+        keys: List[Tuple[str, str]],
+        rpm: int,
+        tpm: Optional[int] = None,
+        error_logger: Optional[ErrorLogger] = None,
+    ):
+        if not keys:
+            raise ValueError("ApiKeyPool needs at least one key")
+        self.config = config
+        self.error_logger = error_logger
+        self._lock = threading.Lock()
+        self._entries = [
+            PooledKey(name, key, TokenBucketLimiter(config, key, rpm, tpm, error_logger))
+            for name, key in keys
+        ]
+
+    @classmethod
+    def from_stored_keys(
+        cls,
+        config: Config,
+        rpm: int,
+        tpm: Optional[int] = None,
+        error_logger: Optional[ErrorLogger] = None,
+    ) -> "ApiKeyPool":
+        """Build a pool from the keys saved in ``~/.laser_lens_keys.json``."""
+        keys = [(k.get("name", ""), k.get("key", "")) for k in load_api_keys() if k.get("key")]
+        return cls(config, keys, rpm, tpm, error_logger)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def acquire(self, tokens: int = 0) -> Tuple[PooledKey, float]:
+        """
+        Reserve a request on the best key. Returns ``(key, wait_seconds)``;
+        if every key is cooling down the wait covers the earliest recovery.
+        """
+        with self._lock:
+            now = time.time()
+            healthy = [e for e in self._entries if e.healthy(now)]
+            if healthy:
+                entry = min(healthy, key=lambda e: (e.limiter.peek(tokens), e.in_flight))
+                cooldown = 0.0
+            else:
+                entry = min(self._entries, key=lambda e: e.cooldown_until)
+                cooldown = entry.cooldown_until - now
+            entry.in_flight += 1
+            wait = entry.limiter.reserve(tokens)
+            return entry, max(wait, cooldown)
+
+    def release(self, entry: PooledKey, success: bool = True) -> None:
+        """Mark a request on *entry* as finished; success clears its strikes."""
+        with self._lock:
+            entry.in_flight = max(0, entry.in_flight - 1)
+            if success:
+                entry.strikes = 0
+
+    def mark_exhausted(self, entry: PooledKey) -> None:
+        """Put *entry* on cooldown after a quota error."""
+        with self._lock:
+            entry.in_flight = max(0, entry.in_flight - 1)
+            cooldown = min(
+                self.config.key_cooldown_seconds * (2 ** entry.strikes),
+                self.config.key_cooldown_max_seconds,
+            )
+            entry.strikes += 1
+            entry.cooldown_until = time.time() + cooldown
+        if self.error_logger:
+            self.error_logger.log(
+                "WARNING", f"API key '{entry.name}' hit its quota; cooling down {cooldown:.0f}s"
+            )
+
+    def has_healthy_key(self) -> bool:
+        """Return True if at least one key is not cooling down."""
+        now = time.time()
+        return any(e.healthy(now) for e in self._entries)
@@ -1,6 +1,8 @@
 # cli_main.py
 
 import argparse
+import atexit
+import dataclasses
 import os
 import re
 import sys
@@ -12,7 +14,13 @@ from command_registration import register_core_commands
 from context_manager import ContextManager
 from output_manager import OutputManager
 from agent_state import AgentState
+from loop_memory import clear_memory
 from recursive_agent import RecursiveAgent
+from fleet import FleetRunner, build_jobs, load_topics
+from api_key_pool import ApiKeyPool
+from response_cache import ResponseCache
+from metrics import format_metrics
+from tracing import Tracer, set_tracer
 
 from utils import (
     suggest_filename,
@@ -60,7 +68,42 @@ def main():
     default_index = models_available.index(saved_model) if saved_model in models_available else 0
 
     parser = argparse.ArgumentParser(description="Run laser_lens recursive agent.")
-    parser.add_argument("--topic", type=str, required=True, help="Topic to analyze.")
+    parser.add_argument("--topic", type=str, help="Topic to analyze.")
+    parser.add_argument(
+        "--topics-file",
+        type=str,
+        help="Fleet mode: file with one topic per line, run concurrently."
+    )
+    parser.add_argument(
+        "--models",
+        nargs="+",
+        choices=models_available,
+        help="Fleet mode: run every topic with each of these models."
+    )
+    parser.add_argument(
+        "--temperatures",
+        nargs="+",
+        type=float,
+        help="Fleet mode: run every topic with each of these temperatures."
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=Config().default_fleet_workers,
+        help="Fleet mode: maximum number of concurrent runs."
+    )
+    parser.add_argument(
+        "--fleet-dir",
+        type=str,
+        default=Config().fleet_output_dir,
+        help="Fleet mode: directory receiving one sub-directory per run."
+    )
+    parser.add_argument(
+        "--context",
+        nargs="+",
+        default=[],
+        help="Context files (.md, .txt, .tmp) to upload before running."
+    )
     parser.add_argument(
         "--loops",
         type=int,
@@ -87,6 +130,37 @@ def main():
         default=Config().default_rpm,
         help="Requests per minute (rate limiting)."
     )
+    parser.add_argument(
+        "--tpm",
+        type=int,
+        default=Config().default_tpm,
+        help="Prompt tokens per minute (rate limiting, optional)."
+    )
+    parser.add_argument(
+        "--key-pool",
+        action="store_true",
+        help="Rotate across all saved API keys, switching keys on quota errors."
+    )
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="Replay identical model requests from the on-disk response cache."
+    )
+    parser.add_argument(
+        "--hedge",
+        action="store_true",
+        help="Send a duplicate request when the first chunk is unusually slow."
+    )
+    parser.add_argument(
+        "--metrics",
+        action="store_true",
+        help="Print per-loop latency and throughput metrics to stderr."
+    )
+    parser.add_argument(
+        "--trace",
+        metavar="OUT_JSON",
+        help="Record spans and write a Chrome trace file (open in Perfetto)."
+    )
     parser.add_argument("--thinking-mode",
         action="store_true",
         help="Enable chat-only reasoning mode without OS instructions.")
@@ -102,14 +176,24 @@ def main():
     )
 
     args = parser.parse_args()
+    if not args.topic and not args.topics_file:
+        parser.error("one of --topic or --topics-file is required")
 
     # Save the chosen model so next time it's the default
     save_pref_model(args.model)
 
+    if args.trace:
+        tracer = Tracer()
+        set_tracer(tracer)
+        # Written at exit so failed or interrupted runs are traced too
+        atexit.register(tracer.export, args.trace)
+
     # Initialize modules
     config = Config()
+    if args.hedge:
+        config = dataclasses.replace(config, hedge_requests=True)
     logger = ErrorLogger(config)
-    ce = CommandExecutor(logger)
+    ce = CommandExecutor(logger, workers=config.command_workers)
     register_core_commands(ce)
     try:
         from command_registration import register_plugin_commands
@@ -117,19 +201,46 @@ def main():
     except Exception:
         pass
     om = OutputManager(config, logger)
-    cm = ContextManager(config, logger, om)
+    cm = ContextManager(config, logger, om, model_name=args.model)
+    key_pool = None
+    if args.key_pool:
+        try:
+            key_pool = ApiKeyPool.from_stored_keys(config, args.rpm, args.tpm, logger)
+        except ValueError:
+            sys.stderr.write("[ERROR] --key-pool needs at least one saved API key.\n")
+            sys.exit(1)
+
+    response_cache = None
+    if args.cache:
+        response_cache = ResponseCache(
+            config.response_cache_dir, config.response_cache_max_bytes, logger
+        )
+
+    for path in args.context:
+        try:
+            cm.upload_file(path)
+        except Exception as e:
+            logger.log("WARNING", f"Could not load context file: {path}", e)
+
+    if args.topics_file:
+        print_context_savings(cm)
+        run_fleet(args, config, logger, ce, cm, key_pool, response_cache)
+        return
+
     as_state = AgentState(config, logger)
 
     # Handle resume from .tmp if provided
     if args.resume:
         try:
-            with open(args.resume, "rb") as f:
-                content = f.read()
-            cm.upload_context(args.resume, content)
+            cm.upload_file(args.resume, args.resume)
             if args.resume_current_loop:
                 as_state.update_state("current_loop", args.resume_current_loop)
         except Exception as e:
             logger.log("WARNING", f"Could not load resume file: {args.resume}", e)
+    else:
+        # Earlier runs' passages would be recalled under the new topic
+        clear_memory(as_state.state_dir, logger)
+    print_context_savings(cm)
 
     # Instantiate RecursiveAgent with the real Gemini client
     try:
@@ -148,6 +259,9 @@ def main():
             rpm=args.rpm,
             api_key=os.getenv("GOOGLE_API_KEY"),
             thinking_mode=args.thinking_mode,
+            tpm=args.tpm,
+            key_pool=key_pool,
+            response_cache=response_cache,
         )
     except Exception as e:
         sys.stderr.write(f"[ERROR] Failed to instantiate agent: {e}\n")
@@ -155,16 +269,20 @@ def main():
 
     # Stream the output with basic command rendering
     cmd_pattern = re.compile(r"\[\[COMMAND:\s*(?P<name>\w+)(?P<args>.*?)\]\]", re.DOTALL)
-    buffer = ""
     try:
         for event_type, loop_idx, total_loops, payload in agent.run():
             if event_type == "chunk":
-                buffer += payload
                 sys.stdout.write(payload)
                 sys.stdout.flush()
+            elif event_type == "retry":
+                message, _ = payload
+                sys.stderr.write(f"\n[Stream failed ({message}); retrying loop {loop_idx}]\n")
+            elif event_type == "metrics":
+                if args.metrics:
+                    sys.stderr.write(f"[metrics] {format_metrics(payload)}\n")
             elif event_type == "loop_end":
-                full_text = buffer
-                buffer = ""
+                # The payload is the final attempt's text, without retried chunks
+                full_text = payload
                 results = as_state.get_state("command_results") or []
                 pos = 0
                 r_idx = 0
@@ -212,10 +330,86 @@ def main():
             "output_file": saved_path,
         }
         om.save_session_metadata(session_meta)
+        print_cache_stats(response_cache)
     except Exception:
         sys.stderr.write("Failed to save final Markdown.\n")
         sys.exit(1)
 
 
+def print_cache_stats(response_cache) -> None:
+    """Print response cache hit/miss counters if caching was enabled."""
+    if response_cache is None:
+        return
+    stats = response_cache.stats()
+    print(f"Response cache: {stats['hits']} hits, {stats['misses']} misses")
+
+
+def print_context_savings(cm) -> None:
+    """Print how much the loaded context was compacted and deduplicated."""
+    compacted = {name: s for name, s in cm.compaction_stats.items() if s["tokens"]}
+    if compacted:
+        parts = ", ".join(f"{name} {s['tokens']}" for name, s in compacted.items())
+        total = sum(s["tokens"] for s in compacted.values())
+        print(f"Compacted context: {total} tokens saved ({parts})")
+    stats = cm.dedup_stats
+    if stats.get("tokens"):
+        print(
+            f"Deduplicated context: {stats['exact']} exact and {stats['near']} near-duplicate "
+            f"line(s), {stats['tokens']} tokens saved"
+        )
+
+
+def run_fleet(args, config, logger, ce, cm, key_pool=None, response_cache=None) -> None:
+    """Run every topic in ``args.topics_file`` concurrently and print a summary."""
+    try:
+        topics = load_topics(args.topics_file)
+    except Exception as e:
+        sys.stderr.write(f"[ERROR] Could not read topics file: {e}\n")
+        sys.exit(1)
+    jobs = build_jobs(
+        topics,
+        args.models or [args.model],
+        args.temperatures or [args.temperature],
+    )
+
+    def report(idx, job, event):
+        event_type, loop_idx, total_loops, payload = event
+        if event_type == "loop_end":
+            sys.stdout.write(f"[{idx}/{len(jobs)}] {job.topic}: loop {loop_idx} of {total_loops}\n")
+        elif event_type == "metrics" and args.metrics:
+            sys.stderr.write(
+                f"[{idx}/{len(jobs)}] {job.topic}: [metrics] {format_metrics(payload)}\n"
+            )
+        elif event_type == "error":
+            sys.stderr.write(f"[{idx}/{len(jobs)}] {job.topic}: [ERROR] {payload[0]}\n")
+        sys.stdout.flush()
+
+    runner = FleetRunner(
+        config,
+        logger,
+        ce,
+        cm,
+        loops=args.loops,
+        seed=args.seed,
+        rpm=args.rpm,
+        tpm=args.tpm,
+        api_key=os.getenv("GOOGLE_API_KEY"),
+        thinking_mode=args.thinking_mode,
+        workers=args.workers,
+        base_dir=args.fleet_dir,
+        key_pool=key_pool,
+        response_cache=response_cache,
+        on_event=report,
+    )
+    results = runner.run(jobs)
+    failed = [r for r in results if r["error"]]
+    print(f"\nFleet finished: {len(results) - len(failed)} succeeded, {len(failed)} failed.")
+    for r in failed:
+        print(f"  FAILED {r['topic']} ({r['model']}, t={r['temperature']}): {r['error']}")
+    print_cache_stats(response_cache)
+    if failed:
+        sys.exit(1)
+
+
 if __name__ == "__main__":
     main()
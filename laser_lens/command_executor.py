@@ -1,9 +1,26 @@
 # command_executor.py
 
+import contextvars
+import os
 import re
-from typing import Any, Callable, Dict, List, Tuple
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 from error_logger import ErrorLogger
+from tracing import get_tracer
+
+# Access modes used to decide which commands may run concurrently
+ACCESS_READ = "read"  # reads its filename (or all outputs if it has none)
+ACCESS_WRITE = "write"  # modifies its filename
+ACCESS_EXCLUSIVE = "exclusive"  # ordered against every other command
+
+# (index within the response, command name, handler seconds)
+CommandTiming = Tuple[int, str, float]
+
+
+def _path_key(fname: str) -> str:
+    return os.path.normcase(os.path.normpath(fname.strip()))
 
 
 class CommandExecutor:
@@ -13,52 +30,101 @@ class CommandExecutor:
 
     COMMAND_PATTERN = re.compile(r"\[\[COMMAND:\s*(?P<name>\w+)(?P<args>.*?)\]\]", re.DOTALL)
 
-    def __init__(self, error_logger: ErrorLogger):
+    def __init__(self, error_logger: ErrorLogger, workers: int = 1):
         self.error_logger = error_logger
+        # Worker threads per response; 1 keeps strictly sequential execution
+        self.workers = max(1, workers)
         # Map command name to handler: handler(args_dict) -> Any
         self._registry: Dict[str, Callable[[Dict[str, Any]], Any]] = {}
+        self._access: Dict[str, str] = {}
+        # Maps a filename argument to the file it touches; commands whose
+        # keys match are kept in order. Handlers that rewrite names (see
+        # handlers.file_key) must install the same mapping here.
+        self.file_key: Callable[[str], str] = _path_key
 
-    def register_command(self, name: str, handler: Callable[[Dict[str, Any]], Any]) -> None:
+    def register_command(
+        self,
+        name: str,
+        handler: Callable[[Dict[str, Any]], Any],
+        access: str = ACCESS_EXCLUSIVE,
+    ) -> None:
         """
-        Register a command handler by name (case-insensitive).
+        Register a command handler by name (case-insensitive). *access* is one
+        of ACCESS_READ, ACCESS_WRITE or ACCESS_EXCLUSIVE and controls whether
+        the command may overlap others when ``workers`` > 1.
         """
         self._registry[name.upper()] = handler
+        self._access[name.upper()] = access
+
+    def access_mode(self, name: str) -> str:
+        """Return the access mode registered for command *name*."""
+        return self._access.get(name.upper(), ACCESS_EXCLUSIVE)
 
-    def parse_and_execute(self, text: str) -> List[Tuple[str, Any]]:
+    def parse_and_execute(
+        self, text: str, timings: Optional[List[CommandTiming]] = None
+    ) -> List[Tuple[str, Any]]:
         """
         Scan 'text' for [[COMMAND: NAME key="val" ...]] patterns.
         For each, parse arguments, look up handler, execute, and collect (command_name, result).
+        If *timings* is given, (index, command_name, seconds) is appended for each command run.
         """
-        results: List[Tuple[str, Any]] = []
-        for idx, match in enumerate(self.COMMAND_PATTERN.finditer(text), start=1):
-            name = match.group("name").strip().upper()
-            raw_args = match.group("args").strip()
-            self.error_logger.log("DEBUG", f"cmd {idx}: {name} {raw_args}")
-            try:
-                args = self._parse_args(raw_args)
-            except ValueError as e:
-                self.error_logger.log(
-                    "WARNING", f"Failed to parse args for command {idx} {name}: {e}"
-                )
-                results.append((name, f"ERROR: {e}"))
-                continue
-
-            if name not in self._registry:
-                self.error_logger.log(
-                    "WARNING", f"Ignoring unregistered command: {name}"
-                )
-                continue
-
-            handler = self._registry[name]
+        matches = list(self.COMMAND_PATTERN.finditer(text))
+        if self.workers > 1 and len(matches) > 1:
+            scheduler = CommandScheduler(self)
             try:
-                result = handler(args)
-                results.append((name, result))
-            except Exception as e:
-                self.error_logger.log(
-                    "ERROR", f"Command {idx} {name} failed", e
-                )
-                results.append((name, f"ERROR: {e}"))
-        return results
+                futures = [
+                    scheduler.submit(idx, m, timings) for idx, m in enumerate(matches, start=1)
+                ]
+                outcomes = [f.result() for f in futures]
+            finally:
+                scheduler.close()
+        else:
+            outcomes = [
+                self.execute_match(idx, m, timings) for idx, m in enumerate(matches, start=1)
+            ]
+        return [r for r in outcomes if r is not None]
+
+    def execute_match(
+        self,
+        idx: int,
+        match: "re.Match[str]",
+        timings: Optional[List[CommandTiming]] = None,
+    ) -> Optional[Tuple[str, Any]]:
+        """
+        Execute one COMMAND_PATTERN match. Returns (command_name, result), or
+        None when the command is not registered. The handler's run time is
+        appended to *timings* when given.
+        """
+        name = match.group("name").strip().upper()
+        raw_args = match.group("args").strip()
+        self.error_logger.log("DEBUG", f"cmd {idx}: {name} {raw_args}")
+        try:
+            args = self._parse_args(raw_args)
+        except ValueError as e:
+            self.error_logger.log(
+                "WARNING", f"Failed to parse args for command {idx} {name}: {e}"
+            )
+            return (name, f"ERROR: {e}")
+
+        if name not in self._registry:
+            self.error_logger.log(
+                "WARNING", f"Ignoring unregistered command: {name}"
+            )
+            return None
+
+        handler = self._registry[name]
+        start = time.perf_counter()
+        try:
+            with get_tracer().span(name, cat="command", idx=idx):
+                return (name, handler(args))
+        except Exception as e:
+            self.error_logger.log(
+                "ERROR", f"Command {idx} {name} failed", e
+            )
+            return (name, f"ERROR: {e}")
+        finally:
+            if timings is not None:
+                timings.append((idx, name, time.perf_counter() - start))
 
     def _parse_args(self, raw: str) -> Dict[str, Any]:
         """
@@ -81,3 +147,78 @@ class CommandExecutor:
             token = leftover.split()[0]
             raise ValueError(f"Invalid argument {token}")
         return args
+
+
+class CommandScheduler:
+    """
+    Runs the commands of one response on a pool of ``executor.workers``
+    threads.
+
+    Each submitted command waits only for earlier commands it conflicts
+    with: two reads never conflict, a write conflicts with any command on
+    the same filename (or without one), and exclusive commands such as
+    ``EXEC`` or ``CANCEL`` are ordered against everything. Commands are
+    queued in submission order, so a waiting command's dependencies have
+    always been picked up by a worker already.
+    """
+
+    def __init__(self, executor: CommandExecutor):
+        self.executor = executor
+        self._pool = ThreadPoolExecutor(
+            max_workers=executor.workers, thread_name_prefix="laser-cmd"
+        )
+        self._submitted: List[Tuple[str, Optional[str], Future]] = []
+
+    def submit(
+        self,
+        idx: int,
+        match: "re.Match[str]",
+        timings: Optional[List[CommandTiming]] = None,
+    ) -> Future:
+        """Schedule one COMMAND_PATTERN match; the future yields execute_match's result."""
+        access, target = self._classify(match)
+        deps = [
+            fut
+            for prev_access, prev_target, fut in self._submitted
+            if self._conflicts(prev_access, prev_target, access, target)
+        ]
+
+        def run() -> Optional[Tuple[str, Any]]:
+            for dep in deps:
+                dep.exception()  # wait; failures are already reported as results
+            return self.executor.execute_match(idx, match, timings)
+
+        # Run in the submitter's context so per-run state such as the
+        # handlers' workspace follows the command onto the worker thread.
+        future = self._pool.submit(contextvars.copy_context().run, run)
+        if access is not None:
+            self._submitted.append((access, target, future))
+        return future
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=True)
+
+    def _classify(self, match: "re.Match[str]") -> Tuple[Optional[str], Optional[str]]:
+        """Return (access, filename key); access is None for commands that do nothing."""
+        name = match.group("name").strip().upper()
+        if name not in self.executor._registry:
+            return None, None
+        try:
+            args = self.executor._parse_args(match.group("args").strip())
+        except ValueError:
+            return None, None
+        fname = args.get("filename")
+        target = self.executor.file_key(fname) if fname else None
+        return self.executor.access_mode(name), target
+
+    @staticmethod
+    def _conflicts(
+        a_access: str, a_target: Optional[str], b_access: Optional[str], b_target: Optional[str]
+    ) -> bool:
+        if b_access is None:
+            return False
+        if ACCESS_EXCLUSIVE in (a_access, b_access):
+            return True
+        if a_access == ACCESS_READ and b_access == ACCESS_READ:
+            return False
+        return a_target is None or b_target is None or a_target == b_target
@@ -1,4 +1,4 @@
-from command_executor import CommandExecutor
+from command_executor import ACCESS_READ, ACCESS_WRITE, CommandExecutor
 from handlers import (
     WRITE_FILE,
     APPEND_FILE,
@@ -12,6 +12,7 @@ from handlers import (
     HELP,
     CANCEL,
     PAUSE,
+    file_key,
 )
 
 try:
@@ -22,16 +23,18 @@ except ImportError:  # pragma: no cover
 
 def register_core_commands(ce: CommandExecutor) -> None:
     """Register built-in handlers and their aliases."""
-    ce.register_command("WRITE_FILE", WRITE_FILE)
-    ce.register_command("APPEND_FILE", APPEND_FILE)
-    ce.register_command("READ_FILE", READ_FILE)
-    ce.register_command("READ_LINES", READ_LINES)
-    ce.register_command("LIST_OUTPUTS", LIST_OUTPUTS)
-    ce.register_command("DELETE_FILE", DELETE_FILE)
+    # Order file commands by the sanitized name the handlers actually open
+    ce.file_key = file_key
+    ce.register_command("WRITE_FILE", WRITE_FILE, access=ACCESS_WRITE)
+    ce.register_command("APPEND_FILE", APPEND_FILE, access=ACCESS_WRITE)
+    ce.register_command("READ_FILE", READ_FILE, access=ACCESS_READ)
+    ce.register_command("READ_LINES", READ_LINES, access=ACCESS_READ)
+    ce.register_command("LIST_OUTPUTS", LIST_OUTPUTS, access=ACCESS_READ)
+    ce.register_command("DELETE_FILE", DELETE_FILE, access=ACCESS_WRITE)
     ce.register_command("EXEC", EXEC)
     ce.register_command("RUN_PYTHON", RUN_PYTHON)
-    ce.register_command("WORD_COUNT", WORD_COUNT)
-    ce.register_command("HELP", HELP)
+    ce.register_command("WORD_COUNT", WORD_COUNT, access=ACCESS_READ)
+    ce.register_command("HELP", HELP, access=ACCESS_READ)
     ce.register_command("CANCEL", CANCEL)
     ce.register_command("PAUSE", PAUSE)
 
@@ -42,7 +45,7 @@ def register_core_commands(ce: CommandExecutor) -> None:
         "WC": "WORD_COUNT",
         "RL": "READ_LINES",
     }.items():
-        ce.register_command(alias, ce._registry[target])
+        ce.register_command(alias, ce._registry[target], access=ce.access_mode(target))
 
 
 def register_plugin_commands(ce: CommandExecutor) -> None:
@@ -0,0 +1,252 @@
+# compaction.py
+
+"""
+Token-reducing compaction of uploaded context.
+
+Text flows line by line through a chain of generator stages, so a stage only
+holds the few lines it needs (a table's kept rows, a code fence's tail).
+Every stage is metered, and the characters and tokens it removed are added
+to :attr:`CompactionPipeline.stats`.
+
+Stages (names used in ``Config.compaction_stages``):
+
+- ``whitespace``: strip trailing whitespace, squeeze runs of spaces inside
+  prose lines, and keep at most one blank line in a row
+- ``data_uris``: replace base64 ``data:`` URIs and bare base64 lines with a
+  short placeholder
+- ``repeated_lines``: collapse runs of identical lines
+- ``tables``: keep the header, the first rows and the last row of long
+  Markdown tables
+- ``code_fences``: keep the head and tail of long fenced code blocks
+"""
+
+import re
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Iterator, Optional, Sequence
+
+from config import Config
+from utils import count_tokens
+
+_FENCE_RE = re.compile(r"^\s*(```|~~~)")
+_INNER_SPACES_RE = re.compile(r"(?<=\S) {2,}")
+_DATA_URI_RE = re.compile(r"data:([\w.+-]+/[\w.+-]+);base64,[A-Za-z0-9+/=]{64,}")
+_BASE64_LINE_RE = re.compile(r"^[A-Za-z0-9+/]{200,}={0,2}$")
+
+Stage = Callable[[Iterator[str]], Iterator[str]]
+
+
+@dataclass
+class StageStats:
+    """Characters and tokens removed by one stage."""
+
+    chars: int = 0
+    tokens: int = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return {"chars": self.chars, "tokens": self.tokens}
+
+
+def _is_fence(line: str) -> bool:
+    return bool(_FENCE_RE.match(line))
+
+
+def whitespace(lines: Iterator[str]) -> Iterator[str]:
+    in_fence = False
+    blank_run = 0
+    for line in lines:
+        if _is_fence(line):
+            in_fence = not in_fence
+        line = line.rstrip()
+        if not line:
+            blank_run += 1
+            if blank_run > 1:
+                continue
+        else:
+            blank_run = 0
+            if not in_fence:
+                indent = len(line) - len(line.lstrip())
+                line = line[:indent] + _INNER_SPACES_RE.sub(" ", line[indent:])
+        yield line
+
+
+def data_uris(lines: Iterator[str]) -> Iterator[str]:
+    for line in lines:
+        if "base64," in line:
+            line = _DATA_URI_RE.sub(
+                lambda m: f"data:{m.group(1)};base64,[{len(m.group(0))} chars omitted]", line
+            )
+        stripped = line.strip()
+        if (
+            _BASE64_LINE_RE.match(stripped)
+            and any(c.isdigit() for c in stripped)
+            and stripped.lower() != stripped
+            and stripped.upper() != stripped
+        ):
+            indent = line[: len(line) - len(line.lstrip())]
+            line = f"{indent}[base64 blob, {len(stripped)} chars omitted]"
+        yield line
+
+
+def repeated_lines(lines: Iterator[str], min_run: int = 3) -> Iterator[str]:
+    previous: Optional[str] = None
+    run = 0
+
+    def flush() -> Iterator[str]:
+        if previous is None:
+            return
+        if run >= min_run:
+            yield previous
+            yield f"[previous line repeated {run - 1} more times]"
+        else:
+            for _ in range(run):
+                yield previous
+
+    for line in lines:
+        if line == previous and line.strip():
+            run += 1
+            continue
+        yield from flush()
+        previous, run = line, 1
+    yield from flush()
+
+
+def tables(lines: Iterator[str], max_rows: int = 20) -> Iterator[str]:
+    head_rows = max(1, max_rows - 1)
+    table: list = []  # header, separator and the first rows
+    omitted = 0
+    last: Optional[str] = None
+
+    def flush() -> Iterator[str]:
+        yield from table
+        if omitted:
+            columns = max(1, table[0].strip().strip("|").count("|") + 1)
+            yield f"| ... {omitted} more rows omitted ({columns} columns) ... |"
+        if last is not None:
+            yield last
+
+    for line in lines:
+        if line.lstrip().startswith("|"):
+            if len(table) < head_rows + 2:
+                table.append(line)
+            else:
+                if last is not None:
+                    omitted += 1
+                last = line
+            continue
+        if table:
+            yield from flush()
+            table, omitted, last = [], 0, None
+        yield line
+    if table:
+        yield from flush()
+
+
+def code_fences(lines: Iterator[str], max_lines: int = 80) -> Iterator[str]:
+    head = max_lines // 2
+    body: list = []
+    tail: deque = deque(maxlen=max_lines - head)
+    omitted = 0
+    in_fence = False
+    for line in lines:
+        if not in_fence:
+            if _is_fence(line):
+                in_fence = True
+                body, omitted = [], 0
+                tail.clear()
+            yield line
+            continue
+        if _is_fence(line):
+            yield from body
+            if omitted:
+                yield f"[... {omitted} lines omitted ...]"
+            yield from tail
+            yield line
+            in_fence = False
+            continue
+        if len(body) < head:
+            body.append(line)
+        else:
+            if len(tail) == tail.maxlen:
+                omitted += 1
+            tail.append(line)
+    if in_fence:
+        # Unclosed fence: emit what was kept
+        yield from body
+        if omitted:
+            yield f"[... {omitted} lines omitted ...]"
+        yield from tail
+
+
+class CompactionPipeline:
+    """
+    Runs the configured stages over text and keeps per-stage savings.
+    Stage order matters: whitespace first lets later stages compare
+    normalized lines.
+    """
+
+    def __init__(
+        self,
+        stages: Sequence[str],
+        table_rows: int = 20,
+        fence_lines: int = 80,
+        model: Optional[str] = None,
+    ):
+        available: Dict[str, Stage] = {
+            "whitespace": whitespace,
+            "data_uris": data_uris,
+            "repeated_lines": repeated_lines,
+            "tables": lambda it: tables(it, table_rows),
+            "code_fences": lambda it: code_fences(it, fence_lines),
+        }
+        unknown = [name for name in stages if name not in available]
+        if unknown:
+            raise ValueError(f"unknown compaction stage(s): {', '.join(unknown)}")
+        self.stages = [(name, available[name]) for name in stages]
+        self.model = model
+        self.stats: Dict[str, StageStats] = {name: StageStats() for name in stages}
+
+    @classmethod
+    def from_config(cls, config: Config, model: Optional[str] = None) -> "CompactionPipeline":
+        return cls(
+            config.compaction_stages,
+            config.compaction_table_rows,
+            config.compaction_fence_lines,
+            model,
+        )
+
+    def _meter(self, lines: Iterable[str], sizes: list, cache: Dict[str, int]) -> Iterator[str]:
+        # sizes = [chars, tokens] seen at this point of the chain; most lines
+        # pass through every stage unchanged, so their counts come from cache
+        for line in lines:
+            tokens = cache.get(line)
+            if tokens is None:
+                tokens = cache[line] = count_tokens(line, self.model)
+            sizes[0] += len(line) + 1
+            sizes[1] += tokens
+            yield line
+
+    def run_lines(self, lines: Iterable[str]) -> Iterator[str]:
+        """Compact a stream of lines (without line endings)."""
+        meters = [[0, 0] for _ in range(len(self.stages) + 1)]
+        cache: Dict[str, int] = {}
+        stream = self._meter(lines, meters[0], cache)
+        for i, (_, stage) in enumerate(self.stages):
+            stream = self._meter(stage(stream), meters[i + 1], cache)
+        for line in stream:
+            yield line
+            if len(cache) > 4096:
+                cache.clear()
+        for i, (name, _) in enumerate(self.stages):
+            stats = self.stats[name]
+            stats.chars += meters[i][0] - meters[i + 1][0]
+            stats.tokens += meters[i][1] - meters[i + 1][1]
+
+    def run(self, text: str) -> str:
+        if not self.stages:
+            return text
+        return "\n".join(self.run_lines(text.split("\n")))
+
+    def saved(self) -> Dict[str, Dict[str, int]]:
+        """Per-stage ``{"chars": n, "tokens": n}`` removed so far."""
+        return {name: stats.as_dict() for name, stats in self.stats.items()}
@@ -10,25 +10,108 @@ class Config:
     default_temperature: float = 0.7
     default_seed: Optional[int] = None
     default_rpm: int = 20  # requests per minute for rate limiting
+    default_tpm: Optional[int] = None  # prompt tokens per minute; None disables the budget
+    rate_limit_burst: int = 3  # requests that may be sent back-to-back
+    rate_limit_dir: str = "~/.laser_lens_logs/ratelimit/"  # shared across processes
+    key_cooldown_seconds: float = 60.0  # first cooldown after a key hits its quota
+    key_cooldown_max_seconds: float = 900.0  # cap for repeated cooldowns
 
     # Recursive parameters
     default_loops: int = 3
     default_prompt_delim: str = "###"  # delimiter for parsing .tmp streams
     default_thinking_mode: bool = False  # chat-only prompt style
+    stream_commands: bool = True  # run [[COMMAND:]] blocks as soon as they close
+    command_workers: int = 4  # threads per response; conflicting commands stay ordered
 
-    # Context parameters
-    max_context_tokens: int = 100000  # maximum tokens/characters allowed in combined context
+    # Prompt / context parameters
+    use_system_instruction: bool = True  # send static instructions as system_instruction
+    prompt_budget_enabled: bool = True  # size prompt sections from the model's input limit
+    default_input_token_limit: int = 32768  # used when the model's limit cannot be looked up
+    prompt_budget_fraction: float = 0.9  # share of the input limit the prompt may use
+    budget_weights: Tuple[Tuple[str, float], ...] = (
+        ("context", 4.0),
+        ("last_thought", 2.0),
+        ("history", 1.0),
+        ("tools", 2.0),
+        ("memory", 2.0),
+    )
+    budget_minimums: Tuple[Tuple[str, int], ...] = (
+        ("context", 1000),
+        ("last_thought", 500),
+        ("history", 200),
+        ("tools", 500),
+        ("memory", 500),
+    )
+
+    # Long-term loop memory: BM25 retrieval over all earlier loop responses
+    loop_memory_enabled: bool = True
+    memory_chunk_chars: int = 800  # passage size when indexing a response
+    memory_top_k: int = 5  # passages recalled per loop
+    memory_budget_tokens: int = 2000  # recall budget when the planner is off
+    max_context_tokens: int = 100000  # maximum tokens allowed in combined context
+    spill_threshold_bytes: int = 1024 * 1024  # larger text uploads are memory-mapped from disk
+    # Over-budget context is cut to the chunks most relevant to the topic and
+    # last thought (TF-IDF, needs numpy) instead of its head and tail
+    context_relevance_enabled: bool = True
+    context_chunk_chars: int = 1200
+    # Compaction stages run over each upload, in order (empty disables). The
+    # lossy "tables" and "code_fences" stages drop rows/lines and are opt-in.
+    compaction_stages: Tuple[str, ...] = ("whitespace", "data_uris", "repeated_lines")
+    compaction_table_rows: int = 20  # rows kept from a long Markdown table
+    compaction_fence_lines: int = 80  # lines kept from a long code block
+    # CSV/TSV/Parquet uploads are stored as a summary instead of raw rows
+    tabular_chunk_rows: int = 100000  # rows read per chunk
+    tabular_sample_rows: int = 20  # rows shown in the summary's sample
+    tabular_top_values: int = 5  # most common values listed per column
+    # Exact and MinHash near-duplicate lines are dropped from new uploads
+    dedup_enabled: bool = True
+    dedup_threshold: float = 0.8  # estimated Jaccard similarity of word shingles
 
     # Output directories
     safe_output_dir: str = "./outputs/"
     ui_autosave_dir: str = "~/.laser_lens_logs/"
 
+    # Response cache (opt-in)
+    response_cache_enabled: bool = False
+    response_cache_dir: str = "~/.laser_lens_cache/"
+    response_cache_max_bytes: int = 256 * 1024 * 1024  # LRU eviction beyond this
+
+    # Hedged requests (opt-in): duplicate a request whose first chunk is late
+    hedge_requests: bool = False
+    hedge_percentile: float = 0.95  # of recent time-to-first-token samples
+    hedge_min_samples: int = 5  # samples needed before hedging starts
+    hedge_window: int = 50  # recent samples kept per model
+
     # Agent state
     agent_state_dir: str = "./agent_state/"
 
+    # Streaming tmp file (crash recovery), written by a background thread
+    tmp_durability: str = "flush"  # "none", "flush" or "fsync" per batch
+    tmp_flush_interval_ms: float = 100.0  # max time a chunk waits in the batch
+    tmp_batch_bytes: int = 64 * 1024  # write early once this much is pending
+
+    # Fleet mode (many topics per process)
+    default_fleet_workers: int = 4  # concurrent agent runs
+    fleet_output_dir: str = "./fleet_runs/"  # one sub-directory per run
+
     # Retry/Circuit-Breaker
     max_retries: int = 3
     backoff_base_seconds: float = 2.0  # for exponential backoff
+    backoff_max_seconds: float = 60.0  # cap for a single retry wait
+    overload_backoff_seconds: float = 10.0  # minimum backoff after 429/503
+    breaker_window: int = 20  # recent attempts considered
+    breaker_min_calls: int = 5  # attempts needed before the breaker can open
+    breaker_failure_ratio: float = 0.5  # open at this share of failures
+    breaker_cooldown_seconds: float = 30.0  # fail fast this long once open
+
+    # Adaptive (AIMD) request rate
+    aimd_increase_rpm: float = 1.0  # added per successful request
+    aimd_decrease_factor: float = 0.5  # multiplier per overload response
+    aimd_min_rpm: float = 1.0
+
+    # Stream watchdog: abort and retry a stalled stream (None disables)
+    stream_idle_timeout_seconds: Optional[float] = 120.0  # max gap between chunks
+    stream_deadline_seconds: Optional[float] = 900.0  # max duration of one stream
 
     # Logging
     error_log_file: str = "~/.laser_lens_logs/errors.log"
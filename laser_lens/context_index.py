@@ -0,0 +1,337 @@
+# context_index.py
+
+"""
+Relevance-ranked selection of uploaded context.
+
+When the uploaded context is larger than its prompt budget, the files are
+split into chunks and indexed with TF-IDF. Each loop scores every chunk
+against the topic and last thought with a few NumPy operations and fills the
+budget with the best chunks, kept in document order, so the middle of a long
+document can reach the prompt instead of only its head and tail.
+
+NumPy is optional: without it :func:`available` returns False and callers fall
+back to head/tail truncation.
+"""
+
+import re
+from array import array
+from collections import Counter
+from dataclasses import dataclass
+from functools import partial
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+from loop_memory import tokenize
+from spill_buffer import SpilledText
+from utils import count_tokens
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - exercised only without numpy
+    np = None
+
+# Placed between chunks that were not adjacent in the source file
+GAP_MARKER = "\n[...]\n"
+
+_PARAGRAPH = re.compile(r"\S(?:.*?\S)??(?=\n[^\S\n]*\n|\s*\Z)", re.S)
+
+
+def available() -> bool:
+    """Return True if NumPy is installed and relevance selection can be used."""
+    return np is not None
+
+
+def chunk_spans(text: str, max_chars: int) -> Iterator[Tuple[int, int]]:
+    """
+    Yield ``(start, end)`` spans of *text* of at most *max_chars*, grouping
+    whole paragraphs where possible and hard-splitting longer ones. Like
+    :func:`loop_memory.chunk_text`, but the spans point into *text*.
+    """
+    current: Optional[Tuple[int, int]] = None
+    for match in _PARAGRAPH.finditer(text):
+        start, end = match.span()
+        while end - start > max_chars:
+            if current:
+                yield current
+                current = None
+            yield start, start + max_chars
+            start += max_chars
+            # Keep the rest of the paragraph free of leading whitespace
+            while start < end and text[start].isspace():
+                start += 1
+        if start == end:
+            continue
+        if current and end - current[0] > max_chars:
+            yield current
+            current = None
+        current = (current[0], end) if current else (start, end)
+    if current:
+        yield current
+
+
+@dataclass(frozen=True)
+class SourceChunks:
+    """
+    Chunk offsets and term counts of one source, without the chunk text.
+    Term ids are local to the source; :class:`ContextIndex` maps them to its
+    own vocabulary, so one scan can serve several indexes.
+    """
+
+    starts: "np.ndarray"  # offsets of each chunk in the source
+    ends: "np.ndarray"
+    tokens: "np.ndarray"
+    terms: List[str]
+    rows: "np.ndarray"  # (chunk, term, count) postings
+    cols: "np.ndarray"
+    tfs: "np.ndarray"
+
+
+def _scan(pieces: Iterable[Tuple[int, int, str]], model: Optional[str]) -> SourceChunks:
+    # Typed arrays keep the scan at a few bytes per chunk and posting
+    starts, ends, tokens = array("q"), array("q"), array("q")
+    rows, cols, tfs = array("i"), array("i"), array("i")
+    vocab: Dict[str, int] = {}
+    for start, end, piece in pieces:
+        row = len(starts)
+        starts.append(start)
+        ends.append(end)
+        tokens.append(count_tokens(piece, model))
+        for term, tf in Counter(tokenize(piece)).items():
+            rows.append(row)
+            cols.append(vocab.setdefault(term, len(vocab)))
+            tfs.append(tf)
+    offsets = partial(np.frombuffer, dtype=np.int64)
+    postings = partial(np.frombuffer, dtype=np.int32)
+    return SourceChunks(
+        offsets(starts),
+        offsets(ends),
+        offsets(tokens),
+        list(vocab),
+        postings(rows),
+        postings(cols),
+        postings(tfs),
+    )
+
+
+class TextSource:
+    """A source held in memory; spans are character offsets."""
+
+    def __init__(self, text: str):
+        self.text = text
+
+    def scan(self, chunk_chars: int, model: Optional[str] = None) -> SourceChunks:
+        text = self.text
+        return _scan(
+            ((s, e, text[s:e]) for s, e in chunk_spans(text, chunk_chars)), model
+        )
+
+    def read(self, spans: Sequence[Tuple[int, int]]) -> List[str]:
+        return [self.text[s:e] for s, e in spans]
+
+
+class FileSource:
+    """
+    A UTF-8 source on disk; spans are byte offsets. The file is scanned one
+    memory-mapped window at a time and only the chunks that are read back are
+    decoded. Scans are cached, so managers sharing a source scan it once.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._scans: Dict[Tuple[int, Optional[str]], SourceChunks] = {}
+
+    def _pieces(self, view: SpilledText, chunk_chars: int) -> Iterator[Tuple[int, int, str]]:
+        for offset, window in view.windows():
+            pos = 0
+            for start, end in chunk_spans(window, chunk_chars):
+                # Advance the byte offset incrementally, one span at a time
+                offset += len(window[pos:start].encode("utf-8", "surrogateescape"))
+                raw = window[start:end].encode("utf-8", "surrogateescape")
+                # Index the text as read() will return it
+                yield offset, offset + len(raw), raw.decode("utf-8", errors="ignore")
+                offset += len(raw)
+                pos = end
+
+    def scan(self, chunk_chars: int, model: Optional[str] = None) -> SourceChunks:
+        key = (chunk_chars, model)
+        cached = self._scans.get(key)
+        if cached is None:
+            with SpilledText(self.path) as view:
+                cached = _scan(self._pieces(view, chunk_chars), model)
+            cached = self._scans.setdefault(key, cached)
+        return cached
+
+    def read(self, spans: Sequence[Tuple[int, int]]) -> List[str]:
+        with SpilledText(self.path) as view:
+            return [view.slice(s, e) for s, e in spans]
+
+
+Source = Union[str, TextSource, FileSource]
+
+
+@dataclass(frozen=True)
+class Chunk:
+    source: int  # index of the file in upload order
+    position: int  # index of the chunk within its file
+    start: int  # offsets of the chunk in its source
+    end: int
+    tokens: int
+
+
+class ContextIndex:
+    """
+    TF-IDF index over the chunks of a list of ``(file_name, source)`` pairs,
+    where a source is a string, a :class:`TextSource` or a
+    :class:`FileSource`. Chunks are stored as offsets and read back from their
+    source only when selected. Term weights are stored per term (column-major)
+    so scoring a query only touches the postings of its own terms.
+    """
+
+    def __init__(
+        self,
+        sources: Iterable[Tuple[str, Source]],
+        delim: str,
+        chunk_chars: int = 1200,
+        model: Optional[str] = None,
+    ):
+        if np is None:
+            raise RuntimeError("numpy is required for ContextIndex")
+        self.delim = delim
+        self.model = model
+        self.names: List[str] = []
+        self.sources: List[Union[TextSource, FileSource]] = []
+        self._vocab: Dict[str, int] = {}
+        # Chunk columns (source, position, offsets, tokens) and postings
+        parts: Dict[str, List["np.ndarray"]] = {
+            key: [] for key in ("source", "position", "start", "end", "tokens", "row", "col", "tf")
+        }
+        n = 0
+        for index, (name, source) in enumerate(sources):
+            if isinstance(source, str):
+                source = TextSource(source)
+            self.names.append(name)
+            self.sources.append(source)
+            scanned = source.scan(chunk_chars, model)
+            count = len(scanned.starts)
+            term_ids = np.asarray(
+                [self._vocab.setdefault(t, len(self._vocab)) for t in scanned.terms],
+                dtype=np.int64,
+            )
+            parts["source"].append(np.full(count, index, dtype=np.int64))
+            parts["position"].append(np.arange(count, dtype=np.int64))
+            parts["start"].append(scanned.starts)
+            parts["end"].append(scanned.ends)
+            parts["tokens"].append(scanned.tokens)
+            parts["row"].append(scanned.rows.astype(np.int64) + n)
+            parts["col"].append(term_ids[scanned.cols])
+            parts["tf"].append(scanned.tfs)
+            n += count
+        columns = {
+            key: np.concatenate(arrays) if arrays else np.zeros(0, dtype=np.int64)
+            for key, arrays in parts.items()
+        }
+        self._source = columns["source"]
+        self._position = columns["position"]
+        self._start = columns["start"]
+        self._end = columns["end"]
+        self._tokens = columns["tokens"]
+        row_arr, col_arr, tf_arr = columns["row"], columns["col"], columns["tf"]
+        vocab_size = len(self._vocab)
+        df = np.bincount(col_arr, minlength=vocab_size)
+        self._idf = np.log((1.0 + n) / (1.0 + df)) + 1.0
+        weights = (1.0 + np.log(tf_arr.astype(np.float64))) * self._idf[col_arr]
+        norms = np.sqrt(np.bincount(row_arr, weights=weights * weights, minlength=n))
+        weights /= np.where(norms > 0, norms, 1.0)[row_arr]
+
+        order = np.argsort(col_arr, kind="stable")
+        self._rows = row_arr[order]
+        self._weights = weights[order]
+        self._col_ptr = np.concatenate(([0], np.cumsum(df)))
+
+    def __len__(self) -> int:
+        return len(self._tokens)
+
+    def chunk(self, idx: int) -> Chunk:
+        """Position and offsets of chunk *idx*, without its text."""
+        return Chunk(
+            int(self._source[idx]),
+            int(self._position[idx]),
+            int(self._start[idx]),
+            int(self._end[idx]),
+            int(self._tokens[idx]),
+        )
+
+    def scores(self, query: str) -> "np.ndarray":
+        """Cosine similarity of every chunk to *query*."""
+        n = len(self)
+        terms = [
+            (self._vocab[t], tf) for t, tf in Counter(tokenize(query)).items() if t in self._vocab
+        ]
+        if not terms or not n:
+            return np.zeros(n)
+        q_cols = np.asarray([c for c, _ in terms], dtype=np.int64)
+        q_weights = (1.0 + np.log([tf for _, tf in terms])) * self._idf[q_cols]
+        q_weights /= np.linalg.norm(q_weights)
+        starts = self._col_ptr[q_cols]
+        ends = self._col_ptr[q_cols + 1]
+        ids = np.concatenate([self._rows[s:e] for s, e in zip(starts, ends)])
+        vals = np.concatenate(
+            [self._weights[s:e] * w for s, e, w in zip(starts, ends, q_weights)]
+        )
+        return np.bincount(ids, weights=vals, minlength=n)
+
+    def select(self, query: str, budget: int) -> str:
+        """
+        Return the chunks most similar to *query* that fit in *budget* tokens,
+        grouped under their file headers in document order.
+        """
+        scores = self.scores(query)
+        # Ties (including no overlap at all) keep document order
+        order = np.argsort(-scores, kind="stable")
+        header_cost = [count_tokens(self._header(name), self.model) for name in self.names]
+        gap_cost = count_tokens(GAP_MARKER, self.model)
+        used = 0
+        picked: List[int] = []
+        opened = set()
+        sources = self._source.tolist()
+        tokens = self._tokens.tolist()
+        for idx in order.tolist():
+            source = sources[idx]
+            cost = tokens[idx] + gap_cost
+            if source not in opened:
+                cost += header_cost[source]
+            if used + cost > budget:
+                continue
+            picked.append(idx)
+            opened.add(source)
+            used += cost
+        return self._render(sorted(picked))
+
+    def _header(self, name: str) -> str:
+        return f"{self.delim} Context from: {name} {self.delim}"
+
+    def _render(self, picked: List[int]) -> str:
+        # Read the picked chunks back, one pass per source
+        chunks = [self.chunk(idx) for idx in picked]
+        by_source: Dict[int, List[Chunk]] = {}
+        for chunk in chunks:
+            by_source.setdefault(chunk.source, []).append(chunk)
+        texts: Dict[Tuple[int, int], str] = {}
+        for source, group in by_source.items():
+            spans = [(chunk.start, chunk.end) for chunk in group]
+            for chunk, text in zip(group, self.sources[source].read(spans)):
+                texts[source, chunk.position] = text
+
+        parts: List[str] = []
+        previous: Optional[Chunk] = None
+        for chunk in chunks:
+            if previous is None or previous.source != chunk.source:
+                parts.append("\n\n" + self._header(self.names[chunk.source]) + "\n\n")
+                if chunk.position > 0:
+                    parts.append(GAP_MARKER.lstrip("\n"))
+            elif chunk.position != previous.position + 1:
+                parts.append(GAP_MARKER)
+            else:
+                parts.append("\n\n")
+            parts.append(texts[chunk.source, chunk.position])
+            previous = chunk
+        return "".join(parts).strip()
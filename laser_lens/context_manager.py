@@ -1,15 +1,45 @@
 # context_manager.py
 
-from typing import List, Tuple, Optional
+from collections import deque
+from dataclasses import dataclass, replace
+from typing import Deque, Iterable, List, Tuple, Optional
+import io
+import os
+import tempfile
 import time
 
 from output_manager import OutputManager
+from spill_buffer import WINDOW_BYTES_PER_TOKEN, SpilledText, spill
+from dedup import Deduplicator
+from compaction import CompactionPipeline
+from tabular import is_tabular, summarize_table
+from context_index import FileSource, Source, TextSource, available as context_index_available
 
 from config import Config
-from utils import count_tokens, parse_tmp
+from utils import count_tokens, iter_tmp_chunks, parse_tmp
 from error_logger import ErrorLogger
 
 
+@dataclass
+class _Original:
+    """Untruncated copy of an upload whose stored buffer was cut to head and tail."""
+
+    tokens: int  # including the buffer header
+    source: FileSource  # the text on disk, shared (with its index) by copies
+    owned: bool = False  # the file is temporary and removed with the buffer
+
+    @property
+    def path(self) -> str:
+        return self.source.path
+
+    def discard(self) -> None:
+        if self.owned:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+
 class ContextManager:
     """
     Aggregates uploaded context files (.md, .txt) and/or a .tmp stream into a single prompt context.
@@ -20,22 +50,160 @@ class ContextManager:
         config: Config,
         error_logger: Optional[ErrorLogger] = None,
         output_manager: Optional[OutputManager] = None,
+        model_name: Optional[str] = None,
     ):
         self.config = config
         self.error_logger = error_logger
         self.output_manager = output_manager
-        # Internal list of (filename, content) tuples, ordered by upload time
-        self._buffers: List[Tuple[str, str]] = []
+        # Model whose tokenizer calibration sizes buffers; see set_model
+        self.model_name = model_name
+        # Internal queue of (filename, content) tuples, ordered by upload time
+        self._buffers: Deque[Tuple[str, str]] = deque()
+        # Token cost of each buffer including its header, kept alongside
+        # _buffers so eviction never re-joins or re-counts the whole context
+        self._sizes: Deque[int] = deque()
+        # Unique id of each buffer, the key of its chunks in the deduplicator
+        self._owners: Deque[int] = deque()
+        self._next_owner = 0
+        # Untruncated upload behind each buffer, or None if it was stored whole
+        self._originals: Deque[Optional[_Original]] = deque()
+        # Keep originals only when the agent can select from them by relevance
+        self.keep_originals = (
+            config.prompt_budget_enabled
+            and config.context_relevance_enabled
+            and context_index_available()
+        )
+        self._total_tokens = 0
+        # Bumped whenever _buffers changes so callers can cache derived text
+        self.version = 0
+        # (version, text) of the last assembled context
+        self._context_cache: Optional[Tuple[int, str]] = None
+        # Stages that shrink each upload before it is stored
+        self.compactor: Optional[CompactionPipeline] = None
+        if config.compaction_stages:
+            self.compactor = CompactionPipeline.from_config(config, model_name)
+        # Chunks of live buffers, used to drop older copies of new uploads
+        self.deduplicator: Optional[Deduplicator] = None
+        if config.dedup_enabled:
+            self.deduplicator = Deduplicator(config.dedup_threshold)
+
+    def _header(self, file_name: str) -> str:
+        delim = self.config.default_prompt_delim
+        return f"{delim} Context from: {file_name} {delim}"
+
+    def _count(self, text: str) -> int:
+        return count_tokens(text, self.model_name)
+
+    def _buffer_tokens(self, file_name: str, text: str) -> int:
+        return self._count(self._header(file_name)) + self._count(text)
+
+    def set_model(self, model_name: Optional[str]) -> None:
+        """
+        Count tokens with *model_name*'s calibration from now on. Stored
+        buffers are re-counted so the context limit applies in the new
+        model's tokens; buffers already cut at upload stay as they are.
+        """
+        if model_name == self.model_name:
+            return
+        self.model_name = model_name
+        if self.compactor is not None:
+            # The pipeline may be shared with copies; keep its savings totals
+            compactor = CompactionPipeline.from_config(self.config, model_name)
+            compactor.stats = self.compactor.stats
+            self.compactor = compactor
+        self._sizes = deque(self._buffer_tokens(name, text) for name, text in self._buffers)
+        self._total_tokens = sum(self._sizes)
+        self._originals = deque(
+            None if original is None else self._recount(name, original)
+            for (name, _), original in zip(self._buffers, self._originals)
+        )
+        self.version += 1
+        self._truncate_if_needed()
+
+    def _append(self, file_name: str, text: str, original: Optional[_Original] = None) -> None:
+        # Buffers are joined with blank lines, so the combined count is the
+        # sum of the per-buffer counts
+        size = self._buffer_tokens(file_name, text)
+        self._buffers.append((file_name, text))
+        self._sizes.append(size)
+        self._originals.append(original)
+        self._owners.append(self._next_owner)
+        if self.deduplicator is not None:
+            self.deduplicator.add(self._next_owner, text)
+        self._next_owner += 1
+        self._total_tokens += size
+        self.version += 1
+
+    def _pop_oldest(self, discard: bool = True) -> Tuple[str, str]:
+        self._total_tokens -= self._sizes.popleft()
+        original = self._originals.popleft()
+        if discard and original is not None:
+            original.discard()
+        owner = self._owners.popleft()
+        if self.deduplicator is not None:
+            self.deduplicator.forget(owner)
+        self.version += 1
+        return self._buffers.popleft()
+
+    def _store(self, file_name: str, text: str, original: Optional[_Original] = None) -> None:
+        """Append an upload after removing older copies of its chunks, then enforce the limit."""
+        self._collapse_older(file_name, text)
+        self._append(file_name, text, original)
+        self._truncate_if_needed()
+
+    def _keep_original(self, file_name: str, text: str) -> Optional[_Original]:
+        """
+        Remember *text* before it is cut to head and tail, if originals are
+        kept. It is written to a temporary file so only the chunks selected
+        from it are read back into memory.
+        """
+        if not self.keep_originals:
+            return None
+        fd, path = tempfile.mkstemp(prefix="laser_lens_", suffix=".spill")
+        with open(fd, "w", encoding="utf-8", newline="") as f:
+            f.write(text)
+        return _Original(self._buffer_tokens(file_name, text), FileSource(path), owned=True)
+
+    def _recount(self, file_name: str, original: _Original) -> _Original:
+        """Return *original* with its token count in the current model's calibration."""
+        with SpilledText(original.path) as view:
+            tokens = self._count(self._header(file_name)) + view.tokens(self.model_name)
+        return replace(original, tokens=tokens)
+
+    def changed_since(self, version: int) -> bool:
+        """Return True if the buffers changed after *version* was read."""
+        return self.version != version
+
+    @property
+    def total_tokens(self) -> int:
+        """Token count of :meth:`get_context`, maintained incrementally."""
+        return self._total_tokens
+
+    @property
+    def has_originals(self) -> bool:
+        """True if some buffer was cut at upload and :meth:`sources` holds more."""
+        return any(original is not None for original in self._originals)
+
+    @property
+    def source_tokens(self) -> int:
+        """Token count of :meth:`sources`, i.e. with untruncated uploads."""
+        return sum(
+            size if original is None else original.tokens
+            for size, original in zip(self._sizes, self._originals)
+        )
 
     def _truncate_large_file(self, text: str, file_name: str, *, limit: Optional[int] = None) -> str:
         """Trim text if it exceeds the given token limit."""
         if limit is None:
             limit = self.config.max_context_tokens
-        if count_tokens(text) <= limit:
+        tokens = self._count(text)
+        if tokens <= limit:
             return text
 
         marker = "\n...[truncated]...\n"
-        keep = max(0, (limit - len(marker)) // 2)
+        # Limits are in tokens; cut in characters at this text's density
+        chars = int(len(text) * limit / tokens) - len(marker)
+        keep = max(0, chars // 2)
         truncated = text[:keep] + marker + text[-keep:]
         orig_len = len(text)
         if self.output_manager:
@@ -49,11 +217,234 @@ class ContextManager:
             )
         return warning + truncated
 
+    def _compacted_tokens(self) -> int:
+        if self.compactor is None:
+            return 0
+        return sum(stats.tokens for stats in self.compactor.stats.values())
+
+    def _compact(self, text: str) -> str:
+        if self.compactor is None:
+            return text
+        return self.compactor.run(text)
+
+    def _log_compaction(self, file_name: str, before: int) -> None:
+        saved = self._compacted_tokens() - before
+        if saved and self.error_logger:
+            self.error_logger.log("INFO", f"Compacted {file_name}; saved {saved} tokens")
+
+    def _prepare(self, file_name: str, text: str) -> str:
+        """Run the compaction stages over *text*."""
+        before = self._compacted_tokens()
+        text = self._compact(text)
+        self._log_compaction(file_name, before)
+        return text
+
+    @property
+    def compaction_stats(self) -> dict:
+        """Characters and tokens removed so far by each compaction stage."""
+        if self.compactor is None:
+            return {}
+        return self.compactor.saved()
+
+    def _collapse_older(self, file_name: str, text: str) -> None:
+        """
+        Remove chunks of live buffers that *text* repeats (or nearly repeats).
+        The newer copy is kept because the oldest buffers are evicted first;
+        an older buffer left with nothing new is dropped.
+        """
+        if self.deduplicator is None or not self._buffers:
+            return
+        found = self.deduplicator.matches(text)
+        if not found:
+            return
+        before = self.deduplicator.stats.tokens
+        for i in reversed(range(len(self._buffers))):
+            owner = self._owners[i]
+            hits = found.get(owner)
+            if not hits:
+                continue
+            name, old = self._buffers[i]
+            kept = self.deduplicator.remove(owner, old, hits, self.model_name)
+            self._total_tokens -= self._sizes[i]
+            if kept:
+                size = self._buffer_tokens(name, kept)
+                self._buffers[i] = (name, kept)
+                self._sizes[i] = size
+                self._total_tokens += size
+                self.deduplicator.add(owner, kept)
+            else:
+                original = self._originals[i]
+                if original is not None:
+                    original.discard()
+                del self._buffers[i]
+                del self._sizes[i]
+                del self._owners[i]
+                del self._originals[i]
+                if self.error_logger:
+                    self.error_logger.log("INFO", f"Dropped {name}: repeated by {file_name}")
+        self.version += 1
+        saved = self.deduplicator.stats.tokens - before
+        if self.error_logger:
+            self.error_logger.log(
+                "INFO", f"Collapsed context repeated by {file_name}; saved {saved} tokens"
+            )
+
+    @property
+    def dedup_stats(self) -> dict:
+        """Duplicate chunks dropped so far: counts, chars and tokens saved."""
+        if self.deduplicator is None:
+            return {}
+        return self.deduplicator.stats.as_dict()
+
+    def _spill_path(self, file_name: str) -> Tuple[str, Optional[str]]:
+        """
+        Return (path, saved_name) for a spilled upload. With an OutputManager the
+        spill file doubles as the ``full_<name>`` copy offered for download.
+        """
+        if self.output_manager:
+            safe_name = self.output_manager.sanitize_filename(f"full_{file_name}")
+            return os.path.join(self.output_manager.safe_dir, safe_name), safe_name
+        fd, path = tempfile.mkstemp(prefix="laser_lens_", suffix=".spill")
+        os.close(fd)
+        return path, None
+
+    def _add_spilled(self, file_name: str, path: str, saved_name: Optional[str]) -> None:
+        """
+        Store a spilled upload, decoding only what fits in the context limit:
+        the whole file if it is small enough, otherwise its head and tail.
+        """
+        limit = self.config.max_context_tokens
+        original: Optional[_Original] = None
+        with SpilledText(path) as view:
+            if not view.exceeds(limit, self.model_name):
+                text = self._prepare(file_name, view.text())
+            else:
+                if self.keep_originals:
+                    # The file stays on disk for relevance selection
+                    original = _Original(
+                        self._count(self._header(file_name)) + view.tokens(self.model_name),
+                        FileSource(path),
+                        owned=not saved_name,
+                    )
+                marker = "\n...[truncated]...\n"
+                note = f"\n\n[Full file saved as {saved_name}]" if saved_name else ""
+                # The final char count is at most the byte count, so this
+                # warning costs no fewer tokens than the real one
+                warning = f"WARNING: truncated from {len(view)} bytes to {len(view)} chars\n"
+                overhead = sum(
+                    self._count(part)
+                    for part in (self._header(file_name), marker, note, warning)
+                )
+                half = max(0, (limit - overhead) // 2)
+                text = (
+                    view.head(half, self.model_name)
+                    + marker
+                    + view.tail(half, self.model_name)
+                    + note
+                )
+                text = f"WARNING: truncated from {len(view)} bytes to {len(text)} chars\n" + text
+                if self.error_logger:
+                    self.error_logger.log(
+                        "INFO", f"Truncated {file_name} to fit context window"
+                    )
+        if not saved_name and original is None:
+            os.remove(path)
+        if self.error_logger:
+            self.error_logger.log(
+                "DEBUG", f"stored spilled file {file_name}; {len(text)} chars in memory"
+            )
+        self._store(file_name, text, original)
+
+    def _add_tmp(self, file_name: str, chunks: Iterable[str]) -> None:
+        """
+        Store the most recent .tmp chunks that fit in max_context_tokens as one
+        buffer. Older chunks are dropped as newer ones arrive, so memory follows
+        the budget rather than the file size.
+        """
+        limit = self.config.max_context_tokens - self._count(self._header(file_name))
+        kept: Deque[Tuple[str, int]] = deque()
+        kept_tokens = 0
+        seen = 0
+        before = self._compacted_tokens()
+        for chunk in chunks:
+            seen += 1
+            chunk = self._compact(chunk)
+            tokens = self._count(chunk)
+            kept.append((chunk, tokens))
+            kept_tokens += tokens
+            while kept_tokens > limit and len(kept) > 1:
+                kept_tokens -= kept.popleft()[1]
+        self._log_compaction(file_name, before)
+        # Blank lines between chunks keep each one a separate dedup chunk
+        merged = self._truncate_large_file("\n\n".join(chunk for chunk, _ in kept), file_name)
+        if self.error_logger:
+            self.error_logger.log(
+                "DEBUG",
+                f"parsed .tmp file {file_name}; kept the last {len(kept)} of {seen} chunks"
+            )
+        self._store(file_name, merged)
+
+    def _add_table(self, file_name: str, source) -> None:
+        """Store a statistical summary of a CSV/TSV/Parquet *source* in place of its rows."""
+        try:
+            summary = summarize_table(
+                source,
+                file_name,
+                self.config.tabular_chunk_rows,
+                self.config.tabular_sample_rows,
+                self.config.tabular_top_values,
+            )
+        except Exception as e:
+            if self.error_logger:
+                self.error_logger.log("WARNING", f"Could not read table {file_name}", e)
+            return
+        if self.error_logger:
+            self.error_logger.log(
+                "DEBUG", f"stored table summary of {file_name}; {len(summary)} chars"
+            )
+        self._store(file_name, self._truncate_large_file(summary, file_name))
+
+    def upload_file(self, path: str, file_name: Optional[str] = None) -> None:
+        """
+        Upload the file at *path*. Text files over Config.spill_threshold_bytes
+        are copied to disk in blocks and memory-mapped instead of being read,
+        and .tmp files are parsed as a stream.
+        """
+        file_name = file_name or os.path.basename(path)
+        lower = file_name.lower()
+        if is_tabular(file_name):
+            # Read in chunks straight from disk
+            self._add_table(file_name, path)
+            return
+        if lower.endswith(".tmp"):
+            with open(path, "r", encoding="utf-8", errors="replace", newline="") as f:
+                # A segment longer than the whole budget is only kept by its tail
+                chunks = iter_tmp_chunks(
+                    f,
+                    self.config.default_prompt_delim,
+                    max_segment_chars=self.config.max_context_tokens * WINDOW_BYTES_PER_TOKEN,
+                )
+                self._add_tmp(file_name, chunks)
+            return
+        if (lower.endswith(".md") or lower.endswith(".txt")) and (
+            os.path.getsize(path) > self.config.spill_threshold_bytes
+        ):
+            spill_path, saved_name = self._spill_path(file_name)
+            with open(path, "rb") as src:
+                spill(src, spill_path)
+            self._add_spilled(file_name, spill_path, saved_name)
+            return
+        with open(path, "rb") as f:
+            self.upload_context(file_name, f.read())
+
     def upload_context(self, file_name: str, content: bytes) -> None:
         """
         Accept an uploaded file (bytes) named file_name.
-        - If .tmp: parse using parse_tmp, join completed chunks, store as one buffer entry.
-        - If .md or .txt: decode as UTF-8 and store directly.
+        - If .tmp: parse using parse_tmp and store the most recent completed chunks
+          that fit the context budget as one buffer entry.
+        - If .md or .txt: decode as UTF-8 and store directly, or spill to disk
+          when larger than Config.spill_threshold_bytes.
+        - If .csv, .tsv or .parquet: store a summary (schema, column stats, sample).
         Otherwise, ignore.
         """
         lower = file_name.lower()
@@ -62,6 +453,16 @@ class ContextManager:
                 "DEBUG",
                 f"upload_context called for {file_name} ({len(content)} bytes)"
             )
+        if is_tabular(file_name):
+            self._add_table(file_name, io.BytesIO(content))
+            return
+        if (lower.endswith(".md") or lower.endswith(".txt")) and (
+            len(content) > self.config.spill_threshold_bytes
+        ):
+            spill_path, saved_name = self._spill_path(file_name)
+            spill(io.BytesIO(content), spill_path)
+            self._add_spilled(file_name, spill_path, saved_name)
+            return
         try:
             text = content.decode("utf-8")
         except UnicodeDecodeError:
@@ -70,44 +471,42 @@ class ContextManager:
         if lower.endswith(".tmp"):
             # parse_tmp returns (chunks, last_partial)
             chunks, _ = parse_tmp(text, self.config.default_prompt_delim)
-            merged = "\n".join(chunks)
-            merged = self._truncate_large_file(merged, file_name)
-            if self.error_logger:
-                self.error_logger.log(
-                    "DEBUG",
-                    f"parsed .tmp file {file_name}; {len(chunks)} chunks"
-                )
-            self._buffers.append((file_name, merged))
+            self._add_tmp(file_name, chunks)
+            return
         elif lower.endswith(".md") or lower.endswith(".txt"):
-            text = self._truncate_large_file(text, file_name)
+            prepared = self._prepare(file_name, text)
+            text = self._truncate_large_file(prepared, file_name)
+            original = self._keep_original(file_name, prepared) if text is not prepared else None
             if self.error_logger:
                 self.error_logger.log(
                     "DEBUG",
                     f"stored text file {file_name}; {len(text)} chars"
                 )
-            self._buffers.append((file_name, text))
+            # Enforces max context size after adding
+            self._store(file_name, text, original)
         else:
             # Unsupported extension; ignore
             if self.error_logger:
                 self.error_logger.log("DEBUG", f"ignored unsupported file {file_name}")
             return
 
-        # Enforce max context size after adding
-        self._truncate_if_needed()
         if self.error_logger:
-            total_chars = len(self.get_context())
             self.error_logger.log(
-                "DEBUG", f"context now has {len(self._buffers)} file(s), {total_chars} chars"
+                "DEBUG",
+                f"context now has {len(self._buffers)} file(s), {self._total_tokens} tokens"
             )
 
     def get_context(self) -> str:
         """
         Return concatenated context buffers in upload order, each preceded by a delimiter header.
+        The assembled string is cached until the next change to the buffers.
         """
+        cached = self._context_cache
+        if cached is not None and cached[0] == self.version:
+            return cached[1]
         parts: List[str] = []
-        delim = self.config.default_prompt_delim
         for fname, text in self._buffers:
-            parts.append(f"{delim} Context from: {fname} {delim}")
+            parts.append(self._header(fname))
             parts.append(text)
         combined = "\n\n".join(parts).strip()
         if self.error_logger:
@@ -115,40 +514,92 @@ class ContextManager:
                 "DEBUG",
                 f"get_context assembled {len(self._buffers)} files -> {len(combined)} chars"
             )
+        self._context_cache = (self.version, combined)
         return combined
 
     def clear_context(self) -> None:
         """Remove all stored buffers."""
-        self._buffers = []
+        self._buffers = deque()
+        self._sizes = deque()
+        self._owners = deque()
+        for original in self._originals:
+            if original is not None:
+                original.discard()
+        self._originals = deque()
+        self._total_tokens = 0
+        self._context_cache = None
+        if self.deduplicator is not None:
+            self.deduplicator.clear()
+        self.version += 1
         if self.error_logger:
             self.error_logger.log("DEBUG", "Context cleared")
 
+    def sources(self) -> List[Tuple[str, Source]]:
+        """
+        Return ``(file_name, source)`` pairs for :class:`ContextIndex` in upload
+        order. Buffers that were cut to head and tail at upload come back as
+        the :class:`FileSource` of their untruncated text when originals are
+        kept, so it is never decoded in one piece.
+        """
+        return [
+            (name, TextSource(text) if original is None else original.source)
+            for (name, text), original in zip(self._buffers, self._originals)
+        ]
+
+    def copy(self, output_manager: Optional[OutputManager] = None) -> "ContextManager":
+        """
+        Return a new manager holding the same buffers, e.g. one per fleet run.
+        Buffer strings are shared, not duplicated.
+        """
+        clone = ContextManager(
+            self.config,
+            self.error_logger,
+            output_manager or self.output_manager,
+            self.model_name,
+        )
+        clone._buffers = deque(self._buffers)
+        clone._sizes = deque(self._sizes)
+        clone._owners = deque(self._owners)
+        # Temporary spill files stay owned (and removed) by this manager
+        clone._originals = deque(
+            None if original is None else replace(original, owned=False)
+            for original in self._originals
+        )
+        clone._next_owner = self._next_owner
+        clone._total_tokens = self._total_tokens
+        clone.version = self.version
+        clone._context_cache = self._context_cache
+        clone.compactor = self.compactor
+        if self.deduplicator is not None:
+            clone.deduplicator = self.deduplicator.copy()
+        return clone
+
     def add_inline_context(self, text: str) -> None:
         """Add a short note directly into the context buffers."""
         name = f"user_note_{int(time.time())}.txt"
-        self._buffers.append((name, text))
+        self._append(name, text)
         self._truncate_if_needed()
 
     def _truncate_if_needed(self) -> None:
         """
         If combined context exceeds max_context_tokens, drop oldest buffers until under limit.
+        Uses the running token total, so each eviction costs O(1).
         """
-        while True:
-            combined = self.get_context()
-            if count_tokens(combined) <= self.config.max_context_tokens:
-                break
-            if len(self._buffers) == 1:
-                name, text = self._buffers[0]
-                header_overhead = len(self.config.default_prompt_delim) * 2 + len(f" Context from: {name} ")
-                limit = max(0, self.config.max_context_tokens - header_overhead)
-                self._buffers[0] = (name, self._truncate_large_file(text, name, limit=limit))
-                break
-            elif self._buffers:
-                removed = self._buffers.pop(0)
-                if self.error_logger:
-                    self.error_logger.log(
-                        "DEBUG",
-                        f"Dropped {removed[0]} to enforce context size"
-                    )
-            else:
-                break
+        limit = self.config.max_context_tokens
+        while self._total_tokens > limit and len(self._buffers) > 1:
+            removed = self._pop_oldest()
+            if self.error_logger:
+                self.error_logger.log(
+                    "DEBUG",
+                    f"Dropped {removed[0]} to enforce context size"
+                )
+        if self._total_tokens > limit and self._buffers:
+            original = self._originals[0]
+            name, text = self._pop_oldest(discard=False)
+            header_overhead = self._count(self._header(name))
+            truncated = self._truncate_large_file(
+                text, name, limit=max(0, limit - header_overhead)
+            )
+            if original is None:
+                original = self._keep_original(name, text)
+            self._append(name, truncated, original)
@@ -0,0 +1,228 @@
+# dedup.py
+
+"""
+Exact and near-duplicate detection for uploaded context.
+
+Text is compared in chunks (paragraphs, split at blank lines), so the same
+material lines up whether it was saved as a .tmp stream, a Markdown export or
+a pasted note. A chunk of a new upload repeats an older buffer if its
+normalized content hash was seen before (exact duplicate) or if its MinHash
+signature over word shingles matches an older chunk closely enough (near
+duplicate). Candidates are found with LSH banding, so each chunk is only
+compared with the few older chunks that share a band.
+
+Uploads are only compared with other buffers, never with themselves, and the
+newer copy is the one kept: the matching chunks are removed from the older
+buffers, which leave the context first when it is over budget.
+"""
+
+import hashlib
+import random
+import re
+from dataclasses import dataclass, field
+from typing import Dict, Hashable, Iterator, List, Optional, Set, Tuple
+
+from utils import count_tokens
+
+try:
+    import numpy as np
+except ImportError:  # signatures are computed in pure Python instead
+    np = None
+
+_PRIME = (1 << 61) - 1
+_WS_RE = re.compile(r"\s+")
+_CHUNK_SEP_RE = re.compile(r"\n\s*\n")
+CHUNK_SEP = "\n\n"
+
+
+def split_chunks(text: str) -> List[str]:
+    """Split *text* into paragraph chunks at blank lines."""
+    return _CHUNK_SEP_RE.split(text)
+
+
+def _normalize(text: str) -> str:
+    return _WS_RE.sub(" ", text).strip().lower()
+
+
+def _hash32(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=4).digest(), "big")
+
+
+@dataclass
+class DedupStats:
+    """Duplicate chunks dropped so far and what they would have cost."""
+
+    exact: int = 0
+    near: int = 0
+    chars: int = 0
+    tokens: int = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return {"exact": self.exact, "near": self.near, "chars": self.chars, "tokens": self.tokens}
+
+
+@dataclass
+class _Entry:
+    owner: Hashable
+    index: int  # position of the chunk in its owner's split_chunks()
+    digest: bytes
+    signature: Tuple[int, ...]
+    bands: List[Tuple[int, Tuple[int, ...]]] = field(default_factory=list)
+
+
+class Deduplicator:
+    """
+    Index of the chunks of every live buffer, keyed by an owner id. Owners
+    must be unique per buffer: :meth:`forget` drops all of an owner's chunks
+    when its buffer leaves the context or is rewritten.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.8,
+        num_perm: int = 64,
+        bands: int = 16,
+        shingle_words: int = 5,
+        min_chars: int = 64,
+        seed: int = 1,
+    ):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.shingle_words = shingle_words
+        # Shorter chunks (rules, headings, code fences) are never compared
+        self.min_chars = min_chars
+        rng = random.Random(seed)
+        self._a = [rng.randrange(1, 1 << 31) for _ in range(num_perm)]
+        self._b = [rng.randrange(0, 1 << 31) for _ in range(num_perm)]
+        self._entries: Dict[int, _Entry] = {}
+        self._by_owner: Dict[Hashable, List[int]] = {}
+        self._digests: Dict[bytes, Set[int]] = {}
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], Set[int]] = {}
+        self._next_id = 0
+        self.stats = DedupStats()
+
+    def copy(self) -> "Deduplicator":
+        clone = Deduplicator.__new__(Deduplicator)
+        clone.__dict__.update(self.__dict__)
+        clone._entries = dict(self._entries)
+        clone._by_owner = {k: list(v) for k, v in self._by_owner.items()}
+        clone._digests = {k: set(v) for k, v in self._digests.items()}
+        clone._buckets = {k: set(v) for k, v in self._buckets.items()}
+        clone.stats = DedupStats(**self.stats.as_dict())
+        return clone
+
+    def _signature(self, words: List[str]) -> Tuple[int, ...]:
+        k = self.shingle_words
+        if len(words) <= k:
+            shingles = {" ".join(words)}
+        else:
+            shingles = {" ".join(words[i:i + k]) for i in range(len(words) - k + 1)}
+        hashes = [_hash32(s) for s in shingles]
+        if np is not None:
+            h = np.asarray(hashes, dtype=np.uint64)
+            a = np.asarray(self._a, dtype=np.uint64)[:, None]
+            b = np.asarray(self._b, dtype=np.uint64)[:, None]
+            # a < 2**31 and h < 2**32, so a * h + b cannot overflow uint64
+            return tuple(int(v) for v in ((a * h + b) % _PRIME).min(axis=1))
+        return tuple(
+            min((a * h + b) % _PRIME for h in hashes) for a, b in zip(self._a, self._b)
+        )
+
+    def _band_keys(self, signature: Tuple[int, ...]) -> List[Tuple[int, Tuple[int, ...]]]:
+        rows = self.num_perm // self.bands
+        return [(i, signature[i * rows:(i + 1) * rows]) for i in range(self.bands)]
+
+    def _fingerprints(self, text: str) -> Iterator[Tuple[int, bytes, Tuple[int, ...], list]]:
+        for index, chunk in enumerate(split_chunks(text)):
+            if len(chunk.strip()) < self.min_chars:
+                continue
+            normalized = _normalize(chunk)
+            digest = hashlib.blake2b(normalized.encode("utf-8"), digest_size=16).digest()
+            signature = self._signature(normalized.split(" "))
+            yield index, digest, signature, self._band_keys(signature)
+
+    def add(self, owner: Hashable, text: str) -> None:
+        """Index the chunks of *text* under *owner*."""
+        ids = self._by_owner.setdefault(owner, [])
+        for index, digest, signature, keys in self._fingerprints(text):
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = _Entry(owner, index, digest, signature, keys)
+            self._digests.setdefault(digest, set()).add(entry_id)
+            ids.append(entry_id)
+            for key in keys:
+                self._buckets.setdefault(key, set()).add(entry_id)
+
+    def matches(self, text: str) -> Dict[Hashable, Dict[int, str]]:
+        """
+        Find indexed chunks repeated by *text*. Returns
+        ``{owner: {chunk index: "exact" | "near"}}``.
+        """
+        found: Dict[Hashable, Dict[int, str]] = {}
+        for _, digest, signature, keys in self._fingerprints(text):
+            for entry_id in self._digests.get(digest, ()):
+                entry = self._entries[entry_id]
+                found.setdefault(entry.owner, {})[entry.index] = "exact"
+            seen: Set[int] = set()
+            for key in keys:
+                for entry_id in self._buckets.get(key, ()):
+                    if entry_id in seen:
+                        continue
+                    seen.add(entry_id)
+                    entry = self._entries[entry_id]
+                    hits = found.setdefault(entry.owner, {})
+                    if entry.index in hits:
+                        continue
+                    same = sum(x == y for x, y in zip(signature, entry.signature))
+                    if same / self.num_perm >= self.threshold:
+                        hits[entry.index] = "near"
+        return {owner: hits for owner, hits in found.items() if hits}
+
+    def remove(
+        self, owner: Hashable, text: str, hits: Dict[int, str], model: Optional[str] = None
+    ) -> str:
+        """
+        Return *text* (the buffer of *owner*) without the chunks in *hits*,
+        counting them in :attr:`stats`. The owner's index entries are dropped;
+        callers re-:meth:`add` the returned text if the buffer stays.
+        """
+        self.forget(owner)
+        kept: List[str] = []
+        for index, chunk in enumerate(split_chunks(text)):
+            kind = hits.get(index)
+            if kind is None:
+                kept.append(chunk)
+                continue
+            if kind == "exact":
+                self.stats.exact += 1
+            else:
+                self.stats.near += 1
+            self.stats.chars += len(chunk)
+            self.stats.tokens += count_tokens(chunk, model)
+        return CHUNK_SEP.join(kept).strip()
+
+    def forget(self, owner: Hashable) -> None:
+        """Drop every chunk recorded for *owner*."""
+        for entry_id in self._by_owner.pop(owner, ()):
+            entry = self._entries.pop(entry_id)
+            same = self._digests.get(entry.digest)
+            if same is not None:
+                same.discard(entry_id)
+                if not same:
+                    del self._digests[entry.digest]
+            for key in entry.bands:
+                bucket = self._buckets.get(key)
+                if bucket is not None:
+                    bucket.discard(entry_id)
+                    if not bucket:
+                        del self._buckets[key]
+
+    def clear(self) -> None:
+        """Forget every chunk; stats are kept."""
+        self._entries.clear()
+        self._by_owner.clear()
+        self._digests.clear()
+        self._buckets.clear()
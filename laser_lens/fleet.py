@@ -0,0 +1,196 @@
+# fleet.py
+
+import asyncio
+import dataclasses
+import itertools
+import os
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import handlers
+from config import Config
+from error_logger import ErrorLogger
+from command_executor import CommandExecutor
+from context_manager import ContextManager
+from output_manager import OutputManager
+from agent_state import AgentState
+from recursive_agent import RecursiveAgent
+from api_key_pool import ApiKeyPool
+from response_cache import ResponseCache
+from adaptive_rate import AdaptiveRateController, CircuitBreaker
+from utils import build_markdown, slugify, suggest_filename
+
+
+@dataclass(frozen=True)
+class FleetJob:
+    """One topic/model/temperature combination executed by :class:`FleetRunner`."""
+
+    topic: str
+    model_name: str
+    temperature: float
+
+
+def build_jobs(
+    topics: Sequence[str], models: Sequence[str], temperatures: Sequence[float]
+) -> List[FleetJob]:
+    """Return the topic x model x temperature grid as a list of jobs."""
+    return [
+        FleetJob(topic, model, temp)
+        for topic, model, temp in itertools.product(topics, models, temperatures)
+    ]
+
+
+def load_topics(path: str) -> List[str]:
+    """Read one topic per line from *path*, skipping blanks and ``#`` comments."""
+    with open(path, "r", encoding="utf-8") as f:
+        lines = [line.strip() for line in f]
+    return [line for line in lines if line and not line.startswith("#")]
+
+
+class FleetRunner:
+    """
+    Runs many :class:`RecursiveAgent` instances concurrently on one event loop.
+
+    Each job gets its own ``AgentState`` and output directory under
+    ``base_dir``, where its embedded commands also run, while sharing the
+    already-loaded ``shared_context`` buffers, so uploaded files are decoded
+    and truncated only once. At most ``workers``
+    jobs are active at a time. An optional ``key_pool`` and ``response_cache`` are
+    shared by all runs, and jobs on the same model share one adaptive rate
+    controller and circuit breaker.
+    """
+
+    def __init__(
+        self,
+        config: Config,
+        error_logger: ErrorLogger,
+        command_executor: CommandExecutor,
+        shared_context: ContextManager,
+        *,
+        loops: int,
+        seed: Any,
+        rpm: int,
+        tpm: Optional[int] = None,
+        api_key: Optional[str] = None,
+        thinking_mode: bool = False,
+        workers: Optional[int] = None,
+        base_dir: Optional[str] = None,
+        key_pool: Optional[ApiKeyPool] = None,
+        response_cache: Optional[ResponseCache] = None,
+        on_event: Optional[Callable[[int, FleetJob, tuple], None]] = None,
+    ):
+        self.config = config
+        self.error_logger = error_logger
+        self.command_executor = command_executor
+        self.shared_context = shared_context
+        self.loops = loops
+        self.seed = seed
+        self.rpm = rpm
+        self.tpm = tpm
+        self.api_key = api_key
+        self.thinking_mode = thinking_mode
+        self.workers = max(1, workers or config.default_fleet_workers)
+        self.base_dir = os.path.expanduser(base_dir or config.fleet_output_dir)
+        self.key_pool = key_pool
+        self.response_cache = response_cache
+        self.on_event = on_event
+        # One AIMD controller and breaker per model so jobs back off together
+        self._rate_controllers: Dict[str, AdaptiveRateController] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def run(self, jobs: Sequence[FleetJob]) -> List[Dict[str, Any]]:
+        """Blocking wrapper around :meth:`run_async`."""
+        return asyncio.run(self.run_async(jobs))
+
+    async def run_async(self, jobs: Sequence[FleetJob]) -> List[Dict[str, Any]]:
+        """Execute *jobs* with bounded concurrency; results keep job order."""
+        semaphore = asyncio.Semaphore(self.workers)
+
+        async def bounded(idx: int, job: FleetJob) -> Dict[str, Any]:
+            async with semaphore:
+                return await self._run_job(idx, job)
+
+        return list(
+            await asyncio.gather(*(bounded(i, job) for i, job in enumerate(jobs, start=1)))
+        )
+
+    def _job_config(self, idx: int, job: FleetJob) -> Config:
+        """Return a Config whose state and output dirs are private to *job*."""
+        model_slug = slugify(job.model_name.split("/")[-1])
+        run_name = f"{idx:04d}_{slugify(job.topic)[:60]}_{model_slug}_t{job.temperature:g}"
+        run_dir = os.path.join(self.base_dir, run_name)
+        return dataclasses.replace(
+            self.config,
+            agent_state_dir=os.path.join(run_dir, "state"),
+            safe_output_dir=os.path.join(run_dir, "outputs"),
+        )
+
+    async def _run_job(self, idx: int, job: FleetJob) -> Dict[str, Any]:
+        result: Dict[str, Any] = {
+            "topic": job.topic,
+            "model": job.model_name,
+            "temperature": job.temperature,
+            "output_file": None,
+            "error": None,
+        }
+        workspace = None
+        try:
+            cfg = self._job_config(idx, job)
+            om = OutputManager(cfg, self.error_logger)
+            # Embedded commands read and write this job's outputs/ only
+            workspace = handlers.use_workspace(om)
+            as_state = AgentState(cfg, self.error_logger)
+            agent = RecursiveAgent(
+                config=cfg,
+                error_logger=self.error_logger,
+                command_executor=self.command_executor,
+                context_manager=self.shared_context.copy(output_manager=om),
+                output_manager=om,
+                agent_state=as_state,
+                model_name=job.model_name,
+                topic=job.topic,
+                loops=self.loops,
+                temperature=job.temperature,
+                seed=self.seed,
+                rpm=self.rpm,
+                api_key=self.api_key,
+                thinking_mode=self.thinking_mode,
+                tpm=self.tpm,
+                key_pool=self.key_pool,
+                response_cache=self.response_cache,
+                rate_controller=self._rate_controllers.setdefault(
+                    job.model_name, AdaptiveRateController(self.config, self.rpm)
+                ),
+                circuit_breaker=self._breakers.setdefault(
+                    job.model_name, CircuitBreaker(self.config)
+                ),
+            )
+            async for event in agent.run_async():
+                if self.on_event:
+                    self.on_event(idx, job, event)
+                if event[0] == "error":
+                    result["error"] = event[3][0]
+                    return result
+
+            history = as_state.get_state("history") or []
+            md_content = build_markdown(history, job.topic)
+            saved_path = om.save_output(suggest_filename(job.topic), md_content)
+            result["output_file"] = saved_path
+            om.save_session_metadata(
+                {
+                    "topic": job.topic,
+                    "loops": self.loops,
+                    "model": job.model_name,
+                    "temperature": job.temperature,
+                    "seed": self.seed,
+                    "rpm": self.rpm,
+                    "output_file": saved_path,
+                }
+            )
+        except Exception as e:
+            self.error_logger.log("ERROR", f"Fleet job {idx} ({job.topic}) failed", e)
+            result["error"] = str(e)
+        finally:
+            if workspace is not None:
+                handlers.reset_workspace(workspace)
+        return result
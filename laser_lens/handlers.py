@@ -2,7 +2,8 @@
 
 import os
 import subprocess
-from typing import Dict, Any
+from contextvars import ContextVar, Token
+from typing import Dict, Any, Optional
 
 from output_manager import OutputManager
 from error_logger import ErrorLogger
@@ -15,6 +16,10 @@ _cfg = Config()
 _logger = ErrorLogger(_cfg)
 _output_mgr = OutputManager(_cfg, _logger)
 
+# Output directory of the run whose commands execute in this context. Fleet
+# jobs set their own so concurrent runs never touch each other's files.
+_workspace: ContextVar[Optional[OutputManager]] = ContextVar("workspace", default=None)
+
 COMMAND_HELP: Dict[str, tuple[str, str]] = {
     "WRITE_FILE": ("filename, content[, dry_run]", "Save text to outputs directory."),
     "APPEND_FILE": ("filename, content", "Append text to an existing file."),
@@ -36,6 +41,36 @@ COMMAND_HELP: Dict[str, tuple[str, str]] = {
 }
 
 
+def use_workspace(output_mgr: OutputManager) -> Token:
+    """
+    Run commands in the current context (and threads or tasks started from
+    it) inside *output_mgr*'s directory. Returns a token for
+    ``reset_workspace``.
+    """
+    return _workspace.set(output_mgr)
+
+
+def reset_workspace(token: Token) -> None:
+    """Restore the workspace that was active before ``use_workspace``."""
+    _workspace.reset(token)
+
+
+def _manager() -> OutputManager:
+    return _workspace.get() or _output_mgr
+
+
+def _safe_dir() -> str:
+    workspace = _workspace.get()
+    if workspace is not None:
+        return workspace.safe_dir
+    return os.path.expanduser(_cfg.safe_output_dir)
+
+
+def file_key(fname: str) -> str:
+    """Name of the file under outputs/ that the handlers use for *fname*."""
+    return os.path.normcase(_manager().sanitize_filename(fname))
+
+
 def WRITE_FILE(args: Dict[str, Any]) -> str:
     """Write text to a file in the outputs directory.
 
@@ -68,11 +103,11 @@ def WRITE_FILE(args: Dict[str, Any]) -> str:
             return f"ERROR: Could not decode base64 content: {e}"
 
     if dry:
-        safe = _output_mgr.sanitize_filename(fname)
+        safe = _manager().sanitize_filename(fname)
         return f"DRY RUN: would write {len(content)} chars to {safe}"
 
     try:
-        saved_path = _output_mgr.save_output(fname, content)
+        saved_path = _manager().save_output(fname, content)
         return f"Wrote {len(content)} chars to {saved_path}"
     except Exception as e:
         _logger.log("ERROR", f"Failed to WRITE_FILE {fname}", e)
@@ -86,8 +121,8 @@ def APPEND_FILE(args: Dict[str, Any]) -> str:
     if not fname:
         return "ERROR: Missing required argument 'filename'."
 
-    safe_name = _output_mgr.sanitize_filename(fname)
-    path = os.path.join(os.path.expanduser(_cfg.safe_output_dir), safe_name)
+    safe_name = _manager().sanitize_filename(fname)
+    path = os.path.join(_safe_dir(), safe_name)
     if not os.path.isfile(path):
         return f"ERROR: File {safe_name} does not exist."
 
@@ -110,8 +145,8 @@ def READ_FILE(args: Dict[str, Any]) -> str:
     if not fname:
         return "ERROR: Missing required argument 'filename'."
 
-    safe_name = _output_mgr.sanitize_filename(fname)
-    path = os.path.join(os.path.expanduser(_cfg.safe_output_dir), safe_name)
+    safe_name = _manager().sanitize_filename(fname)
+    path = os.path.join(_safe_dir(), safe_name)
     if not os.path.isfile(path):
         return f"ERROR: File {safe_name} does not exist."
 
@@ -138,7 +173,7 @@ def LIST_OUTPUTS(args: Dict[str, Any]) -> str:
     Returns a newline-separated list of filenames under ./outputs/.
     """
     try:
-        files = _output_mgr.list_outputs()
+        files = _manager().list_outputs()
         if not files:
             return "(no files found in outputs/)"
         return "\n".join(files)
@@ -157,8 +192,8 @@ def DELETE_FILE(args: Dict[str, Any]) -> str:
     if not fname:
         return "ERROR: Missing required argument 'filename'."
 
-    safe_name = _output_mgr.sanitize_filename(fname)
-    path = os.path.join(os.path.expanduser(_cfg.safe_output_dir), safe_name)
+    safe_name = _manager().sanitize_filename(fname)
+    path = os.path.join(_safe_dir(), safe_name)
     if not os.path.isfile(path):
         return f"ERROR: File {safe_name} does not exist."
 
@@ -188,7 +223,7 @@ def EXEC(args: Dict[str, Any]) -> str:
         proc = subprocess.run(
             cmd,
             shell=True,
-            cwd=os.path.expanduser(_cfg.safe_output_dir),
+            cwd=_safe_dir(),
             timeout=10,
             capture_output=True,
             text=True,
@@ -210,7 +245,7 @@ def RUN_PYTHON(args: Dict[str, Any]) -> str:
     try:
         proc = subprocess.run(
             ["python", "-c", code],
-            cwd=os.path.expanduser(_cfg.safe_output_dir),
+            cwd=_safe_dir(),
             timeout=10,
             capture_output=True,
             text=True,
@@ -230,8 +265,8 @@ def WORD_COUNT(args: Dict[str, Any]) -> str:
     if not fname:
         return "ERROR: Missing required argument 'filename'."
 
-    safe_name = _output_mgr.sanitize_filename(fname)
-    path = os.path.join(os.path.expanduser(_cfg.safe_output_dir), safe_name)
+    safe_name = _manager().sanitize_filename(fname)
+    path = os.path.join(_safe_dir(), safe_name)
     if not os.path.isfile(path):
         return f"ERROR: File {safe_name} does not exist."
 
@@ -259,8 +294,8 @@ def READ_LINES(args: Dict[str, Any]) -> str:
     if start <= 0 or end < start:
         return "ERROR: Invalid line range."
 
-    safe_name = _output_mgr.sanitize_filename(fname)
-    path = os.path.join(os.path.expanduser(_cfg.safe_output_dir), safe_name)
+    safe_name = _manager().sanitize_filename(fname)
+    path = os.path.join(_safe_dir(), safe_name)
     if not os.path.isfile(path):
         return f"ERROR: File {safe_name} does not exist."
 
@@ -0,0 +1,207 @@
+# hedging.py
+
+import asyncio
+import queue
+import threading
+import time
+from collections import deque
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Deque,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+
+_TRACKERS: Dict[str, "LatencyTracker"] = {}
+_TRACKERS_LOCK = threading.Lock()
+
+
+class LatencyTracker:
+    """Sliding window of recent time-to-first-token samples (seconds)."""
+
+    def __init__(self, window: int = 50):
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct: float, min_samples: int = 1) -> Optional[float]:
+        """Return the *pct* (0-1) percentile, or ``None`` with too few samples."""
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < max(1, min_samples):
+            return None
+        idx = min(len(samples) - 1, int(round(pct * (len(samples) - 1))))
+        return samples[idx]
+
+
+def get_tracker(model_name: str, window: int = 50) -> LatencyTracker:
+    """Return the process-wide tracker for *model_name* (shared by agents)."""
+    with _TRACKERS_LOCK:
+        tracker = _TRACKERS.get(model_name)
+        if tracker is None:
+            tracker = _TRACKERS[model_name] = LatencyTracker(window)
+        return tracker
+
+
+class StreamPump:
+    """
+    Drains a blocking iterator in a daemon thread, pushing
+    ``(pump, kind, value)`` events to *events* where kind is ``"item"``,
+    ``"done"`` or ``"error"``. :meth:`stop` makes the thread quit after the
+    item it is currently waiting on.
+    """
+
+    def __init__(self, factory: Callable[[], Iterator[Any]], events: "queue.Queue"):
+        self._factory = factory
+        self._events = events
+        self._stopped = threading.Event()
+        self.started_at = time.monotonic()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def _run(self) -> None:
+        try:
+            iterator = self._factory()
+            for item in iterator:
+                if self._stopped.is_set():
+                    close = getattr(iterator, "close", None)
+                    if close is not None:
+                        close()
+                    return
+                self._events.put((self, "item", item))
+            self._events.put((self, "done", None))
+        except BaseException as e:  # forwarded to the consuming thread
+            self._events.put((self, "error", e))
+
+
+def hedged_iter(
+    factory: Callable[[], Iterator[Any]],
+    hedge_after: Optional[float],
+    allow_hedge: Callable[[], bool],
+    on_first: Callable[[float], None],
+) -> Iterator[Any]:
+    """
+    Yield items from ``factory()``. If no item arrives within *hedge_after*
+    seconds and ``allow_hedge()`` agrees, start a duplicate stream; whichever
+    produces an item first wins and the other is stopped. *on_first* receives
+    the winner's time to first item.
+    """
+    events: "queue.Queue" = queue.Queue()
+    pumps: List[StreamPump] = [StreamPump(factory, events)]
+    errors: List[BaseException] = []
+    hedged = hedge_after is None
+
+    winner: Optional[StreamPump] = None
+    first_item: Any = None
+    while winner is None:
+        timeout = None
+        if not hedged:
+            timeout = max(0.0, pumps[0].started_at + hedge_after - time.monotonic())
+        try:
+            pump, kind, value = events.get(timeout=timeout)
+        except queue.Empty:
+            hedged = True
+            if allow_hedge():
+                pumps.append(StreamPump(factory, events))
+            continue
+        if kind == "item":
+            winner, first_item = pump, value
+        elif kind == "done":
+            winner = pump
+        else:
+            errors.append(value)
+            if len(errors) == len(pumps):
+                # Every launched stream failed; let the caller's retry path decide
+                raise errors[0]
+
+    for pump in pumps:
+        if pump is not winner:
+            pump.stop()
+    on_first(time.monotonic() - winner.started_at)
+    if kind == "done":
+        return
+    yield first_item
+    yield from _drain(winner, events)
+
+
+def _drain(pump: StreamPump, events: "queue.Queue") -> Iterator[Any]:
+    """Yield the remaining items produced by *pump*, ignoring other pumps."""
+    while True:
+        source, kind, value = events.get()
+        if source is not pump:
+            continue
+        if kind == "item":
+            yield value
+        elif kind == "done":
+            return
+        else:
+            raise value
+
+
+async def hedged_aiter(
+    factory: Callable[[], AsyncIterator[Any]],
+    hedge_after: Optional[float],
+    allow_hedge: Callable[[], bool],
+    on_first: Callable[[float], None],
+) -> AsyncIterator[Any]:
+    """Async counterpart of :func:`hedged_iter` built on asyncio tasks."""
+    started = time.monotonic()
+    streams: List[Tuple[AsyncIterator[Any], "asyncio.Future", float]] = []
+
+    def launch() -> None:
+        stream = factory()
+        streams.append(
+            (stream, asyncio.ensure_future(stream.__anext__()), time.monotonic())
+        )
+
+    launch()
+    pending = {streams[0][1]}
+    if hedge_after is not None:
+        done, _ = await asyncio.wait(pending, timeout=hedge_after)
+        if not done and allow_hedge():
+            launch()
+            pending.add(streams[1][1])
+
+    winner = None
+    first_error: Optional[BaseException] = None
+    try:
+        while winner is None and pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for fut in done:
+                exc = fut.exception()
+                if exc is None or isinstance(exc, StopAsyncIteration):
+                    winner = next(s for s in streams if s[1] is fut)
+                    break
+                first_error = first_error or exc
+    finally:
+        for stream, fut, _ in streams:
+            if winner is None or stream is not winner[0]:
+                fut.cancel()
+                aclose = getattr(stream, "aclose", None)
+                if aclose is not None and fut.done():
+                    try:
+                        await aclose()
+                    except Exception:
+                        # Best effort: the losing stream is discarded anyway
+                        pass
+
+    if winner is None:
+        raise first_error  # type: ignore[misc]
+    stream, fut, launched = winner
+    on_first(time.monotonic() - max(launched, started))
+    if isinstance(fut.exception(), StopAsyncIteration):
+        return
+    yield fut.result()
+    async for item in stream:
+        yield item
@@ -0,0 +1,203 @@
+# loop_memory.py
+
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+
+from error_logger import ErrorLogger
+from utils import count_tokens
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+# File name of the passage store inside the agent state directory
+MEMORY_FILE = "memory.jsonl"
+
+
+def memory_path(state_dir: str) -> str:
+    """Path of the loop memory kept in *state_dir*."""
+    return os.path.join(os.path.expanduser(state_dir), MEMORY_FILE)
+
+
+def clear_memory(state_dir: str, error_logger: Optional[ErrorLogger] = None) -> None:
+    """Delete the loop memory in *state_dir*, e.g. when a fresh run starts."""
+    path = memory_path(state_dir)
+    try:
+        if os.path.isfile(path):
+            os.remove(path)
+    except OSError as e:
+        if error_logger:
+            error_logger.log("WARNING", f"Failed to delete {path}", e)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased word tokens used for indexing and queries."""
+    return [t.lower() for t in _TOKEN_RE.findall(text)]
+
+
+def chunk_text(text: str, max_chars: int) -> List[str]:
+    """
+    Split *text* into passages of at most *max_chars*, breaking on blank
+    lines where possible and hard-splitting longer paragraphs.
+    """
+    passages: List[str] = []
+    current = ""
+    for para in re.split(r"\n\s*\n", text):
+        para = para.strip()
+        if not para:
+            continue
+        while len(para) > max_chars:
+            if current:
+                passages.append(current)
+                current = ""
+            passages.append(para[:max_chars])
+            para = para[max_chars:]
+        if current and len(current) + 2 + len(para) > max_chars:
+            passages.append(current)
+            current = ""
+        current = f"{current}\n\n{para}" if current else para
+    if current:
+        passages.append(current)
+    return passages
+
+
+@dataclass(frozen=True)
+class Passage:
+    """A chunk of an earlier loop's response."""
+
+    loop: int
+    text: str
+    score: float = 0.0
+
+
+class LoopMemory:
+    """
+    Append-only store of every loop response, chunked into passages and
+    indexed for BM25 retrieval.
+
+    Passages are persisted as JSON lines at *path* (next to the agent state)
+    so a resumed run remembers earlier loops; the inverted index is rebuilt
+    in memory on load.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        chunk_chars: int = 800,
+        error_logger: Optional[ErrorLogger] = None,
+        k1: float = 1.5,
+        b: float = 0.75,
+        model_name: Optional[str] = None,
+    ):
+        self.path = os.path.expanduser(path)
+        self.chunk_chars = chunk_chars
+        self.error_logger = error_logger
+        self.model_name = model_name  # calibrates recall budgets
+        self.k1 = k1
+        self.b = b
+        self._passages: List[Passage] = []
+        self._lengths: List[int] = []
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._total_length = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self._passages)
+
+    def add(self, loop: int, text: str) -> int:
+        """Chunk, persist and index *text* from *loop*; returns passages added."""
+        chunks = chunk_text(text, self.chunk_chars)
+        if not chunks:
+            return 0
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                for chunk in chunks:
+                    f.write(json.dumps({"loop": loop, "text": chunk}) + "\n")
+        except OSError as e:
+            if self.error_logger:
+                self.error_logger.log("WARNING", f"Could not persist loop memory to {self.path}", e)
+        with self._lock:
+            for chunk in chunks:
+                self._index(Passage(loop, chunk))
+        return len(chunks)
+
+    def search(
+        self, query: str, k: int, exclude_loops: Iterable[int] = ()
+    ) -> List[Passage]:
+        """Return up to *k* passages ranked by BM25 score against *query*."""
+        terms = set(tokenize(query))
+        excluded = set(exclude_loops)
+        with self._lock:
+            n = len(self._passages)
+            if not n or not terms:
+                return []
+            avg_len = self._total_length / n
+            scores: Dict[int, float] = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self._lengths[doc_id] / avg_len)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (
+                        tf + norm
+                    )
+            ranked = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+            results = []
+            for doc_id, score in ranked:
+                passage = self._passages[doc_id]
+                if passage.loop in excluded:
+                    continue
+                results.append(Passage(passage.loop, passage.text, score))
+                if len(results) >= k:
+                    break
+            return results
+
+    def recall(
+        self, query: str, budget_tokens: int, k: int, exclude_loops: Iterable[int] = ()
+    ) -> List[Passage]:
+        """Top-*k* passages for *query* that fit together in *budget_tokens*."""
+        selected: List[Passage] = []
+        used = 0
+        for passage in self.search(query, k, exclude_loops):
+            cost = count_tokens(passage.text, self.model_name)
+            if used + cost > budget_tokens:
+                continue
+            selected.append(passage)
+            used += cost
+        return selected
+
+    def _index(self, passage: Passage) -> None:
+        doc_id = len(self._passages)
+        terms = tokenize(passage.text)
+        self._passages.append(passage)
+        self._lengths.append(len(terms))
+        self._total_length += len(terms)
+        for term, tf in Counter(terms).items():
+            self._postings.setdefault(term, {})[doc_id] = tf
+
+    def _load(self) -> None:
+        if not os.path.isfile(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                        self._index(Passage(int(record["loop"]), str(record["text"])))
+                    except (ValueError, KeyError, TypeError):
+                        continue  # torn last line after a crash
+        except OSError as e:
+            if self.error_logger:
+                self.error_logger.log("WARNING", f"Could not load loop memory from {self.path}", e)
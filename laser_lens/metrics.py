@@ -0,0 +1,95 @@
+# metrics.py
+
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+
+@dataclass
+class LoopMetrics:
+    """
+    Timings for one agent loop, reported as the payload of the "metrics"
+    event. Stream figures (time to first token, duration, chunk and
+    character counts) describe the attempt that succeeded; ``retries``
+    counts the attempts before it.
+    """
+
+    loop: int
+    context_assembly_s: float = 0.0
+    prompt_build_s: float = 0.0
+    rate_limit_wait_s: float = 0.0
+    ttft_s: Optional[float] = None
+    stream_s: float = 0.0
+    chunks: int = 0
+    chars: int = 0
+    retries: int = 0
+    command_s: float = 0.0
+    commands: List[Tuple[str, float]] = field(default_factory=list)
+    segment_chars: Dict[str, int] = field(default_factory=dict)
+    request_chars: int = 0
+    budget: Dict[str, int] = field(default_factory=dict)
+    _attempt_start: float = field(default=0.0, repr=False)
+
+    def start_attempt(self) -> None:
+        """Reset stream figures at the start of a request attempt."""
+        self._attempt_start = time.perf_counter()
+        self.ttft_s = None
+        self.chunks = 0
+        self.chars = 0
+
+    def on_chunk(self, text: str) -> None:
+        if self.ttft_s is None:
+            self.ttft_s = time.perf_counter() - self._attempt_start
+        self.chunks += 1
+        self.chars += len(text)
+
+    def end_attempt(self) -> None:
+        self.stream_s = time.perf_counter() - self._attempt_start
+
+    def add_commands(self, timings: List[Tuple[int, str, float]], wall_s: float) -> None:
+        """Record per-command handler times (in marker order) and total wait."""
+        self.commands = [(name, secs) for _, name, secs in sorted(timings)]
+        self.command_s = wall_s
+
+    def as_dict(self) -> Dict[str, Any]:
+        """JSON-friendly view including derived throughput figures."""
+        stream_s = self.stream_s or 0.0
+        return {
+            "loop": self.loop,
+            "context_assembly_s": self.context_assembly_s,
+            "prompt_build_s": self.prompt_build_s,
+            "rate_limit_wait_s": self.rate_limit_wait_s,
+            "ttft_s": self.ttft_s,
+            "stream_s": stream_s,
+            "chunks": self.chunks,
+            "chars": self.chars,
+            "chunks_per_s": self.chunks / stream_s if stream_s > 0 else 0.0,
+            "chars_per_s": self.chars / stream_s if stream_s > 0 else 0.0,
+            "retries": self.retries,
+            "command_s": self.command_s,
+            "commands": [list(c) for c in self.commands],
+            "segment_chars": dict(self.segment_chars),
+            "request_chars": self.request_chars,
+            "budget": dict(self.budget),
+        }
+
+
+def format_metrics(metrics: Dict[str, Any]) -> str:
+    """One-line summary of a "metrics" event payload for logs and the CLI."""
+    ttft = metrics.get("ttft_s")
+    parts = [
+        f"loop {metrics.get('loop')}",
+        f"context {metrics.get('context_assembly_s', 0.0):.3f}s",
+        f"prompt {metrics.get('prompt_build_s', 0.0):.3f}s"
+        f" ({metrics.get('request_chars', 0)} chars sent)",
+        f"rate-limit wait {metrics.get('rate_limit_wait_s', 0.0):.2f}s",
+        f"ttft {ttft:.2f}s" if ttft is not None else "ttft n/a",
+        f"stream {metrics.get('stream_s', 0.0):.2f}s",
+        f"{metrics.get('chunks', 0)} chunks ({metrics.get('chars_per_s', 0.0):.0f} chars/s)",
+        f"retries {metrics.get('retries', 0)}",
+        f"commands {metrics.get('command_s', 0.0):.2f}s",
+    ]
+    slow = ", ".join(f"{name} {secs:.2f}s" for name, secs in metrics.get("commands", []))
+    if slow:
+        parts.append(f"[{slow}]")
+    return " | ".join(parts)
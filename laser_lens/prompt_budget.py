@@ -0,0 +1,108 @@
+# prompt_budget.py
+
+import threading
+from typing import Dict, Mapping, Optional
+
+from config import Config
+from error_logger import ErrorLogger
+from utils import count_tokens
+
+_TRUNCATION_MARKER = "\n...[truncated]...\n"
+
+# model name -> input token limit, or None when the lookup failed
+_limits: Dict[str, Optional[int]] = {}
+_limits_lock = threading.Lock()
+
+
+def model_input_limit(
+    model_name: str, config: Config, error_logger: Optional[ErrorLogger] = None
+) -> int:
+    """
+    Return *model_name*'s input token limit as reported by the Gemini API,
+    looked up once per process. Falls back to
+    ``config.default_input_token_limit`` when the lookup fails.
+    """
+    with _limits_lock:
+        known = model_name in _limits
+        limit = _limits.get(model_name)
+    if not known:
+        try:
+            import google.generativeai as genai
+
+            info = genai.get_model(model_name)  # type: ignore[attr-defined]
+            limit = int(info.input_token_limit)
+        except Exception as e:
+            if error_logger:
+                error_logger.log("DEBUG", f"No input token limit for {model_name}: {e}")
+        with _limits_lock:
+            _limits[model_name] = limit
+    return limit if limit is not None else config.default_input_token_limit
+
+
+def fit_to_budget(text: str, budget: int, model: Optional[str] = None) -> str:
+    """
+    Return *text* unchanged if it fits in *budget* tokens for *model*,
+    otherwise keep its head and tail around a truncation marker.
+    """
+    tokens = count_tokens(text, model)
+    if tokens <= budget:
+        return text
+    marker_tokens = count_tokens(_TRUNCATION_MARKER, model)
+    if budget <= marker_tokens:
+        return ""
+    # Budgets are in tokens; cut in characters at this text's density, then
+    # shrink if splitting words at the cut cost a few extra tokens
+    keep = int(len(text) * (budget - marker_tokens) / tokens) // 2
+    while True:
+        fitted = text[:keep] + _TRUNCATION_MARKER + text[len(text) - keep:]
+        if keep == 0 or count_tokens(fitted, model) <= budget:
+            return fitted
+        keep = keep * 9 // 10
+
+
+class BudgetPlanner:
+    """
+    Splits a prompt token budget across sections ("context", "last_thought",
+    "history", "tools").
+
+    Each section first receives up to its minimum; the rest of the budget is
+    shared out in proportion to the section weights. A section never gets
+    more than it needs, and whatever it leaves over is shared again among the
+    sections that still want more.
+    """
+
+    def __init__(self, weights: Mapping[str, float], minimums: Mapping[str, int]):
+        self.weights = dict(weights)
+        self.minimums = dict(minimums)
+
+    @classmethod
+    def from_config(cls, config: Config) -> "BudgetPlanner":
+        return cls(dict(config.budget_weights), dict(config.budget_minimums))
+
+    def plan(self, total: int, needs: Mapping[str, int]) -> Dict[str, int]:
+        """Return the tokens allotted to each section of *needs* out of *total*."""
+        total = max(0, total)
+        alloc = {s: min(need, self.minimums.get(s, 0)) for s, need in needs.items()}
+        reserved = sum(alloc.values())
+        if reserved > total:
+            # Not even the minimums fit: scale them down together
+            scale = total / reserved
+            return {s: int(a * scale) for s, a in alloc.items()}
+
+        remaining = total - reserved
+        active = {s for s in needs if needs[s] > alloc[s] and self.weights.get(s, 0) > 0}
+        while remaining > 0 and active:
+            weight_sum = sum(self.weights[s] for s in active)
+            spent = 0
+            satisfied = set()
+            for s in active:
+                give = min(int(remaining * self.weights[s] / weight_sum), needs[s] - alloc[s])
+                alloc[s] += give
+                spent += give
+                if alloc[s] >= needs[s]:
+                    satisfied.add(s)
+            remaining -= spent
+            if not satisfied:
+                break
+            active -= satisfied
+        return alloc
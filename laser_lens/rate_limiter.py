@@ -0,0 +1,140 @@
+# rate_limiter.py
+
+import hashlib
+import json
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+from config import Config
+from error_logger import ErrorLogger
+
+try:  # POSIX
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None  # type: ignore[assignment]
+    import msvcrt
+
+
+class TokenBucketLimiter:
+    """
+    Request-per-minute and token-per-minute budgets shared by every process on
+    this host that uses the same API key.
+
+    Bucket levels live in a small JSON file under ``config.rate_limit_dir``
+    named after a hash of the key and guarded by an exclusive lock file. Each
+    call to :meth:`reserve` refills both buckets for the elapsed time, takes
+    the request's cost and returns how long the caller must wait before
+    sending. Levels may go negative, which queues later callers behind
+    earlier reservations instead of letting them race.
+    """
+
+    def __init__(
+        self,
+        config: Config,
+        api_key: Optional[str],
+        rpm: int,
+        tpm: Optional[int] = None,
+        error_logger: Optional[ErrorLogger] = None,
+    ):
+        self.rpm = max(1, int(rpm))
+        self.tpm = int(tpm) if tpm else None
+        self.burst = max(1, config.rate_limit_burst)
+        self.error_logger = error_logger
+
+        digest = hashlib.sha256((api_key or "default").encode("utf-8")).hexdigest()[:16]
+        state_dir = os.path.expanduser(config.rate_limit_dir)
+        self.state_path = os.path.join(state_dir, f"{digest}.json")
+        self.lock_path = self.state_path + ".lock"
+        try:
+            os.makedirs(state_dir, exist_ok=True)
+            self._shared = True
+        except OSError as e:
+            self._warn("Rate limit dir unavailable; limiting this process only", e)
+            self._shared = False
+        # Used when the shared files cannot be accessed
+        self._local: Dict[str, float] = {}
+
+    def reserve(self, tokens: int = 0) -> float:
+        """Take one request and *tokens* prompt tokens; return seconds to wait."""
+        if self._shared:
+            try:
+                with self._locked():
+                    state = self._load()
+                    wait = self._take(state, tokens)
+                    self._store(state)
+                return wait
+            except OSError as e:
+                self._warn("Shared rate limit state failed; limiting this process only", e)
+                self._shared = False
+        return self._take(self._local, tokens)
+
+    def peek(self, tokens: int = 0) -> float:
+        """Return the wait :meth:`reserve` would impose, without taking capacity."""
+        state = dict(self._load() if self._shared else self._local)
+        return self._take(state, tokens)
+
+    def acquire(self, tokens: int = 0) -> float:
+        """Reserve capacity and sleep until it is available. Returns the wait."""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def _take(self, state: Dict[str, float], tokens: int) -> float:
+        now = time.time()
+        elapsed = max(0.0, now - state.get("ts", now))
+        req_rate = self.rpm / 60.0
+        requests = min(self.burst, state.get("requests", self.burst) + elapsed * req_rate)
+        requests -= 1
+        wait = -requests / req_rate if requests < 0 else 0.0
+        state["requests"] = requests
+
+        if self.tpm:
+            tok_rate = self.tpm / 60.0
+            level = min(self.tpm, state.get("tokens", self.tpm) + elapsed * tok_rate)
+            # A prompt larger than the whole budget can only wait for a full bucket
+            level -= min(tokens, self.tpm)
+            if level < 0:
+                wait = max(wait, -level / tok_rate)
+            state["tokens"] = level
+
+        state["ts"] = now
+        return wait
+
+    def _load(self) -> Dict[str, float]:
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def _store(self, state: Dict[str, float]) -> None:
+        tmp_path = f"{self.state_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_path)
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        with open(self.lock_path, "a+") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+            else:  # pragma: no cover - Windows
+                lock.seek(0)
+                msvcrt.locking(lock.fileno(), msvcrt.LK_LOCK, 1)
+                try:
+                    yield
+                finally:
+                    lock.seek(0)
+                    msvcrt.locking(lock.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _warn(self, message: str, exc: Exception) -> None:
+        if self.error_logger:
+            self.error_logger.log("WARNING", message, exc)
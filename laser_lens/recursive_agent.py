@@ -1,19 +1,84 @@
 # recursive_agent.py
 
+import asyncio
 import os
+import random
 import time
 import tempfile
 from collections import deque
-from typing import Any, Generator, Optional, Tuple
+from dataclasses import dataclass, field
+from typing import (
+    Any,
+    AsyncGenerator,
+    AsyncIterator,
+    Dict,
+    Generator,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
 
 import google.generativeai as genai
 
 from config import Config
 from error_logger import ErrorLogger
-from command_executor import CommandExecutor
+from command_executor import CommandExecutor, CommandTiming
 from context_manager import ContextManager
 from output_manager import OutputManager
 from agent_state import AgentState
+from rate_limiter import TokenBucketLimiter
+from api_key_pool import ApiKeyPool, PooledKey
+from response_cache import ResponseCache
+from hedging import get_tracker, hedged_aiter, hedged_iter
+from stream_watchdog import watched_aiter, watched_iter
+from adaptive_rate import AdaptiveRateController, CircuitBreaker, CircuitOpenError
+from streaming_commands import StreamingCommandDispatcher
+from tmp_writer import BackgroundTmpWriter
+from metrics import LoopMetrics, format_metrics
+from tracing import NullTracer, Tracer, get_tracer, set_current_track
+from loop_memory import LoopMemory, memory_path
+from context_index import ContextIndex, available as context_index_available
+from prompt_budget import BudgetPlanner, fit_to_budget, model_input_limit
+from utils import count_tokens
+
+
+_THINKING_INSTRUCTIONS = (
+    "You are 'Laser Lens', a recursive reasoning agent. "
+    "Discuss the topic and iteratively refine your thoughts. "
+    "All responses appear directly in chat."
+)
+
+_SANDBOX_INSTRUCTIONS = """\
+You are a “Laser Lens” recursive agent operating inside a limited OS sandbox.
+This directory is your sandboxed writable workspace.
+You can inspect available functionality using [[COMMAND: HELP]].
+Use `outputs/GEMINIOUTPUT.md` to leave notes for the developer and read their replies from `outputs/GEMINIINPUT.md`.
+Capabilities:
+  • When you embed text of the form [[COMMAND: <NAME> key="value" …]],
+    the CLI/UI will invoke a Python function named <NAME>(…) with those arguments.
+    Your handler functions can perform file I/O, run shell commands, or anything
+    that our CommandExecutor supports, then return a result that will be visible 
+    to you in a subsequent loop.
+
+  • You can rely on “uploaded context” (Markdown or TXT files) or on a .tmp stream
+    (partial outputs from prior loops). Any previous “.tmp” chunks have already been
+    merged into the `context_str` below.
+
+  • After you stream your response each loop, your full text is stored in “history”
+    and available to you as your “last_thought” in the next loop.
+
+  • If you wish to halt the recursion early, emit `[[COMMAND: CANCEL reason="your reason here"]]` or `[[COMMAND: PAUSE reason="your reason here"]]`.
+    The surrounding code will interpret these commands, using your provided reason, and will either stop or pause execution accordingly.
+
+  • At the end of all loops, the CLI/UI will assemble your prompts/responses into a 
+    Markdown summary and save it to disk.
+"""
+
+
+# Phrases in a 429 message that mark a per-minute limit, not an exhausted quota
+_PER_MINUTE_MARKERS = ("per minute", "perminute", "per_minute")
 
 
 class CancelledException(Exception):
@@ -22,6 +87,21 @@ class CancelledException(Exception):
     pass
 
 
+@dataclass
+class _LoopRequest:
+    """One loop's request and retry state, shared by the sync and async loops."""
+
+    prompt: str
+    cached: Optional[List[str]]  # replayed instead of calling the API
+    dispatcher: Optional[StreamingCommandDispatcher]
+    backoff: float
+    retry_count: int = 0
+    chunks: List[str] = field(default_factory=list)
+    response: Optional[str] = None
+    attempt_span: Any = None
+    tmp_mark: Optional[int] = None  # tmp file size when the attempt started
+
+
 class RecursiveAgent:
     """
     Production-ready RecursiveAgent that streams from a Gemini/GenAI client,
@@ -30,10 +110,25 @@ class RecursiveAgent:
     Yields tuples of (event_type, loop_index, total_loops, payload):
       - "chunk": payload is a non-empty str (partial text).
       - "loop_end": payload is the full_response (str) for that loop.
+      - "retry": payload is (message: str, exception: Exception); the chunks
+        streamed so far in this loop are void and will be sent again.
       - "error": payload is (message: str, exception: Exception).
 
+    :meth:`run_async` yields the same tuples from an async generator so many
+    agents can share one event loop.
+
     Set *thinking_mode* to ``True`` to remove OS sandbox instructions from the
     system prompt, turning the agent into a chat-only assistant.
+
+    Pass a *key_pool* to spread requests over several API keys; a quota error
+    then rotates to another healthy key instead of stopping the run. A
+    *response_cache* (or ``config.response_cache_enabled``) replays identical
+    requests from disk as the same chunk stream. With
+    ``config.hedge_requests`` a duplicate request races any stream whose first
+    chunk is slower than the recent time-to-first-token percentile.
+    An AIMD *rate_controller* slows requests after 429/503 responses and a
+    *circuit_breaker* fails fast while errors persist; pass shared instances
+    to let several agents learn together.
     """
 
     def __init__(
@@ -52,6 +147,11 @@ class RecursiveAgent:
         rpm: int,
         api_key: Optional[str] = None,
         thinking_mode: bool = False,
+        tpm: Optional[int] = None,
+        key_pool: Optional[ApiKeyPool] = None,
+        response_cache: Optional[ResponseCache] = None,
+        rate_controller: Optional[AdaptiveRateController] = None,
+        circuit_breaker: Optional[CircuitBreaker] = None,
     ):
         self.config = config
         self.error_logger = error_logger
@@ -62,6 +162,7 @@ class RecursiveAgent:
 
         # Core parameters
         self.model_name = model_name
+        context_manager.set_model(model_name)
         self.topic = topic
         self.loops = loops
         self.temperature = temperature
@@ -105,13 +206,67 @@ class RecursiveAgent:
             self.agent_state.update_state("tmp_path", tmp.name)
             self.agent_state.save_state()
 
-        # Rate limiting state
-        self._last_request_ts = 0.0
+        self._tmp_writer = BackgroundTmpWriter(
+            self.tmp_file,
+            error_logger,
+            durability=config.tmp_durability,
+            interval_ms=config.tmp_flush_interval_ms,
+            max_batch_bytes=config.tmp_batch_bytes,
+        )
+
+        # Rate limiting shared with other agents/processes using this key.
+        # With a key pool each pooled key carries its own limiter instead.
+        self.tpm = tpm if tpm is not None else config.default_tpm
+        self.key_pool = key_pool
+        self.rate_limiter: Optional[TokenBucketLimiter] = None
+        if key_pool is None:
+            self.rate_limiter = TokenBucketLimiter(
+                config, api_key, rpm, self.tpm, error_logger=error_logger
+            )
+        self._active_key: Optional[PooledKey] = None
+        self._metrics = LoopMetrics(loop=self.current_loop)
+        self._bound_key = api_key
+
+        # Adaptive rate and fail-fast on sustained errors; may be shared
+        self.rate_controller = rate_controller or AdaptiveRateController(config, rpm)
+        self.circuit_breaker = circuit_breaker or CircuitBreaker(config)
+        # True between an allowed attempt and its recorded outcome
+        self._outcome_pending = False
+
+        # Optional replay of identical requests; may be shared between agents
+        if response_cache is None and config.response_cache_enabled:
+            response_cache = ResponseCache(
+                config.response_cache_dir, config.response_cache_max_bytes, error_logger
+            )
+        self.response_cache = response_cache
+
+        # Time-to-first-token samples shared by agents using the same model
+        self._ttft_tracker = get_tracker(model_name, config.hedge_window)
+
+        # Context text cached per ContextManager.version, and its formatted
+        # segment per (version, budget share)
+        self._context_cache: Optional[Tuple[int, str]] = None
+        self._context_segment_cache: Optional[Tuple[int, Optional[int], Optional[str], str]] = None
+        # TF-IDF chunk index of the context, rebuilt when the version changes
+        self._context_index: Optional[Tuple[int, ContextIndex]] = None
+        self._budget_planner = BudgetPlanner.from_config(config)
+
+        # Every loop response, searchable across the whole run (and resumes)
+        self.memory: Optional[LoopMemory] = None
+        if config.loop_memory_enabled:
+            self.memory = LoopMemory(
+                memory_path(agent_state.state_dir),
+                config.memory_chunk_chars,
+                error_logger,
+                model_name=model_name,
+            )
+        self._system_in_client = False
 
         # Instantiate Gemini/GenAI client using the official SDK
         try:
-            genai.api_key = api_key  # type: ignore[attr-defined]
-            self.client = genai.GenerativeModel(self.model_name)  # type: ignore[attr-defined]
+            if key_pool is None:
+                genai.api_key = api_key  # type: ignore[attr-defined]
+            self.client = self._new_client()
         except Exception as e:
             self.error_logger.log(
                 "ERROR",
@@ -120,198 +275,672 @@ class RecursiveAgent:
             )
             raise
 
-    def _build_prompt(self, context_str: str) -> str:
-        """
-        Assemble the prompt by concatenating:
-          1. A brief “system” section describing available tools and file formats
-          2. Any uploaded context
-          3. Recursive instructions for this loop
-          4. The last thought, if present
-        """
-        # 1) The “system” or “instruction” block:
-        if self.thinking_mode:
-            tool_instructions = (
-                "You are 'Laser Lens', a recursive reasoning agent. "
-                "Discuss the topic and iteratively refine your thoughts. "
-                "All responses appear directly in chat."
-            )
-        else:
-            tool_instructions = """\
-You are a “Laser Lens” recursive agent operating inside a limited OS sandbox.
-This directory is your sandboxed writable workspace.
-You can inspect available functionality using [[COMMAND: HELP]].
-Use `outputs/GEMINIOUTPUT.md` to leave notes for the developer and read their replies from `outputs/GEMINIINPUT.md`.
-Capabilities:
-  • When you embed text of the form [[COMMAND: <NAME> key="value" …]],
-    the CLI/UI will invoke a Python function named <NAME>(…) with those arguments.
-    Your handler functions can perform file I/O, run shell commands, or anything
-    that our CommandExecutor supports, then return a result that will be visible 
-    to you in a subsequent loop.
-
-  • You can rely on “uploaded context” (Markdown or TXT files) or on a .tmp stream
-    (partial outputs from prior loops). Any previous “.tmp” chunks have already been
-    merged into the `context_str` below.
-
-  • After you stream your response each loop, your full text is stored in “history”
-    and available to you as your “last_thought” in the next loop.
-
-  • If you wish to halt the recursion early, emit `[[COMMAND: CANCEL reason="your reason here"]]` or `[[COMMAND: PAUSE reason="your reason here"]]`.
-    The surrounding code will interpret these commands, using your provided reason, and will either stop or pause execution accordingly.
-
-  • At the end of all loops, the CLI/UI will assemble your prompts/responses into a 
-    Markdown summary and save it to disk.
-"""
+    def _system_segment(self) -> str:
+        """Static tool/format instructions; identical on every loop."""
+        return _THINKING_INSTRUCTIONS if self.thinking_mode else _SANDBOX_INSTRUCTIONS
 
-        # 2) Any uploaded context
+    @staticmethod
+    def _format_context(context_str: str) -> str:
+        """Uploaded-context segment as it follows the system segment."""
         if context_str:
-            combined = tool_instructions + "\n---\n" + context_str + "\n\n"
-        else:
-            combined = tool_instructions + "\n"
+            return "\n---\n" + context_str + "\n\n"
+        return "\n"
 
-        # 3) Recursive instructions for this loop
+    def _loop_segment(self, plan: Optional[Dict[str, int]] = None) -> str:
+        """
+        Per-loop segment: recursive instructions, the last thought, recent
+        history and the previous loop's tool outputs. With a budget *plan*
+        each part is filled to its share; otherwise history snippets are cut
+        at 200 chars and tool outputs at 500.
+        """
         header = f"You are a recursive agent analyzing: {self.topic}\n"
         header += f"Loop {self.current_loop} of {self.loops}. "
         header += "Decide whether to expand on your previous thought or to summarize.\n"
 
-        # 4) Include last_thought if present
+        # Include last_thought if present
         if self.last_thought:
-            header += f"Your last thought:\n{self.last_thought}\n\n"
-        prompt_parts = [combined + header]
+            thought = self.last_thought
+            if plan is not None:
+                thought = fit_to_budget(thought, plan["last_thought"], self.model_name)
+            header += f"Your last thought:\n{thought}\n\n"
+        prompt_parts = [header]
 
         # Include recent history
         if self.history:
-            history_snippets = "\n".join(
-                f"- {h['response'][:200]}" for h in list(self.history)
-            )
+            entries = list(self.history)
+            if plan is not None:
+                per_entry = plan["history"] // len(entries)
+                snippets = [
+                    fit_to_budget(h["response"], per_entry, self.model_name) for h in entries
+                ]
+            else:
+                snippets = [h["response"][:200] for h in entries]
+            history_snippets = "\n".join(f"- {snip}" for snip in snippets)
             prompt_parts.append(f"\n\n## Recent History\n{history_snippets}")
 
+        # Include passages from earlier loops relevant to the topic and last thought
+        if self.memory is not None:
+            budget = plan["memory"] if plan is not None else self.config.memory_budget_tokens
+            passages = self.memory.recall(
+                self._memory_query(), budget, self.config.memory_top_k, self._recent_loops()
+            )
+            if passages:
+                memory_lines = "\n".join(f"- (loop {p.loop}) {p.text}" for p in passages)
+                prompt_parts.append(f"\n\n## Relevant Memory\n{memory_lines}")
+
         # Include tool outputs from previous loop
         results = self.agent_state.get_state("command_results") or []
         if results:
+            per_result = plan["tools"] // len(results) if plan is not None else None
             tool_lines = []
             for idx, (name, result) in enumerate(results, start=1):
-                snippet = str(result)[:500]
+                if per_result is not None:
+                    snippet = fit_to_budget(str(result), per_result, self.model_name)
+                else:
+                    snippet = str(result)[:500]
                 tool_lines.append(f"\u2022 {idx}. {name}: {snippet}")
             prompt_parts.append("\n\n## Tool Outputs\n" + "\n".join(tool_lines))
 
-        prompt = "".join(prompt_parts)
-        if self.error_logger:
-            self.error_logger.log("DEBUG", f"prompt length {len(prompt)} chars")
-        return prompt
+        return "".join(prompt_parts)
+
+    def _relevance_enabled(self) -> bool:
+        return self.config.context_relevance_enabled and context_index_available()
+
+    def _relevance_share(self, share: int) -> int:
+        """Tokens filled by relevance selection: the share, at most Config.max_context_tokens."""
+        return min(share, self.config.max_context_tokens)
+
+    def _relevance_query(self, context_str: str, share: Optional[int]) -> Optional[str]:
+        """
+        Query used to pick context chunks when the stored context (counting
+        uploads cut to head and tail at their full size) is over its capped
+        *share*, or ``None`` when it fits or head/tail truncation applies.
+        """
+        if share is None or not self._relevance_enabled():
+            return None
+        stored = count_tokens(context_str, self.model_name)
+        if self.context_manager.has_originals:
+            stored = max(stored, self.context_manager.source_tokens)
+        if stored <= self._relevance_share(share):
+            return None
+        return self._memory_query()
+
+    def _fit_context(self, context_str: str, share: Optional[int], query: Optional[str]) -> str:
+        """Cut the context to *share* tokens by relevance to *query* or by head and tail."""
+        if share is None:
+            return context_str
+        if query is None:
+            return fit_to_budget(context_str, share, self.model_name)
+        version = self.context_manager.version
+        if self._context_index is None or self._context_index[0] != version:
+            index = ContextIndex(
+                self.context_manager.sources(),
+                self.config.default_prompt_delim,
+                self.config.context_chunk_chars,
+                self.model_name,
+            )
+            self._context_index = (version, index)
+        return self._context_index[1].select(query, self._relevance_share(share))
+
+    def _memory_query(self) -> str:
+        """Retrieval query for loop memory: the topic plus the last thought."""
+        return f"{self.topic}\n{self.last_thought or ''}"
+
+    def _recent_loops(self) -> List[int]:
+        """Loops already in the prompt through history, skipped by memory recall."""
+        return list(range(self.current_loop - len(self.history), self.current_loop))
+
+    def _plan_budget(self, context_str: str) -> Optional[Dict[str, int]]:
+        """
+        Split the model's input budget across the prompt sections, after
+        reserving the (fixed) system segment. Returns ``None`` when the
+        planner is disabled.
+        """
+        if not self.config.prompt_budget_enabled:
+            return None
+        limit = model_input_limit(self.model_name, self.config, self.error_logger)
+        total = int(limit * self.config.prompt_budget_fraction)
+        total -= count_tokens(self._system_segment(), self.model_name)
+        results = self.agent_state.get_state("command_results") or []
+        context_need = count_tokens(context_str, self.model_name)
+        if self._relevance_enabled():
+            # Relevance selection can reach text cut from the stored buffers,
+            # but never fills more than the context limit
+            context_need = max(
+                context_need,
+                min(self.context_manager.source_tokens, self.config.max_context_tokens),
+            )
+        needs = {
+            "context": context_need,
+            "last_thought": count_tokens(self.last_thought or "", self.model_name),
+            "history": sum(count_tokens(h["response"], self.model_name) for h in self.history),
+            "tools": sum(count_tokens(str(r), self.model_name) for _, r in results),
+        }
+        if self.memory is not None:
+            candidates = self.memory.search(
+                self._memory_query(), self.config.memory_top_k, self._recent_loops()
+            )
+            needs["memory"] = sum(count_tokens(p.text, self.model_name) for p in candidates)
+        return self._budget_planner.plan(total, needs)
 
     def run(self) -> Generator[Tuple[str, int, int, Any], None, None]:
         """
         Execute recursive loops with retry handling. Yields:
           - ("chunk", loop_index, total_loops, text)
+          - ("metrics", loop_index, total_loops, LoopMetrics.as_dict())
+            just before each "loop_end"
           - ("loop_end", loop_index, total_loops, full_response)
+          - ("retry", loop_index, total_loops, (message, exception)) when an
+            attempt failed and is retried; discard the loop's chunks so far
           - ("error", loop_index, total_loops, (message, exception))
-        If an error message contains "503" and "overloaded", the retry wait is
-        fixed at 10 seconds before trying again.
+        Retry waits grow exponentially with jitter; overload responses
+        (429/503) start from ``config.overload_backoff_seconds`` and also slow
+        the adaptive request rate. While the circuit breaker is open the loop
+        fails fast with an "error" event.
+        """
+        total_loops = self.loops
+        tracer = self._start_trace()
+
+        while self.current_loop <= total_loops:
+            if self.cancelled:
+                break
+
+            loop_span = tracer.begin("loop", loop=self.current_loop)
+            request = self._begin_request()
+            try:
+                with tracer.span("rate_limit_wait"):
+                    time.sleep(self._request_delay(request))
+
+                # Retry loop: catch any Exception from the streaming call
+                while request.retry_count <= self.config.max_retries:
+                    err_payload = self._check_attempt(request)
+                    if err_payload is not None:
+                        yield ("error", self.current_loop, total_loops, err_payload)
+                        return
+                    try:
+                        self._begin_attempt(request)
+                        for text in self._stream_generation(request.prompt, request.cached):
+                            if self._accept_chunk(request, text):
+                                yield ("chunk", self.current_loop, total_loops, text)
+                        self._attempt_succeeded(request)
+                        break
+                    except CancelledException:
+                        self._attempt_cancelled(request)
+                        return
+                    except Exception as e:
+                        err_payload, delay, span = self._attempt_failed(request, e)
+                        if err_payload is not None:
+                            yield ("error", self.current_loop, total_loops, err_payload)
+                            return
+                        yield ("retry", self.current_loop, total_loops, (str(e), e))
+                        with tracer.span(span, seconds=delay):
+                            time.sleep(delay)
+                    finally:
+                        self._abandon_attempt()
+
+                full_response = self._finish_request(request)
+                with tracer.span("commands"):
+                    self._execute_commands(full_response, request.dispatcher)
+            finally:
+                self._close_request(request)
+
+            # Report timings, then signal end of loop
+            yield ("metrics", self.current_loop, total_loops, self._report_metrics())
+            yield ("loop_end", self.current_loop, total_loops, full_response)
+            tracer.end(loop_span)
+
+            self._advance_loop()
+            if self.paused:
+                break
+
+        self._finish_run(total_loops)
+
+    async def run_async(self) -> AsyncGenerator[Tuple[str, int, int, Any], None]:
+        """
+        Async counterpart of :meth:`run` yielding the same event tuples.
+
+        Rate-limit and backoff waits use ``asyncio.sleep`` and the response is
+        consumed through the client's ``generate_content_async`` stream when
+        available. Embedded commands run in a worker thread so a slow ``EXEC``
+        does not stall other agents sharing the event loop. Every retry
+        decision is made by the same helpers as :meth:`run`.
         """
         total_loops = self.loops
+        tracer = self._start_trace()
 
         while self.current_loop <= total_loops:
             if self.cancelled:
                 break
 
-            # Build prompt with any uploaded context
-            context_str = self.context_manager.get_context()
+            loop_span = tracer.begin("loop", loop=self.current_loop)
+            request = self._begin_request()
+            try:
+                with tracer.span("rate_limit_wait"):
+                    await asyncio.sleep(self._request_delay(request))
+
+                while request.retry_count <= self.config.max_retries:
+                    err_payload = self._check_attempt(request)
+                    if err_payload is not None:
+                        yield ("error", self.current_loop, total_loops, err_payload)
+                        return
+                    try:
+                        self._begin_attempt(request)
+                        async for text in self._stream_generation_async(
+                            request.prompt, request.cached
+                        ):
+                            if self._accept_chunk(request, text):
+                                yield ("chunk", self.current_loop, total_loops, text)
+                        self._attempt_succeeded(request)
+                        break
+                    except CancelledException:
+                        self._attempt_cancelled(request)
+                        return
+                    except Exception as e:
+                        err_payload, delay, span = self._attempt_failed(request, e)
+                        if err_payload is not None:
+                            yield ("error", self.current_loop, total_loops, err_payload)
+                            return
+                        yield ("retry", self.current_loop, total_loops, (str(e), e))
+                        with tracer.span(span, seconds=delay):
+                            await asyncio.sleep(delay)
+                    finally:
+                        self._abandon_attempt()
+
+                full_response = self._finish_request(request)
+                with tracer.span("commands"):
+                    await asyncio.to_thread(
+                        self._execute_commands, full_response, request.dispatcher
+                    )
+            finally:
+                self._close_request(request)
+
+            yield ("metrics", self.current_loop, total_loops, self._report_metrics())
+            yield ("loop_end", self.current_loop, total_loops, full_response)
+            tracer.end(loop_span)
+
+            self._advance_loop()
+            if self.paused:
+                break
+
+        self._finish_run(total_loops)
+
+    def _begin_request(self) -> _LoopRequest:
+        """Build this loop's prompt and look it up in the response cache."""
+        prompt = self._prepare_prompt()
+        return _LoopRequest(
+            prompt=prompt,
+            cached=self._cached_response(prompt),
+            dispatcher=self._new_command_dispatcher(),
+            backoff=self.config.backoff_base_seconds,
+        )
+
+    def _request_delay(self, request: _LoopRequest) -> float:
+        """
+        Seconds to wait before sending *request*. A cached response is
+        replayed without touching the API, so it skips the rate limiter.
+        """
+        if request.cached is not None:
+            return 0.0
+        return self._rate_limit_delay(request.prompt)
+
+    def _check_attempt(self, request: _LoopRequest) -> Optional[Tuple[str, Exception]]:
+        """
+        Ask the circuit breaker whether the next attempt may be sent. On a
+        rejection the pooled key is released and an error payload returned.
+        """
+        if request.cached is not None:
+            return None
+        err_payload = self._check_circuit()
+        if err_payload is not None:
+            self._release_active_key(success=False)
+            self._tmp_writer.sync()
+        return err_payload
+
+    def _begin_attempt(self, request: _LoopRequest) -> None:
+        """Start an attempt on the pooled key chosen for this request."""
+        request.attempt_span = get_tracer().begin(
+            "attempt", attempt=request.retry_count + 1
+        )
+        request.chunks = []
+        request.tmp_mark = self._tmp_writer.mark()
+        self._bind_active_key()
+        self._metrics.start_attempt()
+
+    def _accept_chunk(self, request: _LoopRequest, text: str) -> bool:
+        """Record a streamed chunk; return False for blank chunks not to emit."""
+        if not text or not text.strip():
+            return False
+        self._metrics.on_chunk(text)
+        if request.dispatcher is not None:
+            request.dispatcher.feed(text)
+        request.chunks.append(text)
+        return True
+
+    def _attempt_succeeded(self, request: _LoopRequest) -> None:
+        """Keep the streamed response and report the success."""
+        request.response = "".join(request.chunks)
+        self._metrics.end_attempt()
+        get_tracer().end(request.attempt_span, ok=True)
+        if request.cached is None:
+            self._record_outcome(None)
+
+    def _attempt_cancelled(self, request: _LoopRequest) -> None:
+        """Graceful cancellation by the user."""
+        get_tracer().end(request.attempt_span, cancelled=True)
+        self._release_active_key(success=False)
+        self._tmp_writer.sync()
+        self.agent_state.save_state()
+
+    def _attempt_failed(
+        self, request: _LoopRequest, exc: Exception
+    ) -> Tuple[Optional[Tuple[str, Exception]], float, str]:
+        """
+        Decide what follows a failed attempt. Returns ``(error_payload,
+        delay, span_name)``: a payload means the run stops; otherwise the
+        attempt's text is cut from the tmp file and the caller yields a
+        "retry" event, waits *delay* seconds under *span_name* and tries again.
+        """
+        get_tracer().end(request.attempt_span, error=str(exc))
+        self._metrics.retries += 1
+        if request.cached is None:
+            self._record_outcome(exc)
+        if request.dispatcher is not None:
+            request.dispatcher.reset()
+        if self._rotate_key(exc):
+            self._tmp_writer.rewind(request.tmp_mark)
+            return None, self._rate_limit_delay(request.prompt), "rate_limit_wait"
+        request.retry_count += 1
+        err_payload = self._handle_stream_error(exc, request.retry_count)
+        if err_payload is not None:
+            self._release_active_key(success=False)
+            self._tmp_writer.sync()
+            return err_payload, 0.0, ""
+        self._tmp_writer.rewind(request.tmp_mark)
+        delay, request.backoff = self._retry_delay(exc, request.backoff)
+        return None, delay, "backoff"
+
+    @staticmethod
+    def _close_request(request: _LoopRequest) -> None:
+        """
+        Shut down the loop's command dispatcher, also when the loop ended
+        early (error, cancel, or the consumer stopped iterating), so its
+        threads and in-flight read-only commands never outlive the loop.
+        """
+        if request.dispatcher is not None:
+            request.dispatcher.close()
+
+    def _finish_request(self, request: _LoopRequest) -> str:
+        """Release the pooled key and record the loop's response."""
+        self._release_active_key(success=request.response is not None)
+        full_response = request.response or ""
+        self._record_response(request.prompt, full_response)
+        return full_response
+
+    def _start_trace(self) -> Union[Tracer, NullTracer]:
+        """Give this run its own trace track and return the active tracer."""
+        tracer = get_tracer()
+        set_current_track(tracer.new_track(f"agent: {self.topic[:40]}"))
+        return tracer
+
+    def _prepare_prompt(self) -> str:
+        """
+        Build this loop's request text from segments. The context segment is
+        reused until the ContextManager's contents change, and the system
+        segment is left out when the client already carries it as its system
+        instruction.
+        """
+        self._metrics = LoopMetrics(loop=self.current_loop)
+        tracer = get_tracer()
+        start = time.perf_counter()
+        version = self.context_manager.version
+        cached_context = self._context_cache
+        if cached_context is None or self.context_manager.changed_since(cached_context[0]):
+            with tracer.span("get_context"):
+                context_str = self.context_manager.get_context()
             if self.error_logger:
                 self.error_logger.log(
                     "DEBUG",
                     f"loop {self.current_loop}: context length {len(context_str)}",
                 )
-            prompt = self._build_prompt(context_str)
+            self._context_cache = (version, context_str)
+        context_str = self._context_cache[1]
+        self._metrics.context_assembly_s = time.perf_counter() - start
 
-            # Enforce rate limiting
-            self._enforce_rate_limit()
+        start = time.perf_counter()
+        with tracer.span("build_prompt"):
+            plan = self._plan_budget(context_str)
+            context_share = plan["context"] if plan is not None else None
+            query = self._relevance_query(context_str, context_share)
+            key = (version, context_share, query)
+            cached = self._context_segment_cache
+            if cached is None or cached[:3] != key:
+                fitted = self._fit_context(context_str, context_share, query)
+                cached = key + (self._format_context(fitted),)
+                self._context_segment_cache = cached
+            context_segment = cached[3]
+            system_segment = self._system_segment()
+            loop_segment = self._loop_segment(plan)
+            if self._system_in_client:
+                prompt = (context_segment + loop_segment).lstrip()
+            else:
+                prompt = system_segment + context_segment + loop_segment
+        self._metrics.prompt_build_s = time.perf_counter() - start
+        self._metrics.segment_chars = {
+            "system": len(system_segment),
+            "context": len(context_segment),
+            "loop": len(loop_segment),
+        }
+        self._metrics.request_chars = len(prompt)
+        self._metrics.budget = dict(plan or {})
+        if self.error_logger:
+            self.error_logger.log(
+                "DEBUG",
+                f"prompt segments {self._metrics.segment_chars}; "
+                f"{len(prompt)} chars sent"
+                + (" (system instruction separate)" if self._system_in_client else ""),
+            )
+        return prompt
 
-            full_response: Optional[str] = None
-            retry_count = 0
-            backoff = self.config.backoff_base_seconds
+    def _new_client(self) -> Any:
+        """
+        Create the Gemini client, passing the system segment as its system
+        instruction when enabled and supported by the SDK. With a key pool the
+        client is bound to the pooled key currently in use.
+        """
+        client = None
+        if self.config.use_system_instruction:
+            try:
+                client = genai.GenerativeModel(  # type: ignore[attr-defined]
+                    self.model_name, system_instruction=self._system_segment()
+                )
+                self._system_in_client = True
+            except TypeError:
+                # Older SDKs have no system_instruction; send it inline instead
+                pass
+        if client is None:
+            self._system_in_client = False
+            client = genai.GenerativeModel(self.model_name)  # type: ignore[attr-defined]
+        if self.key_pool is not None and self._bound_key:
+            self._use_key(client, self._bound_key)
+        return client
 
-            # Retry loop: catch any Exception from the streaming call
-            while retry_count <= self.config.max_retries:
-                try:
-                    # Stream-and-collect the full response
-                    chunks = []
-                    for text in self._stream_generation(prompt):
-                        if text and text.strip():
-                            yield ("chunk", self.current_loop, total_loops, text)
-                            chunks.append(text)
-                    full_response = "".join(chunks)
-                    break
-                except CancelledException:
-                    # Graceful cancellation by user
-                    self.agent_state.save_state()
-                    return
-                except Exception as e:
-                    if self._is_quota_error(e):
-                        msg = "API quota limit reached. Stopping agent."
-                        self.error_logger.log("ERROR", msg, e)
-                        err_payload = (msg, e)
-                        yield ("error", self.current_loop, total_loops, err_payload)
-                        return
+    @staticmethod
+    def _use_key(client: Any, api_key: str) -> None:
+        """
+        Give *client* its own service transport authenticated with *api_key*.
+        ``genai.configure`` would switch the key for every agent in the
+        process, so pooled keys are passed as client options instead.
+        """
+        from google.ai import generativelanguage as glm
 
-                    retry_count += 1
-                    msg = (
-                        f"Error on loop {self.current_loop}, attempt {retry_count}: {e}"
-                    )
-                    self.error_logger.log("WARNING", msg, e)
-                    if retry_count > self.config.max_retries:
-                        err_payload = (
-                            f"Exceeded retries on loop {self.current_loop}: {e}",
-                            e,
-                        )
-                        yield ("error", self.current_loop, total_loops, err_payload)
-                        return
-                    # Special case: Gemini may return HTTP 503 when overloaded.
-                    # Pause for 10 seconds before retrying in that case.
-                    error_msg = str(e)
-                    if "503" in error_msg and "overloaded" in error_msg.lower():
-                        time.sleep(10)
-                    else:
-                        time.sleep(backoff)
-                        backoff *= 2
-
-            if full_response is None:
-                full_response = ""
-
-            # Save loop result to history and state
-            timestamp = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
-            self.history.append({"prompt": prompt, "response": full_response, "timestamp": timestamp})
-            self.agent_state.update_state("history", list(self.history))
-            self.last_thought = full_response
-            self.agent_state.update_state("last_thought", self.last_thought)
-
-            # Parse and execute embedded commands
-            try:
-                results = self.command_executor.parse_and_execute(full_response)
-                if results:
-                    self.agent_state.update_state("command_results", results)
-                    for name, res in results:
-                        if name == "CANCEL" and not str(res).startswith("ERROR"):
-                            self.request_cancel(str(res))
-                        elif name == "PAUSE" and not str(res).startswith("ERROR"):
-                            self.request_pause(str(res))
-            except Exception as e:
-                self.error_logger.log(
-                    "ERROR",
-                    f"Error parsing/executing commands on loop {self.current_loop}",
-                    e,
+        options = {"api_key": api_key}
+        client._client = glm.GenerativeServiceClient(client_options=options)
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # Sync runs never use the async transport, which needs a loop
+            return
+        client._async_client = glm.GenerativeServiceAsyncClient(client_options=options)
+
+    def _report_metrics(self) -> Dict[str, Any]:
+        """Log this loop's metrics at DEBUG and return the event payload."""
+        payload = self._metrics.as_dict()
+        self.error_logger.log("DEBUG", f"metrics: {format_metrics(payload)}")
+        return payload
+
+    def _handle_stream_error(
+        self, exc: Exception, retry_count: int
+    ) -> Optional[Tuple[str, Exception]]:
+        """
+        Log a failed streaming attempt. Return an error payload when the run
+        must stop (quota exhausted or retries used up), otherwise ``None``.
+        """
+        if self._is_quota_error(exc):
+            msg = "API quota limit reached. Stopping agent."
+            self.error_logger.log("ERROR", msg, exc)
+            return (msg, exc)
+
+        msg = f"Error on loop {self.current_loop}, attempt {retry_count}: {exc}"
+        self.error_logger.log("WARNING", msg, exc)
+        if retry_count > self.config.max_retries:
+            return (f"Exceeded retries on loop {self.current_loop}: {exc}", exc)
+        return None
+
+    def _retry_delay(self, exc: Exception, backoff: float) -> Tuple[float, float]:
+        """
+        Return ``(delay, next_backoff)`` for the retry following *exc*. The
+        delay is drawn from [backoff/2, backoff] so agents that failed
+        together do not retry in lockstep.
+        """
+        # Gemini returns 429/503 when overloaded; back off harder in that case.
+        if self._is_overload_error(exc):
+            backoff = max(backoff, self.config.overload_backoff_seconds)
+        backoff = min(backoff, self.config.backoff_max_seconds)
+        delay = backoff / 2 + random.uniform(0, backoff / 2)
+        return delay, backoff * 2
+
+    def _check_circuit(self) -> Optional[Tuple[str, Exception]]:
+        """Return an error payload if the circuit breaker rejects the request."""
+        if self.circuit_breaker.allow():
+            self._outcome_pending = True
+            return None
+        wait = self.circuit_breaker.retry_after()
+        msg = f"API error rate too high; circuit breaker open for another {wait:.0f}s."
+        exc = CircuitOpenError(msg)
+        self.error_logger.log("ERROR", msg)
+        return (msg, exc)
+
+    def _record_outcome(self, exc: Optional[Exception]) -> None:
+        """Feed the result of a request attempt to the AIMD controller and breaker."""
+        self._outcome_pending = False
+        if exc is None:
+            self.rate_controller.on_success()
+            self.circuit_breaker.record(True)
+            return
+        if self._is_overload_error(exc):
+            self.rate_controller.on_overload()
+            self.error_logger.log(
+                "INFO", f"Overload response; request rate now {self.rate_controller.rate:.1f} rpm"
+            )
+        self.circuit_breaker.record(False)
+
+    def _abandon_attempt(self) -> None:
+        """
+        Release a breaker slot whose attempt ended without an outcome
+        (cancelled, or the consumer stopped iterating), so a half-open
+        breaker does not wait forever for its trial request.
+        """
+        if self._outcome_pending:
+            self._outcome_pending = False
+            self.circuit_breaker.release()
+
+    def _is_overload_error(self, exc: Exception) -> bool:
+        """Return True for rate-limit (429) or overload (503) responses."""
+        try:
+            from google.api_core import exceptions as api_exceptions
+
+            overload_types = tuple(
+                t
+                for t in (
+                    getattr(api_exceptions, "ResourceExhausted", None),
+                    getattr(api_exceptions, "TooManyRequests", None),
+                    getattr(api_exceptions, "ServiceUnavailable", None),
                 )
+                if isinstance(t, type)
+            )
+            if overload_types and isinstance(exc, overload_types):
+                return True
+        except Exception:
+            # google.api_core may not be installed during tests
+            pass
 
-            # Signal end of loop
-            yield ("loop_end", self.current_loop, total_loops, full_response)
+        text = str(exc).lower()
+        return any(
+            marker in text
+            for marker in ("429", "503", "overloaded", "resource exhausted", "rate limit")
+        )
 
-            # Advance loop counter and persist state
-            self.current_loop += 1
-            self.agent_state.update_state("current_loop", self.current_loop)
-            self.agent_state.save_state()
+    def _record_response(self, prompt: str, full_response: str) -> None:
+        """Save loop result to history and state."""
+        self._tmp_writer.sync()
+        timestamp = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        self.history.append({"prompt": prompt, "response": full_response, "timestamp": timestamp})
+        self.agent_state.update_state("history", list(self.history))
+        self.last_thought = full_response
+        self.agent_state.update_state("last_thought", self.last_thought)
+        if self.memory is not None:
+            self.memory.add(self.current_loop, full_response)
 
-            if self.paused:
-                break
+    def _new_command_dispatcher(self) -> Optional[StreamingCommandDispatcher]:
+        """Return a dispatcher for this loop if commands run during streaming."""
+        if not self.config.stream_commands:
+            return None
+        return StreamingCommandDispatcher(self.command_executor, self.error_logger)
+
+    def _execute_commands(
+        self, full_response: str, dispatcher: Optional[StreamingCommandDispatcher] = None
+    ) -> None:
+        """
+        Parse and execute embedded commands, honouring CANCEL and PAUSE. With a
+        *dispatcher* the commands already started during streaming; only
+        their results are collected here. The time spent here and each
+        handler's run time go into the loop metrics.
+        """
+        start = time.perf_counter()
+        timings: List[CommandTiming] = []
+        try:
+            if dispatcher is not None:
+                try:
+                    results = dispatcher.results()
+                finally:
+                    dispatcher.close()
+                timings = dispatcher.timings
+            else:
+                results = self.command_executor.parse_and_execute(full_response, timings)
+            if results:
+                self.agent_state.update_state("command_results", results)
+                for name, res in results:
+                    if name == "CANCEL" and not str(res).startswith("ERROR"):
+                        self.request_cancel(str(res))
+                    elif name == "PAUSE" and not str(res).startswith("ERROR"):
+                        self.request_pause(str(res))
+        except Exception as e:
+            self.error_logger.log(
+                "ERROR",
+                f"Error parsing/executing commands on loop {self.current_loop}",
+                e,
+            )
+        self._metrics.add_commands(timings, time.perf_counter() - start)
+
+    def _advance_loop(self) -> None:
+        """Advance loop counter and persist state."""
+        self.current_loop += 1
+        self.agent_state.update_state("current_loop", self.current_loop)
+        self.agent_state.save_state()
 
+    def _finish_run(self, total_loops: int) -> None:
+        """Persist final state once the loop sequence stops."""
+        self._tmp_writer.sync()
         # If recursion completed normally, cap current_loop at total_loops so
         # the UI does not show an impossible "loop N+1 of N" status.
         if not self.paused and not self.cancelled and self.current_loop > total_loops:
@@ -320,18 +949,65 @@ Capabilities:
 
         self.agent_state.save_state()
 
-    def _enforce_rate_limit(self) -> None:
+    def _rate_limit_delay(self, prompt: str = "") -> float:
+        """
+        Reserve the next request (and its prompt tokens) and return how long
+        to wait before sending it. The caller performs the wait so sync and
+        async loops share the logic.
+        """
+        tokens = count_tokens(prompt, self.model_name)
+        if self._system_in_client:
+            tokens += count_tokens(self._system_segment(), self.model_name)
+        if self.key_pool is not None:
+            self._active_key, bucket_wait = self.key_pool.acquire(tokens)
+        else:
+            bucket_wait = self.rate_limiter.reserve(tokens)
+        delay = max(bucket_wait, self.rate_controller.reserve())
+        self._metrics.rate_limit_wait_s += delay
+        return delay
+
+    def _bind_active_key(self) -> None:
+        """Point this agent's client at the pooled key chosen for this request."""
+        entry = self._active_key
+        if entry is None or entry.key == self._bound_key:
+            return
+        self._bound_key = entry.key
+        self.client = self._new_client()
+
+    def _rotate_key(self, exc: Exception) -> bool:
         """
-        Ensure at least (60 / rpm) seconds pass between requests.
+        On a quota or 429 error with a key pool, cool down the current key and
+        return True if another healthy key can take over the request.
         """
-        interval = 60.0 / self.rpm
-        elapsed = time.time() - self._last_request_ts
-        if elapsed < interval:
-            time.sleep(interval - elapsed)
-        self._last_request_ts = time.time()
+        if self.key_pool is None or self._active_key is None:
+            return False
+        if not (self._is_quota_error(exc) or self._is_resource_exhausted(exc)):
+            return False
+        self.key_pool.mark_exhausted(self._active_key)
+        self._active_key = None
+        return self.key_pool.has_healthy_key()
+
+    def _release_active_key(self, success: bool) -> None:
+        """Return the pooled key used by this loop's request."""
+        if self.key_pool is not None and self._active_key is not None:
+            self.key_pool.release(self._active_key, success=success)
+        self._active_key = None
 
     def _is_quota_error(self, exc: Exception) -> bool:
-        """Return True if *exc* indicates the API quota was exceeded."""
+        """
+        Return True if *exc* reports an exhausted daily or project quota.
+        A per-minute limit is also sent as HTTP 429 (``ResourceExhausted``),
+        but it clears within a minute, so it is retried as an overload and
+        slows the adaptive rate instead of stopping the run.
+        """
+        text = str(exc).lower()
+        if "quota" not in text or "exceeded" not in text:
+            return False
+        return not any(marker in text for marker in _PER_MINUTE_MARKERS)
+
+    @staticmethod
+    def _is_resource_exhausted(exc: Exception) -> bool:
+        """Return True for an HTTP 429 (``ResourceExhausted``) response."""
         try:
             from google.api_core.exceptions import ResourceExhausted
 
@@ -340,57 +1016,204 @@ Capabilities:
         except Exception:
             # google.api_core may not be installed during tests
             pass
-
         text = str(exc).lower()
-        return "quota" in text and "exceeded" in text
+        return "429" in text or "resource exhausted" in text
 
-    def _stream_generation(self, prompt: str) -> Generator[str, None, None]:
+    def _stream_generation(
+        self, prompt: str, cached: Optional[List[str]] = None
+    ) -> Generator[str, None, None]:
         """
-        Call Gemini's streaming endpoint. If the first call fails, attempt to
-        reinitialize the client once. For each chunk:
+        Stream the response for *prompt*, replaying the *cached* chunks
+        instead of calling the API when given. For each chunk:
           - If chunk.text is empty or whitespace, skip.
           - Otherwise write to the temp file and yield the text.
+        A response streamed to completion is stored in the cache.
+        """
+        with get_tracer().span("stream"):
+            source = iter(cached) if cached is not None else self._api_text_stream(prompt)
+            received = []
+            for text in source:
+                if not text or not text.strip():
+                    continue
+
+                self._persist_chunk(text)
+                received.append(text)
+                yield text
+
+                if self.cancelled:
+                    raise CancelledException()
+                if self.paused:
+                    return
+
+            if cached is None:
+                self._store_response(prompt, received)
+
+    def _api_text_stream(self, prompt: str) -> Iterator[Optional[str]]:
+        """
+        Yield the API response text, hedging slow first chunks if enabled.
+        The stall watchdog raises StreamStallError (handled by the retry path)
+        if chunks stop arriving or the stream outlives its deadline.
+        """
+        def source() -> Iterator[Optional[str]]:
+            if not self.config.hedge_requests:
+                return self._open_api_stream(prompt)
+            return hedged_iter(
+                lambda: self._open_api_stream(prompt),
+                self._hedge_after(),
+                lambda: self._allow_hedge(prompt),
+                self._ttft_tracker.record,
+            )
+
+        return watched_iter(
+            source,
+            self.config.stream_idle_timeout_seconds,
+            self.config.stream_deadline_seconds,
+        )
+
+    def _open_api_stream(self, prompt: str) -> Iterator[Optional[str]]:
+        """
+        Call Gemini's streaming endpoint and yield each chunk's text. If the
+        first call fails (other than on quota or overload), reinitialize the
+        client once.
         """
         try:
             stream = self.client.generate_content(prompt, stream=True)
         except Exception as e:
-            self.error_logger.log("WARNING", "Initial stream call failed", e)
-            try:
-                self.client = genai.GenerativeModel(self.model_name) # type: ignore[attr-defined]
-                stream = self.client.generate_content(prompt, stream=True)
-            except Exception:
+            if self._is_quota_error(e) or self._is_overload_error(e):
                 raise
+            self.error_logger.log("WARNING", "Initial stream call failed", e)
+            self.client = self._new_client()
+            stream = self.client.generate_content(prompt, stream=True)
 
         for chunk in stream:
-            if hasattr(chunk, "text"):
-                text = chunk.text
-            elif (
-                hasattr(chunk, "choices")
-                and isinstance(chunk.choices, list)  # type: ignore[attr-defined]
-                and len(chunk.choices) > 0  # type: ignore[attr-defined]
-                and hasattr(chunk.choices[0], "text")  # type: ignore[attr-defined]
-            ):
-                text = chunk.choices[0].text  # type: ignore[attr-defined]
+            yield self._chunk_text(chunk)
+
+    async def _stream_generation_async(
+        self, prompt: str, cached: Optional[List[str]] = None
+    ) -> AsyncGenerator[str, None]:
+        """
+        Async variant of :meth:`_stream_generation`. Uses the SDK's
+        ``generate_content_async`` when the client provides it; otherwise the
+        blocking stream is advanced in a worker thread one chunk at a time.
+        """
+        if getattr(self.client, "generate_content_async", None) is None:
+            async for text in _iterate_in_thread(self._stream_generation(prompt, cached)):
+                yield text
+            return
+
+        with get_tracer().span("stream"):
+            if cached is not None:
+                source = _aiter_list(cached)
             else:
-                continue
+                source = self._api_text_stream_async(prompt)
+            received = []
+            async for text in source:
+                if not text or not text.strip():
+                    continue
 
-            if not text or not text.strip():
-                continue
+                self._persist_chunk(text)
+                received.append(text)
+                yield text
 
-            try:
-                self.tmp_file.write(text)
-                self.tmp_file.flush()
-            except Exception as e:
-                self.error_logger.log(
-                    "WARNING", "Failed to write chunk to tmp file; continuing", e
-                )
+                if self.cancelled:
+                    raise CancelledException()
+                if self.paused:
+                    return
 
-            yield text
+            if cached is None:
+                self._store_response(prompt, received)
 
-            if self.cancelled:
-                raise CancelledException()
-            if self.paused:
-                return
+    def _api_text_stream_async(self, prompt: str) -> AsyncIterator[Optional[str]]:
+        """Async counterpart of :meth:`_api_text_stream`."""
+        if not self.config.hedge_requests:
+            source = self._open_api_stream_async(prompt)
+        else:
+            source = hedged_aiter(
+                lambda: self._open_api_stream_async(prompt),
+                self._hedge_after(),
+                lambda: self._allow_hedge(prompt),
+                self._ttft_tracker.record,
+            )
+        return watched_aiter(
+            source,
+            self.config.stream_idle_timeout_seconds,
+            self.config.stream_deadline_seconds,
+        )
+
+    async def _open_api_stream_async(self, prompt: str) -> AsyncGenerator[Optional[str], None]:
+        """Async counterpart of :meth:`_open_api_stream`."""
+        try:
+            stream = await self.client.generate_content_async(prompt, stream=True)
+        except Exception as e:
+            if self._is_quota_error(e) or self._is_overload_error(e):
+                raise
+            self.error_logger.log("WARNING", "Initial stream call failed", e)
+            self.client = self._new_client()
+            stream = await self.client.generate_content_async(prompt, stream=True)
+
+        async for chunk in stream:
+            yield self._chunk_text(chunk)
+
+    def _hedge_after(self) -> Optional[float]:
+        """Seconds to wait for a first chunk before hedging, if known yet."""
+        return self._ttft_tracker.percentile(
+            self.config.hedge_percentile, self.config.hedge_min_samples
+        )
+
+    def _allow_hedge(self, prompt: str) -> bool:
+        """
+        Reserve rate budget for a duplicate request. Hedging is skipped when
+        the budget would make the hedge wait, so it can never breach a quota.
+        """
+        if self._active_key is not None:
+            limiter = self._active_key.limiter
+        else:
+            limiter = self.rate_limiter
+        tokens = count_tokens(prompt, self.model_name)
+        if limiter is None or limiter.peek(tokens) > 0:
+            self.error_logger.log("DEBUG", "Slow first chunk; no rate budget left to hedge")
+            return False
+        limiter.reserve(tokens)
+        self.error_logger.log(
+            "INFO", f"loop {self.current_loop}: slow first chunk, sending hedged request"
+        )
+        return True
+
+    def _cache_key(self, prompt: str) -> str:
+        """Content address of a request: model, prompt and generation settings."""
+        settings: Dict[str, Any] = {"temperature": self.temperature, "seed": self.seed}
+        if self._system_in_client:
+            settings["system_instruction"] = self._system_segment()
+        return ResponseCache.make_key(self.model_name, prompt, settings)
+
+    def _cached_response(self, prompt: str) -> Optional[List[str]]:
+        """Return cached chunks for *prompt* if the response cache has them."""
+        if self.response_cache is None:
+            return None
+        return self.response_cache.get(self._cache_key(prompt))
+
+    def _store_response(self, prompt: str, chunks: List[str]) -> None:
+        """Cache a response that streamed to completion."""
+        if self.response_cache is not None and chunks:
+            self.response_cache.put(self._cache_key(prompt), chunks)
+
+    @staticmethod
+    def _chunk_text(chunk: Any) -> Optional[str]:
+        """Extract the text of a streamed chunk, or ``None`` if it has none."""
+        if hasattr(chunk, "text"):
+            return chunk.text
+        if (
+            hasattr(chunk, "choices")
+            and isinstance(chunk.choices, list)  # type: ignore[attr-defined]
+            and len(chunk.choices) > 0  # type: ignore[attr-defined]
+            and hasattr(chunk.choices[0], "text")  # type: ignore[attr-defined]
+        ):
+            return chunk.choices[0].text  # type: ignore[attr-defined]
+        return None
+
+    def _persist_chunk(self, text: str) -> None:
+        """Queue streamed text for the tmp file (crash recovery)."""
+        self._tmp_writer.write(text)
 
     def request_cancel(self, reason: str) -> None:
         """
@@ -416,3 +1239,21 @@ Capabilities:
         self.paused = False
         self.agent_state.update_state("paused", False)
         self.agent_state.save_state()
+
+
+_SENTINEL = object()
+
+
+async def _iterate_in_thread(iterator: Iterator[str]) -> AsyncGenerator[str, None]:
+    """Advance a blocking *iterator* in a worker thread, yielding each item."""
+    while True:
+        item = await asyncio.to_thread(next, iterator, _SENTINEL)
+        if item is _SENTINEL:
+            return
+        yield item
+
+
+async def _aiter_list(items: List[str]) -> AsyncGenerator[str, None]:
+    """Yield *items* from an async generator (used to replay cached chunks)."""
+    for item in items:
+        yield item
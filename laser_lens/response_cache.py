@@ -0,0 +1,116 @@
+# response_cache.py
+
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+from error_logger import ErrorLogger
+
+
+class ResponseCache:
+    """
+    Disk-backed, content-addressed cache of completed model responses.
+
+    Each entry is a JSON file named by the SHA-256 of the model name, prompt
+    and generation settings, holding the response as its original list of
+    chunks so a hit can be replayed as a stream. Hits refresh the file's
+    mtime; when the directory grows beyond ``max_bytes`` the least recently
+    used entries are evicted.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        max_bytes: int,
+        error_logger: Optional[ErrorLogger] = None,
+    ):
+        self.cache_dir = os.path.expanduser(cache_dir)
+        self.max_bytes = max_bytes
+        self.error_logger = error_logger
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._total_bytes = sum(size for _, size, _ in self._entries())
+
+    @staticmethod
+    def make_key(model_name: str, prompt: str, settings: Dict[str, Any]) -> str:
+        """Return the content address for a request."""
+        payload = json.dumps(
+            {"model": model_name, "prompt": prompt, "settings": settings},
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[List[str]]:
+        """Return the cached chunks for *key*, or ``None`` on a miss."""
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                chunks = json.load(f)["chunks"]
+            os.utime(path)
+        except (OSError, ValueError, KeyError, TypeError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return chunks
+
+    def put(self, key: str, chunks: List[str]) -> None:
+        """Store a completed response and evict old entries if over budget."""
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"chunks": chunks}, f)
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            if self.error_logger:
+                self.error_logger.log("WARNING", f"Failed to write response cache {path}", e)
+            return
+        with self._lock:
+            self._total_bytes += size
+            over = self._total_bytes > self.max_bytes
+        if over:
+            self._evict()
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters and the current on-disk footprint."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "bytes": self._total_bytes}
+
+    def _evict(self) -> None:
+        entries = sorted(self._entries(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        with self._lock:
+            self._total_bytes = total
+
+    def _entries(self):
+        """Yield ``(path, size, mtime)`` for every cache entry."""
+        try:
+            with os.scandir(self.cache_dir) as it:
+                for entry in it:
+                    if entry.name.endswith(".json"):
+                        try:
+                            st = entry.stat()
+                        except OSError:
+                            continue
+                        yield entry.path, st.st_size, st.st_mtime
+        except OSError:
+            return
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
@@ -0,0 +1,141 @@
+# spill_buffer.py
+
+"""
+Read-only, memory-mapped view of a large upload stored on disk.
+
+Large context files are written to disk once and read through a
+:class:`SpilledText` instead of being decoded into one Python string. Only
+the windows that are asked for (the head and tail that go into the prompt, or
+one chunk at a time while counting tokens) are decoded, so resident memory
+does not grow with the size of the upload.
+"""
+
+import mmap
+import shutil
+from typing import BinaryIO, Iterator, Optional, Tuple
+
+from utils import count_tokens
+
+# Bytes decoded per step when scanning the whole file
+SCAN_CHUNK_BYTES = 1 << 20
+# Bytes decoded per step when counting every token; small to keep the peak low
+TOKEN_SCAN_BYTES = 1 << 16
+# Upper bound on bytes per token used to size head/tail windows
+WINDOW_BYTES_PER_TOKEN = 8
+
+
+def spill(src: BinaryIO, path: str) -> None:
+    """Copy the binary stream *src* to *path* without reading it all at once."""
+    with open(path, "wb") as dst:
+        shutil.copyfileobj(src, dst, SCAN_CHUNK_BYTES)
+
+
+class SpilledText:
+    """
+    UTF-8 text backed by a file on disk. Slices are decoded on demand with
+    undecodable bytes (including sequences cut at a window edge) dropped.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._mm: Optional[mmap.mmap] = mmap.mmap(
+                self._file.fileno(), 0, access=mmap.ACCESS_READ
+            )
+        except ValueError:
+            # Empty files cannot be mapped
+            self._mm = None
+
+    def __len__(self) -> int:
+        return len(self._mm) if self._mm is not None else 0
+
+    def __enter__(self) -> "SpilledText":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        self._file.close()
+
+    def slice(self, start: int, end: int) -> str:
+        """Decode bytes ``[start, end)``."""
+        if self._mm is None:
+            return ""
+        return self._mm[start:end].decode("utf-8", errors="ignore")
+
+    def text(self) -> str:
+        """Materialize the whole file; only use when it is known to be small."""
+        return self.slice(0, len(self))
+
+    def chunks(self, size: int = SCAN_CHUNK_BYTES) -> Iterator[str]:
+        """Yield the text in decoded windows of about *size* bytes."""
+        for start in range(0, len(self), size):
+            yield self.slice(start, start + size)
+
+    def windows(self, size: int = SCAN_CHUNK_BYTES) -> Iterator[Tuple[int, str]]:
+        """
+        Yield ``(start, text)`` windows of about *size* bytes covering the whole
+        file. Windows end after a blank line, a line break or at least a whole
+        character, so *start* is the byte offset of the first character.
+        Undecodable bytes come back as lone surrogates (``surrogateescape``),
+        so re-encoding any part of a window gives its exact byte length.
+        """
+        total = len(self)
+        start = 0
+        while start < total:
+            end = min(start + size, total)
+            if end < total:
+                blank = self._mm.rfind(b"\n\n", start, end)
+                line = self._mm.rfind(b"\n", start, end)
+                if blank >= 0:
+                    end = blank + 2
+                elif line >= 0:
+                    end = line + 1
+                else:
+                    # Back off over UTF-8 continuation bytes
+                    while end > start + 1 and self._mm[end] & 0xC0 == 0x80:
+                        end -= 1
+            yield start, self._mm[start:end].decode("utf-8", errors="surrogateescape")
+            start = end
+
+    def exceeds(self, limit: int, model: Optional[str] = None) -> bool:
+        """
+        Return True if the text has more than *limit* tokens. Scanning stops
+        as soon as the limit is passed.
+        """
+        tokens = 0
+        for chunk in self.chunks():
+            tokens += count_tokens(chunk, model)
+            if tokens > limit:
+                return True
+        return False
+
+    def tokens(self, model: Optional[str] = None) -> int:
+        """Token count of the whole file."""
+        return sum(count_tokens(chunk, model) for chunk in self.chunks(TOKEN_SCAN_BYTES))
+
+    def head(self, budget: int, model: Optional[str] = None) -> str:
+        """Return a prefix of at most *budget* tokens."""
+        window = self.slice(0, budget * WINDOW_BYTES_PER_TOKEN)
+        return _fit(window, budget, model, from_end=False)
+
+    def tail(self, budget: int, model: Optional[str] = None) -> str:
+        """Return a suffix of at most *budget* tokens."""
+        size = len(self)
+        window = self.slice(max(0, size - budget * WINDOW_BYTES_PER_TOKEN), size)
+        return _fit(window, budget, model, from_end=True)
+
+
+def _fit(window: str, budget: int, model: Optional[str], from_end: bool) -> str:
+    # Cut at the window's token density, then shrink if a split word costs extra
+    tokens = count_tokens(window, model)
+    while window and tokens > budget:
+        keep = min(len(window) - 1, int(len(window) * budget / tokens))
+        window = window[len(window) - keep:] if from_end else window[:keep]
+        tokens = count_tokens(window, model)
+    return window
@@ -0,0 +1,103 @@
+# stream_watchdog.py
+
+import asyncio
+import queue
+import time
+from typing import Any, AsyncIterator, Callable, Iterator, Optional
+
+from hedging import StreamPump
+
+
+class StreamStallError(TimeoutError):
+    """Raised when a response stream goes quiet or runs past its deadline."""
+
+    pass
+
+
+def _next_timeout(
+    last_activity: float, started: float, idle: Optional[float], deadline: Optional[float]
+) -> Optional[float]:
+    """Seconds until the idle timeout or deadline trips, whichever is sooner."""
+    now = time.monotonic()
+    limits = []
+    if idle is not None:
+        limits.append(last_activity + idle - now)
+    if deadline is not None:
+        limits.append(started + deadline - now)
+    return max(0.0, min(limits)) if limits else None
+
+
+def _stall_message(started: float, idle: Optional[float], deadline: Optional[float]) -> str:
+    if deadline is not None and time.monotonic() - started >= deadline:
+        return f"stream exceeded {deadline:g}s deadline"
+    return f"no chunk received for {idle:g}s"
+
+
+def watched_iter(
+    factory: Callable[[], Iterator[Any]],
+    idle_timeout: Optional[float],
+    deadline: Optional[float],
+) -> Iterator[Any]:
+    """
+    Yield from ``factory()`` but raise :class:`StreamStallError` if no item
+    arrives for *idle_timeout* seconds or the stream outlives *deadline*.
+    The blocking iterator runs in a :class:`StreamPump` so a hung ``next()``
+    cannot block the caller.
+    """
+    if idle_timeout is None and deadline is None:
+        yield from factory()
+        return
+
+    events: "queue.Queue" = queue.Queue()
+    pump = StreamPump(factory, events)
+    started = last_activity = time.monotonic()
+    try:
+        while True:
+            try:
+                _, kind, value = events.get(
+                    timeout=_next_timeout(last_activity, started, idle_timeout, deadline)
+                )
+            except queue.Empty:
+                raise StreamStallError(_stall_message(started, idle_timeout, deadline))
+            if kind == "item":
+                last_activity = time.monotonic()
+                yield value
+            elif kind == "done":
+                return
+            else:
+                raise value
+    finally:
+        pump.stop()
+
+
+async def watched_aiter(
+    stream: AsyncIterator[Any],
+    idle_timeout: Optional[float],
+    deadline: Optional[float],
+) -> AsyncIterator[Any]:
+    """Async counterpart of :func:`watched_iter`."""
+    if idle_timeout is None and deadline is None:
+        async for item in stream:
+            yield item
+        return
+
+    started = last_activity = time.monotonic()
+    try:
+        while True:
+            timeout = _next_timeout(last_activity, started, idle_timeout, deadline)
+            try:
+                item = await asyncio.wait_for(stream.__anext__(), timeout)
+            except StopAsyncIteration:
+                return
+            except asyncio.TimeoutError:
+                raise StreamStallError(_stall_message(started, idle_timeout, deadline))
+            last_activity = time.monotonic()
+            yield item
+    finally:
+        aclose = getattr(stream, "aclose", None)
+        if aclose is not None:
+            try:
+                await aclose()
+            except Exception:
+                # The stream is being abandoned; closing is best effort
+                pass
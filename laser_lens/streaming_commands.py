@@ -0,0 +1,98 @@
+# streaming_commands.py
+
+import re
+from concurrent.futures import Future
+from typing import Any, List, Optional, Tuple
+
+from command_executor import ACCESS_READ, CommandExecutor, CommandScheduler, CommandTiming
+from error_logger import ErrorLogger
+
+_OPEN_MARKER = "[[COMMAND:"
+
+
+class StreamingCommandDispatcher:
+    """
+    Runs embedded commands while a response is still streaming.
+
+    Chunks are passed to :meth:`feed`. As soon as a ``[[COMMAND: ...]]``
+    marker is closed it is submitted to a :class:`CommandScheduler`, which
+    applies the same ordering rules as ``CommandExecutor.parse_and_execute``
+    on the joined text.
+
+    Only read-only commands start early. The first write or exclusive command
+    (``WRITE_FILE``, ``EXEC``, ...) and every command after it are held back
+    until :meth:`results`, which is only called once the stream completed, so
+    a stream that is aborted and retried never repeats a side effect.
+    :meth:`results` waits for the outstanding commands and returns the
+    ``(command_name, result)`` list in marker order.
+    """
+
+    def __init__(self, command_executor: CommandExecutor, error_logger: ErrorLogger):
+        self.command_executor = command_executor
+        self.error_logger = error_logger
+        self._scheduler = CommandScheduler(command_executor)
+        self._buffer = ""
+        self._scan_pos = 0
+        self._futures: List[Future] = []
+        # (index, match) of commands waiting for the stream to complete
+        self._deferred: List[Tuple[int, "re.Match[str]"]] = []
+        self.timings: List[CommandTiming] = []
+
+    def feed(self, text: str) -> None:
+        """Append *text* and dispatch every command marker it completes."""
+        self._buffer += text
+        pattern = self.command_executor.COMMAND_PATTERN
+        while True:
+            match = pattern.search(self._buffer, self._scan_pos)
+            if match is None:
+                break
+            self._scan_pos = match.end()
+            idx = len(self._futures) + len(self._deferred) + 1
+            if self._deferred or self._scheduler._classify(match)[0] not in (None, ACCESS_READ):
+                self._deferred.append((idx, match))
+            else:
+                self._futures.append(self._scheduler.submit(idx, match, self.timings))
+
+        # Without an open marker pending, earlier text can never start a match.
+        start = self._buffer.find(_OPEN_MARKER, self._scan_pos)
+        if start == -1:
+            self._scan_pos = max(self._scan_pos, len(self._buffer) - len(_OPEN_MARKER) + 1)
+        else:
+            self._scan_pos = start
+
+    def reset(self) -> None:
+        """
+        Forget the current response, e.g. before a retry. Read-only commands
+        already dispatched finish first, but their results are discarded;
+        deferred commands never run.
+        """
+        if self._futures:
+            self.error_logger.log(
+                "WARNING",
+                f"Discarding results of {len(self._futures)} command(s) from an aborted stream",
+            )
+        self._scheduler.close()
+        self._scheduler = CommandScheduler(self.command_executor)
+        self._buffer = ""
+        self._scan_pos = 0
+        self._futures = []
+        self._deferred = []
+        self.timings = []
+
+    def results(self) -> List[Tuple[str, Any]]:
+        """
+        Run the deferred commands, block until every command finishes and
+        return their results in order. Call only once the stream completed.
+        """
+        for idx, match in self._deferred:
+            self._futures.append(self._scheduler.submit(idx, match, self.timings))
+        self._deferred = []
+        out: List[Tuple[str, Any]] = []
+        for future in self._futures:
+            result: Optional[Tuple[str, Any]] = future.result()
+            if result is not None:
+                out.append(result)
+        return out
+
+    def close(self) -> None:
+        self._scheduler.close()
@@ -0,0 +1,204 @@
+# tabular.py
+
+"""
+Compact summaries of tabular uploads (CSV, TSV, Parquet).
+
+Rows are read in chunks and folded into running per-column aggregates
+(counts, nulls, min/max/mean/std for numbers, value counts for everything
+else), so memory depends on the chunk size and the number of columns, not
+the number of rows. The summary holds the schema, per-column statistics and
+a small row sample, stratified by a low-cardinality column when there is one.
+It goes into the context in place of the raw rows.
+
+pandas is required; Parquet also needs pyarrow.
+"""
+
+import math
+import os
+import random
+from typing import IO, Dict, Iterator, List, Optional, Union
+
+try:
+    import pandas as pd
+except ImportError:  # pragma: no cover - pandas is a listed dependency
+    pd = None
+
+TABULAR_EXTENSIONS = (".csv", ".tsv", ".parquet")
+
+# Distinct values tracked per column before counts become approximate
+MAX_TRACKED_VALUES = 10000
+
+Source = Union[str, IO[bytes]]
+
+
+def is_tabular(file_name: str) -> bool:
+    return file_name.lower().endswith(TABULAR_EXTENSIONS)
+
+
+def iter_chunks(source: Source, file_name: str, chunk_rows: int) -> Iterator["pd.DataFrame"]:
+    """Yield DataFrames of at most *chunk_rows* rows from a CSV, TSV or Parquet source."""
+    if pd is None:
+        raise RuntimeError("pandas is required for tabular uploads")
+    lower = file_name.lower()
+    if lower.endswith(".parquet"):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise RuntimeError("pyarrow is required for Parquet uploads") from e
+        for batch in pq.ParquetFile(source).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+        return
+    sep = "\t" if lower.endswith(".tsv") else ","
+    with pd.read_csv(source, sep=sep, chunksize=chunk_rows) as reader:
+        yield from reader
+
+
+class _ColumnStats:
+    def __init__(self) -> None:
+        self.dtypes: List[str] = []
+        self.non_null = 0
+        self.nulls = 0
+        self.numeric_count = 0
+        self.minimum = math.inf
+        self.maximum = -math.inf
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.counts: Optional["pd.Series"] = None
+        self.approximate = False
+
+    def add_dtype(self, dtype: str) -> None:
+        if dtype not in self.dtypes:
+            self.dtypes.append(dtype)
+
+
+class TableSummary:
+    """Running aggregates over the chunks of one table."""
+
+    def __init__(self, sample_rows: int = 20, top_values: int = 5, seed: int = 0):
+        self.sample_rows = sample_rows
+        self.top_values = top_values
+        self.rows = 0
+        self.columns: Dict[str, _ColumnStats] = {}
+        self._rng = random.Random(seed)
+        self._pool: List["pd.DataFrame"] = []
+
+    def add(self, chunk: "pd.DataFrame") -> None:
+        # Number rows by file position (Parquet batches each start at 0)
+        chunk.index = pd.RangeIndex(self.rows, self.rows + len(chunk))
+        self.rows += len(chunk)
+        non_null = chunk.count()
+        numeric = chunk.select_dtypes(include="number")
+        if len(numeric.columns):
+            mins, maxs = numeric.min(), numeric.max()
+            sums = numeric.sum()
+            sums_sq = (numeric.astype("float64") ** 2).sum()
+            counts = numeric.count()
+        for name in chunk.columns:
+            key = str(name)
+            stats = self.columns.setdefault(key, _ColumnStats())
+            stats.add_dtype(str(chunk[name].dtype))
+            stats.non_null += int(non_null[name])
+            stats.nulls += len(chunk) - int(non_null[name])
+            if name in numeric.columns:
+                if counts[name]:
+                    stats.numeric_count += int(counts[name])
+                    stats.minimum = min(stats.minimum, float(mins[name]))
+                    stats.maximum = max(stats.maximum, float(maxs[name]))
+                    stats.total += float(sums[name])
+                    stats.total_sq += float(sums_sq[name])
+                continue
+            values = chunk[name].value_counts()
+            if stats.counts is not None:
+                values = stats.counts.add(values, fill_value=0)
+            stats.counts = values
+            if len(stats.counts) > MAX_TRACKED_VALUES:
+                stats.counts = stats.counts.nlargest(MAX_TRACKED_VALUES // 10)
+                stats.approximate = True
+        # Up to sample_rows random rows from every chunk, so the pool covers
+        # the whole file; it is narrowed down when rendering
+        take = min(len(chunk), self.sample_rows)
+        if take:
+            self._pool.append(chunk.sample(n=take, random_state=self._rng.randrange(1 << 30)))
+
+    def _strata_column(self) -> Optional[str]:
+        for name, stats in self.columns.items():
+            if stats.counts is not None and not stats.approximate:
+                if 2 <= len(stats.counts) <= self.sample_rows:
+                    return name
+        return None
+
+    def sample(self) -> "Optional[pd.DataFrame]":
+        if not self._pool:
+            return None
+        pool = pd.concat(self._pool)
+        column = self._strata_column()
+        if column is not None:
+            per_group = max(1, self.sample_rows // len(self.columns[column].counts))
+            picked = pool.groupby(column, sort=False, dropna=False).head(per_group)
+        else:
+            picked = pool.iloc[0:0]
+        if len(picked) < self.sample_rows:
+            rest = pool.drop(index=picked.index, errors="ignore")
+            step = max(1, len(rest) // max(1, self.sample_rows - len(picked)))
+            picked = pd.concat([picked, rest.iloc[::step]])
+        return picked.head(self.sample_rows).sort_index()
+
+    def _describe(self, stats: _ColumnStats) -> str:
+        parts = []
+        if stats.numeric_count:
+            mean = stats.total / stats.numeric_count
+            var = max(0.0, stats.total_sq / stats.numeric_count - mean * mean)
+            parts.append(
+                f"min {stats.minimum:.6g}, max {stats.maximum:.6g}, "
+                f"mean {mean:.6g}, std {math.sqrt(var):.6g}"
+            )
+        if stats.counts is not None and len(stats.counts):
+            top = stats.counts.nlargest(self.top_values)
+            values = ", ".join(f"{_cell(v)} ({int(c)})" for v, c in top.items())
+            distinct = f"{len(stats.counts)}+" if stats.approximate else str(len(stats.counts))
+            parts.append(f"distinct {distinct}; top: {values}")
+        return "; ".join(parts)
+
+    def render(self, file_name: str) -> str:
+        lines = [
+            f"Table summary of {file_name}: {self.rows} rows, {len(self.columns)} columns",
+            "",
+            "| column | dtype | non-null | nulls | summary |",
+            "|---|---|---|---|---|",
+        ]
+        for name, stats in self.columns.items():
+            lines.append(
+                f"| {_cell(name)} | {'/'.join(stats.dtypes)} | {stats.non_null} | "
+                f"{stats.nulls} | {self._describe(stats)} |"
+            )
+        sample = self.sample()
+        if sample is not None and len(sample):
+            column = self._strata_column()
+            how = f"stratified by {column}" if column else "spread across the file"
+            lines += [
+                "",
+                f"Sample of {len(sample)} rows ({how}):",
+                "```csv",
+                sample.to_csv(index=False).strip(),
+                "```",
+            ]
+        return "\n".join(lines)
+
+
+def _cell(value) -> str:
+    text = str(value).replace("|", "\\|").replace("\n", " ")
+    return text if len(text) <= 40 else text[:37] + "..."
+
+
+def summarize_table(
+    source: Source,
+    file_name: str,
+    chunk_rows: int = 100000,
+    sample_rows: int = 20,
+    top_values: int = 5,
+) -> str:
+    """Read *source* in chunks and return its Markdown summary."""
+    summary = TableSummary(sample_rows, top_values)
+    for chunk in iter_chunks(source, file_name, chunk_rows):
+        summary.add(chunk)
+    return summary.render(os.path.basename(file_name))
@@ -0,0 +1,160 @@
+# tmp_writer.py
+
+import atexit
+import os
+import threading
+import time
+import weakref
+from typing import IO, List, Optional
+
+from error_logger import ErrorLogger
+
+DURABILITY_NONE = "none"  # leave data in Python's buffer until sync()
+DURABILITY_FLUSH = "flush"  # hand each batch to the OS
+DURABILITY_FSYNC = "fsync"  # force each batch to disk
+_IDLE_EXIT_SECONDS = 1.0
+
+# Writers whose queued text is written out at interpreter exit; the writer
+# thread is a daemon, so sys.exit() or Ctrl-C would otherwise drop it
+_live_writers: "weakref.WeakSet[BackgroundTmpWriter]" = weakref.WeakSet()
+
+
+def _sync_all() -> None:
+    for writer in list(_live_writers):
+        if not getattr(writer.file, "closed", False):
+            writer.sync()
+
+
+atexit.register(_sync_all)
+
+
+class BackgroundTmpWriter:
+    """
+    Appends streamed chunks to the recovery tmp file from a background thread.
+
+    :meth:`write` only queues text, so a slow disk never delays the stream.
+    The writer thread coalesces queued chunks and writes them as one batch
+    once ``max_batch_bytes`` are pending or ``interval_ms`` has passed, then
+    applies the *durability* policy ("none", "flush" or "fsync") to that
+    batch. :meth:`sync` writes everything queued so far and flushes it (and
+    fsyncs under "fsync"); the agent calls it at loop and run boundaries.
+    :meth:`mark` and :meth:`rewind` cut a retried attempt's text back out.
+    The thread exits when idle and restarts on the next write. Queued text
+    is also synced when the interpreter exits.
+    """
+
+    def __init__(
+        self,
+        file: IO[str],
+        error_logger: ErrorLogger,
+        durability: str = DURABILITY_FLUSH,
+        interval_ms: float = 100.0,
+        max_batch_bytes: int = 64 * 1024,
+    ):
+        if durability not in (DURABILITY_NONE, DURABILITY_FLUSH, DURABILITY_FSYNC):
+            raise ValueError(f"Unknown tmp durability policy: {durability}")
+        self.file = file
+        self.error_logger = error_logger
+        self.durability = durability
+        self.interval = max(0.0, interval_ms) / 1000.0
+        self.max_batch_bytes = max_batch_bytes
+        self._pending: List[str] = []
+        self._pending_bytes = 0
+        self._cond = threading.Condition()
+        # Held while a batch is taken and written so batches never reorder
+        self._io_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        _live_writers.add(self)
+
+    def write(self, text: str) -> None:
+        """Queue *text* for appending; never blocks on I/O."""
+        with self._cond:
+            # The first chunk of a batch wakes an idle thread so it is written
+            # within one interval, not after the idle wait runs out
+            wake = not self._pending
+            self._pending.append(text)
+            self._pending_bytes += len(text)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="laser-tmp-writer", daemon=True
+                )
+                self._thread.start()
+            elif wake or self._pending_bytes >= self.max_batch_bytes:
+                self._cond.notify_all()
+
+    def sync(self) -> None:
+        """Write all queued text now and flush it (fsync under "fsync")."""
+        with self._io_lock:
+            self._write_pending()
+            self._apply_durability(force=True)
+
+    def close(self) -> None:
+        self.sync()
+
+    def mark(self) -> Optional[int]:
+        """
+        Sync and return the file's size, a point :meth:`rewind` can cut the
+        file back to. Returns ``None`` if the size cannot be read.
+        """
+        with self._io_lock:
+            self._write_pending()
+            self._apply_durability(force=True)
+            try:
+                return os.fstat(self.file.fileno()).st_size
+            except Exception as e:
+                self.error_logger.log("WARNING", "Failed to read tmp file size", e)
+                return None
+
+    def rewind(self, size: Optional[int]) -> None:
+        """Drop everything queued or written since :meth:`mark` returned *size*."""
+        if size is None:
+            return
+        with self._io_lock:
+            with self._cond:
+                self._pending, self._pending_bytes = [], 0
+            try:
+                self.file.flush()
+                os.ftruncate(self.file.fileno(), size)
+                self.file.seek(0, os.SEEK_END)
+            except Exception as e:
+                self.error_logger.log("WARNING", "Failed to rewind tmp file; continuing", e)
+
+    def _run(self) -> None:
+        idle_since = time.monotonic()
+        while True:
+            with self._cond:
+                if not self._pending:
+                    if time.monotonic() - idle_since >= _IDLE_EXIT_SECONDS:
+                        self._thread = None
+                        return
+                    self._cond.wait(_IDLE_EXIT_SECONDS)
+                    continue
+                # Let more chunks arrive unless the batch is already large
+                if self._pending_bytes < self.max_batch_bytes and self.interval:
+                    self._cond.wait(self.interval)
+            with self._io_lock:
+                self._write_pending()
+                self._apply_durability()
+            idle_since = time.monotonic()
+
+    def _write_pending(self) -> None:
+        with self._cond:
+            batch = self._pending
+            self._pending, self._pending_bytes = [], 0
+        if batch:
+            try:
+                self.file.write("".join(batch))
+            except Exception as e:
+                self.error_logger.log(
+                    "WARNING", "Failed to write chunk to tmp file; continuing", e
+                )
+
+    def _apply_durability(self, force: bool = False) -> None:
+        if self.durability == DURABILITY_NONE and not force:
+            return
+        try:
+            self.file.flush()
+            if self.durability == DURABILITY_FSYNC:
+                os.fsync(self.file.fileno())
+        except Exception as e:
+            self.error_logger.log("WARNING", "Failed to flush tmp file; continuing", e)
@@ -0,0 +1,124 @@
+# token_counter.py
+
+"""
+Offline token counting calibrated per model family.
+
+Text is split into words, digit runs, CJK characters and punctuation. Each
+word costs ``ceil(len / word_chars)`` tokens for the model family, digit runs
+are grouped the way the family's tokenizer groups them, and CJK characters
+and punctuation cost one token each. Counts of long texts are memoized by a
+hash of their content, so unchanged buffers are only counted once.
+"""
+
+import hashlib
+import math
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass(frozen=True)
+class TokenProfile:
+    word_chars: float  # average characters per token inside a word
+    digit_group: int  # digits merged into one token
+
+
+# Matched against the lowercased model name, first hit wins
+_FAMILIES = (
+    ("gemini", TokenProfile(word_chars=5.0, digit_group=1)),
+    ("gemma", TokenProfile(word_chars=5.0, digit_group=1)),
+    ("gpt", TokenProfile(word_chars=4.5, digit_group=3)),
+    ("claude", TokenProfile(word_chars=4.0, digit_group=3)),
+)
+# Used for unknown models; errs towards counting more tokens
+DEFAULT_PROFILE = TokenProfile(word_chars=4.0, digit_group=1)
+
+_PIECE = re.compile(
+    "[\u3040-\u30ff\u3400-\u9fff\uac00-\ud7af\uf900-\ufaff]"  # CJK: one token each
+    r"|(?P<word>[^\W\d_]+)"
+    r"|(?P<digits>\d+)"
+    r"|\S"
+)
+
+# Texts shorter than this are cheaper to count than to hash
+MEMO_MIN_CHARS = 256
+MEMO_MAX_ENTRIES = 4096
+
+
+def profile_for(model: Optional[str]) -> TokenProfile:
+    """Return the calibration profile for *model* (e.g. ``models/gemini-2.0-pro``)."""
+    if model:
+        name = model.lower()
+        for family, profile in _FAMILIES:
+            if family in name:
+                return profile
+    return DEFAULT_PROFILE
+
+
+def _count(text: str, profile: TokenProfile) -> int:
+    tokens = 0
+    word_chars = profile.word_chars
+    digit_group = profile.digit_group
+    for m in _PIECE.finditer(text):
+        kind = m.lastgroup
+        if kind == "word":
+            n = m.end() - m.start()
+            tokens += math.ceil(n / word_chars)
+        elif kind == "digits":
+            tokens += math.ceil((m.end() - m.start()) / digit_group)
+        else:
+            tokens += 1
+    return tokens
+
+
+class TokenCounter:
+    """Counts tokens with a bounded memo keyed by content hash and profile."""
+
+    def __init__(self, max_entries: int = MEMO_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._memo: "OrderedDict[tuple, int]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def count(self, text: str, model: Optional[str] = None) -> int:
+        profile = profile_for(model)
+        if len(text) < MEMO_MIN_CHARS:
+            return _count(text, profile)
+        digest = hashlib.blake2b(
+            text.encode("utf-8", "surrogatepass"), digest_size=16
+        ).digest()
+        key = (digest, profile)
+        with self._lock:
+            cached = self._memo.get(key)
+            if cached is not None:
+                self._memo.move_to_end(key)
+                self.hits += 1
+                return cached
+            self.misses += 1
+        tokens = _count(text, profile)
+        with self._lock:
+            self._memo[key] = tokens
+            if len(self._memo) > self.max_entries:
+                self._memo.popitem(last=False)
+        return tokens
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memo.clear()
+            self.hits = self.misses = 0
+
+
+_counter = TokenCounter()
+
+
+def get_counter() -> TokenCounter:
+    """Return the process-wide counter used by :func:`count_tokens`."""
+    return _counter
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """Approximate the number of tokens *model* would see in *text*."""
+    return _counter.count(text, model)
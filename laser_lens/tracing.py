@@ -0,0 +1,152 @@
+# tracing.py
+
+import contextlib
+import contextvars
+import itertools
+import json
+import os
+import threading
+import time
+from typing import Any, ContextManager, Dict, Iterator, List, Optional, Tuple, Union
+
+# (name, category, track, start_us, args)
+SpanToken = Tuple[str, str, int, float, Dict[str, Any]]
+
+# Track for spans that do not name one; set per agent run (and inherited by
+# asyncio tasks and asyncio.to_thread) so concurrent agents stay apart.
+_current_track: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar(
+    "laser_lens_trace_track", default=None
+)
+
+
+class Tracer:
+    """
+    Records nested spans and writes them in Chrome trace format, which
+    Perfetto (ui.perfetto.dev) and chrome://tracing open directly.
+
+    Spans are complete ("X") events. Events on the same *track* nest by
+    time, so each agent run gets its own track from :meth:`new_track` (made
+    current with :func:`set_current_track`); spans recorded elsewhere, e.g.
+    in command worker threads, fall back to one track per thread.
+    """
+
+    enabled = True
+
+    def __init__(self) -> None:
+        self._origin = time.perf_counter()
+        self._pid = os.getpid()
+        self._events: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._tracks = itertools.count(1)
+        self._named_threads: set = set()
+
+    def new_track(self, label: str) -> int:
+        """Return a track id shown in the viewer as *label*."""
+        track = next(self._tracks)
+        self._append(
+            {"ph": "M", "name": "thread_name", "pid": self._pid, "tid": track,
+             "args": {"name": label}}
+        )
+        return track
+
+    def begin(
+        self, name: str, cat: str = "agent", track: Optional[int] = None, **args: Any
+    ) -> SpanToken:
+        """Start a span; pass the returned token to :meth:`end`."""
+        tid = track if track is not None else _current_track.get()
+        if tid is None:
+            tid = threading.get_ident()
+            if tid not in self._named_threads:
+                self._named_threads.add(tid)
+                self._append(
+                    {"ph": "M", "name": "thread_name", "pid": self._pid, "tid": tid,
+                     "args": {"name": threading.current_thread().name}}
+                )
+        return (name, cat, tid, self._now_us(), args)
+
+    def end(self, token: SpanToken, **args: Any) -> None:
+        """Finish a span started with :meth:`begin`, optionally adding args."""
+        name, cat, tid, start, span_args = token
+        if args:
+            span_args = {**span_args, **args}
+        self._append(
+            {"ph": "X", "name": name, "cat": cat, "pid": self._pid, "tid": tid,
+             "ts": start, "dur": self._now_us() - start, "args": span_args}
+        )
+
+    @contextlib.contextmanager
+    def span(
+        self, name: str, cat: str = "agent", track: Optional[int] = None, **args: Any
+    ) -> Iterator[None]:
+        """Context manager recording the enclosed block as one span."""
+        token = self.begin(name, cat, track, **args)
+        try:
+            yield
+        finally:
+            self.end(token)
+
+    def events(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._events)
+
+    def export(self, path: str) -> None:
+        """Write all recorded events to *path* as a Chrome trace JSON file."""
+        path = os.path.expanduser(path)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": self.events(), "displayTimeUnit": "ms"}, f)
+
+    def _now_us(self) -> float:
+        return (time.perf_counter() - self._origin) * 1_000_000
+
+    def _append(self, event: Dict[str, Any]) -> None:
+        with self._lock:
+            self._events.append(event)
+
+
+class NullTracer:
+    """Tracer used when tracing is off; every call is a cheap no-op."""
+
+    enabled = False
+    _NULL_SPAN: ContextManager[None] = contextlib.nullcontext()
+    _NULL_TOKEN: SpanToken = ("", "", 0, 0.0, {})
+
+    def new_track(self, label: str) -> int:
+        return 0
+
+    def begin(
+        self, name: str, cat: str = "agent", track: Optional[int] = None, **args: Any
+    ) -> SpanToken:
+        return self._NULL_TOKEN
+
+    def end(self, token: SpanToken, **args: Any) -> None:
+        pass
+
+    def span(
+        self, name: str, cat: str = "agent", track: Optional[int] = None, **args: Any
+    ) -> ContextManager[None]:
+        return self._NULL_SPAN
+
+    def events(self) -> List[Dict[str, Any]]:
+        return []
+
+
+_tracer: Union[Tracer, NullTracer] = NullTracer()
+
+
+def get_tracer() -> Union[Tracer, NullTracer]:
+    """Return the process-wide tracer (a :class:`NullTracer` unless set)."""
+    return _tracer
+
+
+def set_tracer(tracer: Optional[Tracer]) -> None:
+    """Install *tracer* process-wide; ``None`` turns tracing off again."""
+    global _tracer
+    _tracer = tracer if tracer is not None else NullTracer()
+
+
+def set_current_track(track: Optional[int]) -> None:
+    """Make *track* the default for spans in the current context."""
+    _current_track.set(track)
@@ -12,6 +12,7 @@ from command_executor import CommandExecutor
 from context_manager import ContextManager
 from output_manager import OutputManager
 from agent_state import AgentState
+from loop_memory import clear_memory
 from recursive_agent import RecursiveAgent, CancelledException
 
 from utils import (
@@ -26,6 +27,8 @@ from utils import (
     save_pref_key,
 )
 from command_registration import register_core_commands
+from api_key_pool import ApiKeyPool
+from metrics import format_metrics
 
 
 def get_available_models(api_key: str | None = None) -> list[str]:
@@ -75,7 +78,7 @@ context_manager = st.session_state.context_manager
 agent_state = AgentState(config, logger)
 
 # Register command handlers
-ce = CommandExecutor(logger)
+ce = CommandExecutor(logger, workers=config.command_workers)
 register_core_commands(ce)
 try:
     from command_registration import register_plugin_commands
@@ -126,6 +129,8 @@ if "rpm" not in st.session_state:
     st.session_state.rpm = config.default_rpm
 if "thinking_mode" not in st.session_state:
     st.session_state.thinking_mode = config.default_thinking_mode
+if "use_key_pool" not in st.session_state:
+    st.session_state.use_key_pool = False
 if "reset_pause_msg" not in st.session_state:
     st.session_state.reset_pause_msg = False
 
@@ -134,11 +139,11 @@ if "uploaded_files_list" not in st.session_state:
     st.session_state.uploaded_files_list = []
 
 
-# Sidebar: File uploader for context or resume (.md, .txt, .tmp)
+# Sidebar: File uploader for context or resume (.md, .txt, .tmp) and tables
 st.sidebar.header("Upload Context / Resume")
 uploaded_files = st.sidebar.file_uploader(
-    "Upload .md, .txt or .tmp",
-    type=["md", "txt", "tmp"],
+    "Upload .md, .txt, .tmp or a table (.csv, .tsv, .parquet)",
+    type=["md", "txt", "tmp", "csv", "tsv", "parquet"],
     accept_multiple_files=True,
     key="file_uploader",
 )
@@ -171,6 +176,12 @@ with st.sidebar.form("agent_settings"):
     key_names = [k["name"] for k in st.session_state.api_keys]
     if key_names:
         st.selectbox("API Key", key_names, key="api_key_name")
+    key_pool_in = st.checkbox(
+        "Rotate across all keys",
+        value=st.session_state.use_key_pool,
+        help="Switch to another saved key when one hits its quota.",
+        key="key_pool_in",
+    )
     temp_in = st.slider(
         "Temperature", 0.0, 1.0, value=st.session_state.temperature, key="temp_in"
     )
@@ -241,6 +252,7 @@ if apply_btn or start_btn:
     st.session_state.seed = seed_in
     st.session_state.rpm = rpm_in
     st.session_state.thinking_mode = thinking_in
+    st.session_state.use_key_pool = key_pool_in
     new_models = get_available_models(selected_api_key_value())
     st.session_state.models_available = new_models
     if st.session_state.model_name not in new_models:
@@ -341,6 +353,7 @@ if st.sidebar.button("🔄 Reset State"):
     # Also remove any tmp_path reference so next run starts fresh
     agent_state.delete_state("tmp_path")
     agent_state.save_state()
+    clear_memory(agent_state.state_dir, logger)
 
     # 3) Clear any uploaded context in ContextManager
     context_manager.clear_context()
@@ -389,6 +402,7 @@ def start_agent() -> bool:
     agent_state.delete_state("cancelled")
     agent_state.delete_state("tmp_path")
     agent_state.save_state()
+    clear_memory(agent_state.state_dir, logger)
 
     # Clear UI placeholders
     st.session_state.stream_placeholder.empty()
@@ -403,6 +417,11 @@ def start_agent() -> bool:
         if not api_key_val:
             st.session_state.error_container.error("No API key selected")
             return False
+        key_pool = None
+        if st.session_state.use_key_pool and len(st.session_state.api_keys) > 1:
+            key_pool = ApiKeyPool.from_stored_keys(
+                config, st.session_state.rpm, error_logger=logger
+            )
 
         st.session_state.agent = RecursiveAgent(
             config=config,
@@ -419,6 +438,7 @@ def start_agent() -> bool:
             rpm=st.session_state.rpm,
             api_key=api_key_val,
             thinking_mode=st.session_state.thinking_mode,
+            key_pool=key_pool,
         )
         return True
     except Exception as e:
@@ -459,9 +479,19 @@ def run_stream():
                 if text_placeholder:
                     text_placeholder.markdown(buffer)
 
+            elif event_type == "retry":
+                # The failed attempt's chunks are streamed again from the start
+                buffer = ""
+                if text_placeholder:
+                    text_placeholder.markdown(buffer)
+
+            elif event_type == "metrics":
+                if loop_container:
+                    loop_container.caption(format_metrics(payload))
+
             elif event_type == "loop_end":
                 # Re-render final loop with command outputs
-                full_text = buffer
+                full_text = payload
                 if text_placeholder:
                     text_placeholder.empty()
                 render_container = loop_container.container() # type: ignore[assignment]
@@ -4,7 +4,10 @@ import os
 import json
 import re
 import unicodedata
-from typing import List, Tuple
+from collections import deque
+from typing import Deque, Iterator, List, Optional, TextIO, Tuple
+
+import token_counter
 
 PREFS_PATH = os.path.expanduser("~/.laser_lens_prefs.json")
 KEYS_PATH = os.path.expanduser("~/.laser_lens_keys.json")
@@ -33,12 +36,12 @@ def suggest_filename(topic: str) -> str:
     return f"{base}_{ts}.md"
 
 
-def count_tokens(text: str) -> int:
+def count_tokens(text: str, model: Optional[str] = None) -> int:
     """
-    Approximate token count by characters for now.
-    Future improvement: integrate tiktoken.
+    Approximate token count for *model* (see token_counter for the calibration).
+    Counts of long texts are memoized by content hash.
     """
-    return len(text)
+    return token_counter.count_tokens(text, model)
 
 
 def parse_tmp(raw: str, delim: str) -> Tuple[List[str], str]:
@@ -55,6 +58,56 @@ def parse_tmp(raw: str, delim: str) -> Tuple[List[str], str]:
     return (completed, last)
 
 
+def iter_tmp_chunks(
+    stream: TextIO,
+    delim: str,
+    block_chars: int = 64 * 1024,
+    max_segment_chars: Optional[int] = None,
+) -> Iterator[str]:
+    """
+    Streaming counterpart of parse_tmp: read *stream* in blocks and yield each
+    completed (delimiter-terminated), non-blank segment. The trailing partial
+    segment is not yielded.
+
+    Each block is searched once, together with the last ``len(delim) - 1``
+    characters before it, and the blocks of the current segment are joined
+    only when its delimiter arrives, so a file with few delimiters still
+    takes linear time. With *max_segment_chars* only about that many of a
+    segment's most recent characters are held (and yielded).
+    """
+    pieces: Deque[str] = deque()
+    held = 0
+    overlap = len(delim) - 1
+    while True:
+        block = stream.read(block_chars)
+        if not block:
+            return
+        # A delimiter may start in the held text and end in this block
+        carry = ""
+        if overlap and pieces:
+            last = pieces.pop()
+            carry = last[-overlap:]
+            if len(last) > len(carry):
+                pieces.append(last[: len(last) - len(carry)])
+            held -= len(carry)
+        parts = (carry + block).split(delim)
+        if len(parts) > 1:
+            pieces.append(parts[0])
+            segment = "".join(pieces)
+            if segment.strip():
+                yield segment
+            for part in parts[1:-1]:
+                if part.strip():
+                    yield part
+            pieces = deque()
+            held = 0
+        pieces.append(parts[-1])
+        held += len(parts[-1])
+        if max_segment_chars is not None:
+            while len(pieces) > 1 and held - len(pieces[0]) >= max_segment_chars:
+                held -= len(pieces.popleft())
+
+
 def build_markdown(history: list, topic: str) -> str:
     """
     Given history=[{"prompt":…, "response":…, "timestamp":…}, …],
@@ -0,0 +1,162 @@
+import os
+import sys
+import types
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "laser_lens"))
+sys.path.insert(0, ROOT)
+
+# Stub google modules
+google = types.ModuleType("google")
+generativeai = types.ModuleType("generativeai")
+class DummyModel:
+    def __init__(self, *a, **k):
+        pass
+
+generativeai.GenerativeModel = DummyModel
+google.generativeai = generativeai
+sys.modules.setdefault("google", google)
+sys.modules.setdefault("google.generativeai", generativeai)
+
+from recursive_agent import RecursiveAgent  # noqa: E402
+from adaptive_rate import AdaptiveRateController, CircuitBreaker  # noqa: E402
+from command_executor import CommandExecutor  # noqa: E402
+from context_manager import ContextManager  # noqa: E402
+from output_manager import OutputManager  # noqa: E402
+from agent_state import AgentState  # noqa: E402
+from error_logger import ErrorLogger  # noqa: E402
+from config import Config  # noqa: E402
+
+
+def test_aimd_decreases_and_recovers():
+    cfg = Config(aimd_decrease_factor=0.5, aimd_increase_rpm=10.0, aimd_min_rpm=2.0)
+    ctrl = AdaptiveRateController(cfg, 60)
+    assert ctrl.reserve() == 0.0
+    ctrl.on_overload()
+    assert ctrl.rate == 30
+    for _ in range(5):
+        ctrl.on_overload()
+    assert ctrl.rate == 2.0
+    assert ctrl.reserve() == 0.0
+    assert 29 < ctrl.reserve() <= 30  # second request waits 60/2 seconds
+    for _ in range(10):
+        ctrl.on_success()
+    assert ctrl.rate == 60
+
+
+def test_breaker_opens_and_half_opens(monkeypatch):
+    cfg = Config(breaker_min_calls=3, breaker_failure_ratio=0.5, breaker_cooldown_seconds=30)
+    breaker = CircuitBreaker(cfg)
+    clock = [1000.0]
+    monkeypatch.setattr("adaptive_rate.time.time", lambda: clock[0])
+    breaker.record(True)
+    breaker.record(False)
+    assert breaker.allow()
+    breaker.record(False)
+    assert breaker.state == "open"
+    assert not breaker.allow()
+    assert breaker.retry_after() == 30
+    clock[0] += 31
+    assert breaker.allow()  # single trial
+    assert not breaker.allow()
+    breaker.record(True)
+    assert breaker.state == "closed"
+
+
+def make_agent(tmp_path, **cfg_overrides):
+    cfg = Config(
+        safe_output_dir=str(tmp_path / "out"),
+        agent_state_dir=str(tmp_path / "state"),
+        rate_limit_dir=str(tmp_path / "rl"),
+        backoff_base_seconds=0.0,
+        overload_backoff_seconds=0.0,
+        **cfg_overrides,
+    )
+    logger = ErrorLogger(cfg)
+    om = OutputManager(cfg, logger)
+    return RecursiveAgent(
+        config=cfg,
+        error_logger=logger,
+        command_executor=CommandExecutor(logger),
+        context_manager=ContextManager(cfg, logger, om),
+        output_manager=om,
+        agent_state=AgentState(cfg, logger),
+        model_name="dummy",
+        topic="t",
+        loops=1,
+        temperature=0.0,
+        seed=None,
+        rpm=60000,
+        api_key="x",
+    )
+
+
+def test_overload_slows_rate_then_recovers(tmp_path):
+    agent = make_agent(tmp_path, aimd_increase_rpm=1.0)
+    attempts = []
+
+    class FakeClient:
+        def generate_content(self, prompt, stream=True):
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise Exception("503 The model is overloaded")
+            return iter([types.SimpleNamespace(text="ok")])
+
+    agent.client = FakeClient()
+    agent.rate_controller.reserve = lambda: 0.0  # keep the test fast
+    events = list(agent.run())
+    assert events[-1] == ("loop_end", 1, 1, "ok")
+    assert agent.rate_controller.rate == 30001
+    assert agent.circuit_breaker.state == "closed"
+
+
+def test_open_breaker_fails_fast(tmp_path):
+    agent = make_agent(tmp_path, max_retries=5, breaker_min_calls=2, breaker_failure_ratio=1.0)
+    attempts = []
+
+    class FakeClient:
+        def generate_content(self, prompt, stream=True):
+            attempts.append(1)
+
+            def failing():
+                raise Exception("boom")
+                yield
+
+            return failing()
+
+    agent.client = FakeClient()
+    events = list(agent.run())
+    assert len(attempts) == 2
+    assert events[-1][0] == "error"
+    assert "circuit breaker" in events[-1][3][0]
+
+
+def test_abandoned_trial_is_released(tmp_path):
+    agent = make_agent(tmp_path, breaker_cooldown_seconds=0)
+    breaker = agent.circuit_breaker
+    breaker._open()
+    assert breaker.allow() and breaker.state == "half_open"
+    breaker.release()
+    attempts = []
+
+    class FakeClient:
+        def generate_content(self, prompt, stream=True):
+            attempts.append(1)
+            return iter([types.SimpleNamespace(text="partial"), types.SimpleNamespace(text="!")])
+
+    agent.client = FakeClient()
+    events = agent.run()
+    assert next(events)[0] == "chunk"
+    events.close()  # consumer stops mid-stream; the trial has no outcome
+    assert breaker.state == "half_open"
+    assert breaker.allow()  # the next trial is let through
+    breaker.record(True)
+    assert breaker.state == "closed"
+
+
+def test_retry_delay_jitter_and_cap(tmp_path):
+    agent = make_agent(tmp_path, backoff_max_seconds=8.0)
+    agent.config = Config(backoff_max_seconds=8.0, overload_backoff_seconds=4.0)
+    delay, nxt = agent._retry_delay(Exception("503 overloaded"), 1.0)
+    assert 2.0 <= delay <= 4.0 and nxt == 8.0
+    delay, nxt = agent._retry_delay(Exception("other"), 100.0)
+    assert 4.0 <= delay <= 8.0
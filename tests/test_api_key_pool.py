@@ -0,0 +1,132 @@
+import os
+import sys
+import types
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "laser_lens"))
+sys.path.insert(0, ROOT)
+
+# Provide dummy google modules so recursive_agent can be imported
+google = types.ModuleType("google")
+generativeai = types.ModuleType("generativeai")
+class DummyModel:
+    def __init__(self, *a, **k):
+        pass
+
+generativeai.GenerativeModel = DummyModel
+
+api_core = types.ModuleType("api_core")
+exc_mod = types.ModuleType("exceptions")
+class QuotaError(Exception):
+    pass
+exc_mod.ResourceExhausted = QuotaError
+api_core.exceptions = exc_mod
+
+google.generativeai = generativeai
+google.api_core = api_core
+sys.modules.setdefault("google", google)
+sys.modules.setdefault("google.generativeai", generativeai)
+sys.modules.setdefault("google.api_core", api_core)
+sys.modules.setdefault("google.api_core.exceptions", exc_mod)
+
+import recursive_agent  # noqa: E402
+from recursive_agent import RecursiveAgent  # noqa: E402
+from api_key_pool import ApiKeyPool  # noqa: E402
+from command_executor import CommandExecutor  # noqa: E402
+from context_manager import ContextManager  # noqa: E402
+from output_manager import OutputManager  # noqa: E402
+from agent_state import AgentState  # noqa: E402
+from error_logger import ErrorLogger  # noqa: E402
+from config import Config  # noqa: E402
+
+
+def make_config(tmp_path, **kw):
+    return Config(
+        safe_output_dir=str(tmp_path / "out"),
+        agent_state_dir=str(tmp_path / "state"),
+        rate_limit_dir=str(tmp_path / "rl"),
+        **kw,
+    )
+
+
+def test_pool_prefers_least_loaded_key(tmp_path):
+    cfg = make_config(tmp_path, rate_limit_burst=1)
+    pool = ApiKeyPool(cfg, [("a", "key-a"), ("b", "key-b")], rpm=60)
+    first, wait1 = pool.acquire()
+    second, wait2 = pool.acquire()
+    assert {first.name, second.name} == {"a", "b"}
+    assert wait1 == 0 and wait2 == 0
+
+
+def test_exhausted_key_cools_down(tmp_path):
+    cfg = make_config(tmp_path, key_cooldown_seconds=30)
+    pool = ApiKeyPool(cfg, [("a", "key-a"), ("b", "key-b")], rpm=60)
+    entry, _ = pool.acquire()
+    pool.mark_exhausted(entry)
+    for _ in range(3):
+        other, _ = pool.acquire()
+        assert other.name != entry.name
+        pool.release(other)
+    pool.mark_exhausted(other)
+    assert not pool.has_healthy_key()
+    _, wait = pool.acquire()
+    assert 25 < wait <= 30
+
+
+def test_agent_rotates_key_on_quota_error(tmp_path, monkeypatch):
+    calls = []
+
+    class FakeModel:
+        def __init__(self, *a, **k):
+            pass
+
+        def generate_content(self, prompt, stream=True):
+            key = self._client.api_key
+            calls.append(key)
+            if key == "key-a":
+                raise QuotaError("quota exceeded")
+            return iter([types.SimpleNamespace(text="ok")])
+
+    class FakeServiceClient:
+        def __init__(self, client_options):
+            self.api_key = client_options["api_key"]
+
+    glm = types.ModuleType("generativelanguage")
+    glm.GenerativeServiceClient = FakeServiceClient
+    ai = types.ModuleType("ai")
+    ai.generativelanguage = glm
+    monkeypatch.setitem(sys.modules, "google.ai", ai)
+    monkeypatch.setitem(sys.modules, "google.ai.generativelanguage", glm)
+    monkeypatch.setattr(recursive_agent.genai, "GenerativeModel", FakeModel, raising=False)
+    monkeypatch.setattr(recursive_agent.genai, "api_key", "global", raising=False)
+
+    def configure(**kw):
+        raise AssertionError("pooled keys must not reconfigure the SDK globally")
+
+    monkeypatch.setattr(recursive_agent.genai, "configure", configure, raising=False)
+
+    cfg = make_config(tmp_path)
+    logger = ErrorLogger(cfg)
+    om = OutputManager(cfg, logger)
+    pool = ApiKeyPool(cfg, [("a", "key-a"), ("b", "key-b")], rpm=60000)
+    # Make key-a look least loaded so it is tried first
+    pool._entries[1].in_flight = 5
+    agent = RecursiveAgent(
+        config=cfg,
+        error_logger=logger,
+        command_executor=CommandExecutor(logger),
+        context_manager=ContextManager(cfg, logger, om),
+        output_manager=om,
+        agent_state=AgentState(cfg, logger),
+        model_name="dummy",
+        topic="t",
+        loops=1,
+        temperature=0.0,
+        seed=None,
+        rpm=60000,
+        key_pool=pool,
+    )
+
+    events = list(agent.run())
+    assert events[-1] == ("loop_end", 1, 1, "ok")
+    assert calls == ["key-a", "key-b"]
+    assert recursive_agent.genai.api_key == "global"
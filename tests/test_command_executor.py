@@ -1,10 +1,17 @@
 import os
 import sys
+import threading
+import time
 
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "laser_lens"))
 sys.path.insert(0, ROOT)
 
-from command_executor import CommandExecutor  # noqa: E402
+from command_executor import (  # noqa: E402
+    ACCESS_READ,
+    ACCESS_WRITE,
+    CommandExecutor,
+    CommandScheduler,
+)
 from error_logger import ErrorLogger  # noqa: E402
 from config import Config  # noqa: E402
 from command_registration import register_core_commands  # noqa: E402
@@ -64,3 +71,70 @@ def test_single_quote_args(tmp_path):
     ce.register_command("FOO", foo)
     results = ce.parse_and_execute("[[COMMAND: FOO val='bar baz']]")
     assert results == [("FOO", "bar baz")]
+
+
+def test_parallel_reads_overlap(tmp_path):
+    cfg = Config(safe_output_dir=str(tmp_path))
+    ce = CommandExecutor(ErrorLogger(cfg), workers=4)
+    barrier = threading.Barrier(2, timeout=2)
+
+    def read(args):
+        barrier.wait()  # only passes if both reads run at once
+        return args["filename"]
+
+    ce.register_command("R", read, access=ACCESS_READ)
+    results = ce.parse_and_execute('[[COMMAND: R filename="a"]] [[COMMAND: R filename="b"]]')
+    assert results == [("R", "a"), ("R", "b")]
+
+
+def test_parallel_keeps_conflicting_order(tmp_path):
+    cfg = Config(safe_output_dir=str(tmp_path))
+    ce = CommandExecutor(ErrorLogger(cfg), workers=4)
+    log = []
+
+    def write(args):
+        time.sleep(0.05)
+        log.append(("w", args["filename"]))
+        return "ok"
+
+    def read(args):
+        log.append(("r", args["filename"]))
+        return "data"
+
+    def halt(args):
+        log.append(("x", None))
+        return "halt"
+
+    ce.register_command("W", write, access=ACCESS_WRITE)
+    ce.register_command("R", read, access=ACCESS_READ)
+    ce.register_command("X", halt)
+    text = (
+        '[[COMMAND: W filename="a"]] [[COMMAND: R filename="b"]] '
+        '[[COMMAND: R filename="a"]] [[COMMAND: X]] [[COMMAND: R filename="b"]]'
+    )
+    results = ce.parse_and_execute(text)
+    assert [name for name, _ in results] == ["W", "R", "R", "X", "R"]
+    assert log.index(("w", "a")) < log.index(("r", "a"))
+    assert log.index(("w", "a")) < log.index(("x", None))
+    assert log[-1] == ("r", "b")
+    assert log[0] == ("r", "b")  # unrelated read did not wait for the write
+
+
+def test_conflicts_use_the_handlers_file_names(tmp_path):
+    ce = CommandExecutor(ErrorLogger(Config(safe_output_dir=str(tmp_path))), workers=4)
+    register_core_commands(ce)
+    scheduler = CommandScheduler(ce)
+    pattern = CommandExecutor.COMMAND_PATTERN
+
+    def conflicts(a, b):
+        first = scheduler._classify(pattern.search(a))
+        return scheduler._conflicts(*first, *scheduler._classify(pattern.search(b)))
+
+    write = '[[COMMAND: WRITE_FILE filename="drafts/notes.md" content="x"]]'
+    assert conflicts(write, '[[COMMAND: READ_FILE filename="notes.md"]]')
+    assert conflicts('[[COMMAND: WRITE_FILE filename="report" content="x"]]',
+                     '[[COMMAND: CAT filename="report.txt"]]')
+    assert conflicts('[[COMMAND: RM filename="my notes.md"]]',
+                     '[[COMMAND: READ_FILE filename="my_notes.md"]]')
+    assert not conflicts(write, '[[COMMAND: READ_FILE filename="other.md"]]')
+    scheduler.close()
@@ -0,0 +1,85 @@
+import base64
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "laser_lens"))
+sys.path.insert(0, ROOT)
+
+from compaction import CompactionPipeline  # noqa: E402
+from context_manager import ContextManager  # noqa: E402
+from config import Config  # noqa: E402
+
+
+def run(stage, text, **kwargs):
+    pipeline = CompactionPipeline([stage], **kwargs)
+    return pipeline.run(text), pipeline.stats[stage]
+
+
+def test_whitespace_keeps_indentation_and_code():
+    text = "Para  with   gaps   \n\n\n\n    indented  code\n```\nx  =  1\n```"
+    out, stats = run("whitespace", text)
+    assert out == "Para with gaps\n\n    indented code\n```\nx  =  1\n```"
+    assert stats.chars > 0
+
+
+def test_data_uris_and_base64_lines_replaced():
+    blob = base64.b64encode(os.urandom(300)).decode()
+    text = f"![img](data:image/png;base64,{blob})\n{blob}\nplain text"
+    out, stats = run("data_uris", text)
+    assert blob not in out
+    assert "data:image/png;base64,[" in out and "[base64 blob," in out
+    assert out.endswith("plain text")
+    assert stats.tokens > 0
+
+
+def test_repeated_lines_collapsed():
+    out, _ = run("repeated_lines", "a\nb\nb\nc\nc\nc\nc\nd")
+    assert out == "a\nb\nb\nc\n[previous line repeated 3 more times]\nd"
+
+
+def test_long_table_summarized():
+    rows = [f"| {i} | name{i} | {i * 2} |" for i in range(100)]
+    text = "\n".join(["intro", "| id | name | value |", "|---|---|---|", *rows, "outro"])
+    out, stats = run("tables", text, table_rows=5)
+    lines = out.split("\n")
+    assert lines[:3] == ["intro", "| id | name | value |", "|---|---|---|"]
+    assert "| ... 95 more rows omitted (3 columns) ... |" in lines
+    assert lines[-2:] == ["| 99 | name99 | 198 |", "outro"]
+    assert stats.tokens > 0
+
+
+def test_long_code_fence_keeps_head_and_tail():
+    body = [f"line {i}" for i in range(200)]
+    out, _ = run("code_fences", "\n".join(["```python", *body, "```"]), fence_lines=10)
+    lines = out.split("\n")
+    assert lines[0] == "```python" and lines[-1] == "```"
+    assert lines[1:6] == body[:5] and lines[-6:-1] == body[-5:]
+    assert "[... 190 lines omitted ...]" in lines
+
+
+def test_unknown_stage_rejected():
+    with pytest.raises(ValueError):
+        CompactionPipeline(["whitespace", "nope"])
+
+
+def test_upload_is_compacted_and_savings_reported(tmp_path):
+    stages = ("whitespace", "data_uris", "repeated_lines", "tables", "code_fences")
+    cm = ContextManager(Config(safe_output_dir=str(tmp_path), compaction_stages=stages))
+    table = "\n".join(["| a | b |", "|---|---|", *[f"| {i} | {i} |" for i in range(500)]])
+    cm.upload_context("notes.md", f"Notes   here\n\n\n\n{table}\n".encode())
+    ctx = cm.get_context()
+    assert "Notes here" in ctx and "more rows omitted" in ctx
+    stats = cm.compaction_stats
+    assert stats["tables"]["tokens"] > 1000 and stats["whitespace"]["chars"] > 0
+
+    lossless = ContextManager(Config(safe_output_dir=str(tmp_path)))
+    lossless.upload_context("notes.md", f"Notes   here\n\n\n\n{table}\n".encode())
+    ctx = lossless.get_context()
+    assert "Notes here" in ctx and "| 250 | 250 |" in ctx
+    assert "tables" not in lossless.compaction_stats
+
+    off = ContextManager(Config(safe_output_dir=str(tmp_path), compaction_stages=()))
+    off.upload_context("notes.md", b"Notes   here")
+    assert "Notes   here" in off.get_context() and off.compaction_stats == {}
@@ -10,15 +10,39 @@ from output_manager import OutputManager  # noqa: E402
 from config import Config  # noqa: E402
 
 
-def test_oversize_file_truncated():
-    cfg = Config(max_context_tokens=120, safe_output_dir="./test_outputs")
+def test_oversize_file_truncated(tmp_path):
+    cfg = Config(
+        max_context_tokens=120,
+        safe_output_dir=str(tmp_path / "out"),
+        agent_state_dir=str(tmp_path / "state"),
+    )
     logger = ErrorLogger(cfg)
     om = OutputManager(cfg, logger)
     cm = ContextManager(cfg, logger, om)
-    cm.upload_context("big.txt", b"A" * 200)
+    cm.upload_context("big.txt", b"A" * 2000)
     ctx = cm.get_context()
     assert "WARNING:" in ctx
     assert "[truncated]" in ctx
     assert "Context from: big.txt" in ctx
     files = om.list_outputs()
     assert any("full_big.txt" in f for f in files)
+
+
+def test_get_context_cached_until_changed(tmp_path):
+    cfg = Config(safe_output_dir=str(tmp_path))
+    cm = ContextManager(cfg)
+    cm.upload_context("a.txt", b"alpha")
+    version = cm.version
+    first = cm.get_context()
+    assert cm.get_context() is first
+    assert not cm.changed_since(version)
+
+    cm.add_inline_context("beta")
+    assert cm.changed_since(version)
+    assert "beta" in cm.get_context()
+    clone = cm.copy()
+    assert clone.get_context() is cm.get_context()
+
+    version = cm.version
+    cm.clear_context()
+    assert cm.changed_since(version) and cm.get_context() == ""
@@ -0,0 +1,215 @@
+import dataclasses
+import os
+import sys
+import time
+import types
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "laser_lens"))
+sys.path.insert(0, ROOT)
+
+pytest.importorskip("numpy")
+
+# Stub google modules
+google = types.ModuleType("google")
+generativeai = types.ModuleType("generativeai")
+class DummyModel:
+    def __init__(self, *a, **k):
+        pass
+
+generativeai.GenerativeModel = DummyModel
+google.generativeai = generativeai
+sys.modules.setdefault("google", google)
+sys.modules.setdefault("google.generativeai", generativeai)
+
+import prompt_budget  # noqa: E402
+from context_index import ContextIndex, FileSource, chunk_spans  # noqa: E402
+from recursive_agent import RecursiveAgent  # noqa: E402
+from command_executor import CommandExecutor  # noqa: E402
+from context_manager import ContextManager  # noqa: E402
+from output_manager import OutputManager  # noqa: E402
+from agent_state import AgentState  # noqa: E402
+from error_logger import ErrorLogger  # noqa: E402
+from config import Config  # noqa: E402
+from utils import count_tokens  # noqa: E402
+
+
+def filler(i):
+    return f"Paragraph {i} talks about weather, lunch and assorted trivia number {i}."
+
+
+def document(n, secret_at):
+    paras = [filler(i) for i in range(n)]
+    paras[secret_at] = "The reactor coolant pump failed because the impeller seal cracked."
+    return "\n\n".join(paras)
+
+
+def test_selects_relevant_middle_chunk_in_document_order():
+    index = ContextIndex([("doc.md", document(200, 120))], "===", chunk_chars=100)
+    selected = index.select("why did the coolant pump fail", 60)
+    assert "impeller seal cracked" in selected
+    assert selected.startswith("=== Context from: doc.md ===")
+    assert count_tokens(selected) <= 60
+    # Chunks come back in document order, with gaps marked
+    assert "[...]" in selected
+    positions = [int(p.split()[1]) for p in selected.split("Paragraph ")[1:] if p[0].isdigit()]
+    assert positions == sorted(positions)
+
+
+def test_chunk_spans_group_paragraphs_within_the_limit():
+    text = "  one\n\ntwo\n \nthree " + "x" * 25 + "\n\n\nfour"
+    spans = list(chunk_spans(text, 12))
+    assert [text[s:e] for s, e in spans] == [
+        "one\n\ntwo", "three xxxxxx", "xxxxxxxxxxxx", "xxxxxxx", "four"
+    ]
+
+
+def test_file_source_selects_like_text_source(tmp_path):
+    text = document(300, 150).replace("weather", "météo ✓")
+    path = tmp_path / "doc.md"
+    path.write_text(text, encoding="utf-8")
+    source = FileSource(str(path))
+    from_file = ContextIndex([("doc.md", source)], "===", chunk_chars=100)
+    in_memory = ContextIndex([("doc.md", text)], "===", chunk_chars=100)
+    query = "why did the coolant pump fail"
+    assert from_file.select(query, 200) == in_memory.select(query, 200)
+    assert "impeller seal cracked" in from_file.select(query, 200)
+    # A second index over the same source reuses the first scan
+    scanned = source.scan(100)
+    ContextIndex([("doc.md", source)], "===", chunk_chars=100)
+    assert source.scan(100) is scanned
+
+
+def test_no_overlap_keeps_document_order():
+    index = ContextIndex([("a.md", "alpha one\n\nalpha two"), ("b.md", "beta")], "===")
+    assert index.select("zzz", 1000).index("a.md") < index.select("zzz", 1000).index("b.md")
+
+
+def test_selection_is_fast_for_thousands_of_chunks():
+    index = ContextIndex([("big.md", document(5000, 4000))], "===", chunk_chars=80)
+    assert len(index) >= 5000
+    start = time.perf_counter()
+    selected = index.select("coolant pump impeller", 2000)
+    elapsed = time.perf_counter() - start
+    assert "impeller" in selected
+    assert elapsed < 0.1
+
+
+def test_agent_prompt_uses_relevant_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(prompt_budget, "_limits", {"small-model": 3000})
+    cfg = Config(
+        safe_output_dir=str(tmp_path / "out"),
+        agent_state_dir=str(tmp_path / "state"),
+        rate_limit_dir=str(tmp_path / "rl"),
+        use_system_instruction=False,
+        context_chunk_chars=200,
+    )
+    logger = ErrorLogger(cfg)
+    om = OutputManager(cfg, logger)
+    cm = ContextManager(cfg, logger, om)
+    cm.upload_context("manual.md", document(2000, 1000).encode("utf-8"))
+    agent = RecursiveAgent(
+        config=cfg,
+        error_logger=logger,
+        command_executor=CommandExecutor(logger),
+        context_manager=cm,
+        output_manager=om,
+        agent_state=AgentState(cfg, logger),
+        model_name="small-model",
+        topic="coolant pump failure",
+        loops=1,
+        temperature=0.0,
+        seed=None,
+        rpm=60000,
+        api_key="x",
+    )
+    prompt = agent._prepare_prompt()
+    assert "impeller seal cracked" in prompt
+
+    agent.config = dataclasses.replace(cfg, context_relevance_enabled=False)
+    agent._context_segment_cache = None
+    assert "impeller seal cracked" not in agent._prepare_prompt()
+
+
+@pytest.mark.parametrize("spill_threshold", [1024 * 1024, 10000])
+def test_agent_reaches_middle_of_upload_cut_at_upload(tmp_path, monkeypatch, spill_threshold):
+    monkeypatch.setattr(prompt_budget, "_limits", {"small-model": 3000})
+    cfg = Config(
+        safe_output_dir=str(tmp_path / "out"),
+        agent_state_dir=str(tmp_path / "state"),
+        rate_limit_dir=str(tmp_path / "rl"),
+        use_system_instruction=False,
+        context_chunk_chars=200,
+        max_context_tokens=2000,
+        spill_threshold_bytes=spill_threshold,
+    )
+    logger = ErrorLogger(cfg)
+    cm = ContextManager(cfg, logger)
+    cm.upload_context("manual.md", document(2000, 1000).encode("utf-8"))
+    assert "impeller seal cracked" not in cm.get_context()
+    assert cm.has_originals and cm.source_tokens > cfg.max_context_tokens
+    # The whole upload is read from disk, not held in memory
+    assert isinstance(cm.sources()[0][1], FileSource)
+
+    om = OutputManager(cfg, logger)
+    agent = RecursiveAgent(
+        config=cfg,
+        error_logger=logger,
+        command_executor=CommandExecutor(logger),
+        context_manager=cm,
+        output_manager=om,
+        agent_state=AgentState(cfg, logger),
+        model_name="small-model",
+        topic="coolant pump failure",
+        loops=1,
+        temperature=0.0,
+        seed=None,
+        rpm=60000,
+        api_key="x",
+    )
+    assert "impeller seal cracked" in agent._prepare_prompt()
+
+    # Fleet copies share the originals and their index
+    clone = cm.copy()
+    assert clone.sources()[0][1] is cm.sources()[0][1]
+
+    spilled = [o.path for o in cm._originals if o is not None]
+    cm.clear_context()
+    assert all(not os.path.exists(path) for path in spilled)
+
+
+def test_relevance_share_is_capped_by_context_limit(tmp_path, monkeypatch):
+    monkeypatch.setattr(prompt_budget, "_limits", {"big-model": 1000000})
+    cfg = Config(
+        safe_output_dir=str(tmp_path / "out"),
+        agent_state_dir=str(tmp_path / "state"),
+        rate_limit_dir=str(tmp_path / "rl"),
+        use_system_instruction=False,
+        context_chunk_chars=200,
+        max_context_tokens=2000,
+    )
+    logger = ErrorLogger(cfg)
+    cm = ContextManager(cfg, logger)
+    cm.upload_context("manual.md", document(2000, 1000).encode("utf-8"))
+    assert cm.source_tokens > 10 * cfg.max_context_tokens
+    agent = RecursiveAgent(
+        config=cfg,
+        error_logger=logger,
+        command_executor=CommandExecutor(logger),
+        context_manager=cm,
+        output_manager=OutputManager(cfg, logger),
+        agent_state=AgentState(cfg, logger),
+        model_name="big-model",
+        topic="coolant pump failure",
+        loops=1,
+        temperature=0.0,
+        seed=None,
+        rpm=60000,
+        api_key="x",
+    )
+    plan = agent._plan_budget(cm.get_context())
+    assert plan["context"] <= cfg.max_context_tokens + 100
+    prompt = agent._prepare_prompt()
+    assert "impeller seal cracked" in prompt
+    assert count_tokens(prompt) < cfg.max_context_tokens + 1000
@@ -8,6 +8,7 @@ from context_manager import ContextManager  # noqa: E402
 from error_logger import ErrorLogger  # noqa: E402
 from output_manager import OutputManager  # noqa: E402
 from config import Config  # noqa: E402
+from utils import count_tokens  # noqa: E402
 
 
 def test_drop_oldest_when_exceeding_limit(tmp_path):
@@ -16,8 +17,32 @@ def test_drop_oldest_when_exceeding_limit(tmp_path):
     om = OutputManager(cfg, logger)
     cm = ContextManager(cfg, logger, om)
 
-    cm.upload_context("one.txt", b"A" * 50)
-    cm.upload_context("two.txt", b"B" * 50)
+    cm.upload_context("one.txt", b"A" * 200)
+    cm.upload_context("two.txt", b"B" * 200)
     ctx = cm.get_context()
     assert "two.txt" in ctx
     assert "one.txt" not in ctx
+
+
+def test_upload_work_is_linear_in_context_size(tmp_path, monkeypatch):
+    import context_manager
+
+    counted = []
+
+    def counting(text, model=None):
+        counted.append(len(text))
+        return count_tokens(text, model)
+
+    monkeypatch.setattr(context_manager, "count_tokens", counting)
+    cfg = Config(max_context_tokens=50000, safe_output_dir=str(tmp_path))
+    cm = ContextManager(cfg, None, None)
+    for i in range(1000):
+        body = " ".join(f"w{i}x{j}" for j in range(150)).encode()
+        cm.upload_context(f"file{i}.txt", body)
+    uploaded = 1000 * (len(body) + 40)
+    # Each byte is counted a bounded number of times, not once per later upload
+    assert sum(counted) < 3 * uploaded
+    assert cm.total_tokens <= cfg.max_context_tokens
+    monkeypatch.undo()
+    assert cm.total_tokens == count_tokens(cm.get_context())  # running total is exact
+    assert "file999.txt" in cm.get_context() and "file0.txt" not in cm.get_context()
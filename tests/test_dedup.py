@@ -0,0 +1,86 @@
+import os
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "laser_lens"))
+sys.path.insert(0, ROOT)
+
+from dedup import Deduplicator  # noqa: E402
+from context_manager import ContextManager  # noqa: E402
+from config import Config  # noqa: E402
+
+PARAS = [
+    " ".join(f"topic{p} sentence {i} with detail{p * 100 + i}" for i in range(12))
+    for p in range(6)
+]
+DRAFT = "\n\n".join(PARAS)
+
+
+def test_exact_and_near_duplicates_are_found():
+    dedup = Deduplicator()
+    assert dedup.matches(DRAFT) == {}  # nothing indexed yet
+    dedup.add("draft1", DRAFT)
+    edited = PARAS[2].replace("detail205", "detail205b")
+    second = "\n\n".join([PARAS[0], edited, "A brand new closing paragraph " * 4])
+    assert dedup.matches(second) == {"draft1": {0: "exact", 2: "near"}}
+
+    kept = dedup.remove("draft1", DRAFT, {0: "exact", 2: "near"})
+    assert PARAS[0] not in kept and PARAS[2] not in kept and PARAS[1] in kept
+    assert dedup.stats.exact == 1 and dedup.stats.near == 1
+    assert dedup.stats.tokens > 0
+    assert dedup.matches(second) == {}  # remove() forgets the owner
+
+
+def test_short_chunks_never_match():
+    dedup = Deduplicator()
+    dedup.add("a", "---\n\n## Notes\n\n---")
+    assert dedup.matches("---\n\n## Notes\n\n---") == {}
+
+
+def test_newer_copy_is_kept(tmp_path):
+    cfg = Config(safe_output_dir=str(tmp_path))
+    cm = ContextManager(cfg)
+    cm.upload_context("notes.md", DRAFT.encode())
+    cm.upload_context("notes_copy.md", DRAFT.encode())
+    ctx = cm.get_context()
+    assert "Context from: notes.md" not in ctx and "notes_copy.md" in ctx
+    assert ctx.count(PARAS[0]) == 1
+    assert cm.dedup_stats["exact"] == len(PARAS)
+
+    # A .tmp resume file holding the same text replaces the Markdown copy
+    tmp = (cfg.default_prompt_delim.join(PARAS) + cfg.default_prompt_delim).encode()
+    cm.upload_context("run.tmp", tmp)
+    ctx = cm.get_context()
+    assert "notes_copy.md" not in ctx and ctx.count(PARAS[3]) == 1
+
+    cm.clear_context()
+    cm.upload_context("notes.md", DRAFT.encode())
+    assert PARAS[3] in cm.get_context()
+
+
+def test_repeats_within_one_upload_are_kept(tmp_path):
+    cm = ContextManager(Config(safe_output_dir=str(tmp_path)))
+    text = "\n\n".join([PARAS[0], PARAS[1], PARAS[0]])
+    cm.upload_context("log.md", text.encode())
+    assert cm.get_context().count(PARAS[0]) == 2
+    assert cm.dedup_stats["exact"] == 0
+
+
+def test_shared_chunks_survive_eviction(tmp_path):
+    cm = ContextManager(Config(safe_output_dir=str(tmp_path), max_context_tokens=900))
+    body = "\n\n".join(PARAS[:3])
+    cm.upload_context("draft1.md", (body + "\n\nfirst draft ending").encode())
+    cm.upload_context("draft2.md", (body + "\n\nsecond draft ending").encode())
+    cm.upload_context("other.md", "\n\n".join(PARAS[3:]).encode())
+    ctx = cm.get_context()
+    assert "draft1.md" not in ctx
+    for para in PARAS:
+        assert para in ctx
+    assert "second draft ending" in ctx
+
+
+def test_dedup_can_be_disabled(tmp_path):
+    cm = ContextManager(Config(safe_output_dir=str(tmp_path), dedup_enabled=False))
+    cm.upload_context("a.md", DRAFT.encode())
+    cm.upload_context("b.md", DRAFT.encode())
+    assert cm.get_context().count(PARAS[0]) == 2
+    assert cm.dedup_stats == {}
@@ -0,0 +1,147 @@
+import asyncio
+import os
+import sys
+import types
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "laser_lens"))
+sys.path.insert(0, ROOT)
+
+# Stub google modules
+google = types.ModuleType("google")
+generativeai = types.ModuleType("generativeai")
+class DummyModel:
+    def __init__(self, *a, **k):
+        pass
+
+generativeai.GenerativeModel = DummyModel
+google.generativeai = generativeai
+sys.modules.setdefault("google", google)
+sys.modules.setdefault("google.generativeai", generativeai)
+
+import recursive_agent  # noqa: E402
+from fleet import FleetRunner, build_jobs, load_topics  # noqa: E402
+from command_executor import CommandExecutor  # noqa: E402
+from command_registration import register_core_commands  # noqa: E402
+from context_manager import ContextManager  # noqa: E402
+from output_manager import OutputManager  # noqa: E402
+from error_logger import ErrorLogger  # noqa: E402
+from config import Config  # noqa: E402
+
+
+class Chunk:
+    def __init__(self, text):
+        self.text = text
+
+
+def test_build_jobs_grid():
+    jobs = build_jobs(["a", "b"], ["m1", "m2"], [0.1, 0.9])
+    assert len(jobs) == 8
+    assert (jobs[0].topic, jobs[0].model_name, jobs[0].temperature) == ("a", "m1", 0.1)
+
+
+def test_load_topics_skips_blanks(tmp_path):
+    path = tmp_path / "topics.txt"
+    path.write_text("one\n\n# comment\ntwo\n", encoding="utf-8")
+    assert load_topics(str(path)) == ["one", "two"]
+
+
+def test_fleet_runs_with_bounded_workers(tmp_path, monkeypatch):
+    active = {"now": 0, "max": 0, "prompts": []}
+
+    class FakeModel:
+        def __init__(self, *a, **k):
+            pass
+
+        async def generate_content_async(self, prompt, stream=True):
+            active["prompts"].append(prompt)
+
+            async def gen():
+                active["now"] += 1
+                active["max"] = max(active["max"], active["now"])
+                await asyncio.sleep(0.01)
+                yield Chunk("done")
+                active["now"] -= 1
+
+            return gen()
+
+    monkeypatch.setattr(recursive_agent.genai, "GenerativeModel", FakeModel, raising=False)
+
+    cfg = Config(
+        safe_output_dir=str(tmp_path / "out"),
+        agent_state_dir=str(tmp_path / "state"),
+        rate_limit_dir=str(tmp_path / "ratelimit"),
+    )
+    logger = ErrorLogger(cfg)
+    om = OutputManager(cfg, logger)
+    cm = ContextManager(cfg, logger, om)
+    cm.upload_context("shared.txt", b"shared notes")
+    ce = CommandExecutor(logger)
+
+    runner = FleetRunner(
+        cfg,
+        logger,
+        ce,
+        cm,
+        loops=1,
+        seed=None,
+        rpm=60000,
+        workers=2,
+        base_dir=str(tmp_path / "fleet"),
+    )
+    results = runner.run(build_jobs(["x", "y", "z", "w"], ["m"], [0.5]))
+
+    assert [r["topic"] for r in results] == ["x", "y", "z", "w"]
+    assert all(r["error"] is None and os.path.isfile(r["output_file"]) for r in results)
+    assert active["max"] <= 2
+    assert all("shared notes" in p for p in active["prompts"])
+    assert len(os.listdir(tmp_path / "fleet")) == 4
+
+
+def test_fleet_jobs_run_commands_in_their_own_outputs(tmp_path, monkeypatch):
+    class FakeModel:
+        def __init__(self, *a, **k):
+            pass
+
+        async def generate_content_async(self, prompt, stream=True):
+            topic = "alpha" if "alpha" in prompt else "beta"
+
+            async def gen():
+                await asyncio.sleep(0.01)
+                yield Chunk(f'[[COMMAND: WRITE_FILE filename="notes.txt" content="{topic}"]]')
+                yield Chunk(f'[[COMMAND: APPEND_FILE filename="notes.txt" content="-{topic}"]]')
+
+            return gen()
+
+    monkeypatch.setattr(recursive_agent.genai, "GenerativeModel", FakeModel, raising=False)
+
+    cfg = Config(
+        safe_output_dir=str(tmp_path / "out"),
+        agent_state_dir=str(tmp_path / "state"),
+        rate_limit_dir=str(tmp_path / "ratelimit"),
+    )
+    logger = ErrorLogger(cfg)
+    om = OutputManager(cfg, logger)
+    monkeypatch.setattr("handlers._cfg", cfg)
+    monkeypatch.setattr("handlers._output_mgr", om)
+    ce = CommandExecutor(logger, workers=2)
+    register_core_commands(ce)
+
+    runner = FleetRunner(
+        cfg,
+        logger,
+        ce,
+        ContextManager(cfg, logger, om),
+        loops=1,
+        seed=None,
+        rpm=60000,
+        workers=2,
+        base_dir=str(tmp_path / "fleet"),
+    )
+    results = runner.run(build_jobs(["alpha", "beta"], ["m"], [0.5]))
+
+    assert all(r["error"] is None for r in results)
+    for r in results:
+        notes = os.path.join(os.path.dirname(r["output_file"]), "notes.txt")
+        with open(notes, encoding="utf-8") as f:
+            assert f.read() == f"{r['topic']}-{r['topic']}"
+    assert not os.path.exists(tmp_path / "out" / "notes.txt")
@@ -0,0 +1,86 @@
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "laser_lens"))
+sys.path.insert(0, ROOT)
+
+from hedging import LatencyTracker, hedged_aiter, hedged_iter  # noqa: E402
+
+
+def test_percentile_needs_samples():
+    tracker = LatencyTracker(window=10)
+    assert tracker.percentile(0.9, min_samples=3) is None
+    for value in (1.0, 2.0, 3.0, 4.0, 5.0):
+        tracker.record(value)
+    assert tracker.percentile(0.5, min_samples=3) == 3.0
+    assert tracker.percentile(1.0) == 5.0
+
+
+def make_factory(delays):
+    calls = []
+
+    def factory():
+        idx = len(calls)
+        calls.append(idx)
+
+        def gen():
+            time.sleep(delays[idx])
+            yield f"first-{idx}"
+            yield f"second-{idx}"
+
+        return gen()
+
+    return factory, calls
+
+
+def test_hedge_wins_when_primary_is_slow():
+    factory, calls = make_factory([1.0, 0.0])
+    ttft = []
+    start = time.monotonic()
+    items = list(hedged_iter(factory, 0.05, lambda: True, ttft.append))
+    assert items == ["first-1", "second-1"]
+    assert len(calls) == 2
+    assert time.monotonic() - start < 0.5
+    assert ttft and ttft[0] < 0.5
+
+
+def test_no_hedge_without_budget():
+    factory, calls = make_factory([0.2, 0.0])
+    items = list(hedged_iter(factory, 0.05, lambda: False, lambda s: None))
+    assert items == ["first-0", "second-0"]
+    assert len(calls) == 1
+
+
+def test_primary_error_propagates():
+    def factory():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        list(hedged_iter(factory, None, lambda: True, lambda s: None))
+
+
+def test_async_hedge_wins_when_primary_is_slow():
+    delays = [1.0, 0.0]
+    calls = []
+
+    def factory():
+        idx = len(calls)
+        calls.append(idx)
+
+        async def gen():
+            await asyncio.sleep(delays[idx])
+            yield f"first-{idx}"
+            yield f"second-{idx}"
+
+        return gen()
+
+    async def collect():
+        return [x async for x in hedged_aiter(factory, 0.05, lambda: True, lambda s: None)]
+
+    start = time.monotonic()
+    assert asyncio.run(collect()) == ["first-1", "second-1"]
+    assert time.monotonic() - start < 0.5
@@ -0,0 +1,115 @@
+import os
+import sys
+import types
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "laser_lens"))
+sys.path.insert(0, ROOT)
+
+# Stub google modules
+google = types.ModuleType("google")
+generativeai = types.ModuleType("generativeai")
+class DummyModel:
+    def __init__(self, *a, **k):
+        pass
+
+generativeai.GenerativeModel = DummyModel
+google.generativeai = generativeai
+sys.modules.setdefault("google", google)
+sys.modules.setdefault("google.generativeai", generativeai)
+
+from loop_memory import LoopMemory, chunk_text, clear_memory, memory_path  # noqa: E402
+from recursive_agent import RecursiveAgent  # noqa: E402
+from command_executor import CommandExecutor  # noqa: E402
+from context_manager import ContextManager  # noqa: E402
+from output_manager import OutputManager  # noqa: E402
+from agent_state import AgentState  # noqa: E402
+from error_logger import ErrorLogger  # noqa: E402
+from config import Config  # noqa: E402
+from utils import count_tokens  # noqa: E402
+
+
+def test_chunking_respects_limit():
+    text = "alpha beta\n\n" + "x" * 250 + "\n\nshort tail"
+    chunks = chunk_text(text, 100)
+    assert all(len(c) <= 100 for c in chunks)
+    assert "".join(chunks).replace("\n", "") == text.replace("\n", "")
+
+
+def test_bm25_ranks_relevant_passage_first(tmp_path):
+    memory = LoopMemory(str(tmp_path / "memory.jsonl"), chunk_chars=200)
+    memory.add(1, "The tokenizer splits words.\n\nUnrelated notes about lunch.")
+    memory.add(2, "Rate limiter uses a token bucket with burst capacity.")
+    memory.add(3, "Lunch menu: soup and bread.")
+    hits = memory.search("token bucket rate limiter", k=2)
+    assert hits[0].loop == 2
+    assert all(p.loop != 2 for p in memory.search("token bucket", k=5, exclude_loops=[2]))
+
+
+def test_memory_persists_and_respects_budget(tmp_path):
+    path = str(tmp_path / "memory.jsonl")
+    memory = LoopMemory(path, chunk_chars=50)
+    memory.add(1, "apple " * 8 + "\n\n" + "apple banana " * 3)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"loop": 9, "te')  # torn write from a crash
+    reloaded = LoopMemory(path, chunk_chars=50)
+    assert len(reloaded) == len(memory)
+    recalled = reloaded.recall("apple banana", budget_tokens=20, k=5)
+    assert recalled and sum(count_tokens(p.text) for p in recalled) <= 20
+
+
+def test_clear_memory_forgets_earlier_runs(tmp_path):
+    state_dir = str(tmp_path / "state")
+    LoopMemory(memory_path(state_dir)).add(1, "Volcanic ash grounded flights for days.")
+    assert len(LoopMemory(memory_path(state_dir))) == 1
+    clear_memory(state_dir)
+    memory = LoopMemory(memory_path(state_dir))
+    assert len(memory) == 0
+    assert memory.search("volcanic ash", 5) == []
+    clear_memory(state_dir)  # nothing to delete is fine
+
+
+def test_agent_recalls_older_loops(tmp_path):
+    cfg = Config(
+        safe_output_dir=str(tmp_path / "out"),
+        agent_state_dir=str(tmp_path / "state"),
+        rate_limit_dir=str(tmp_path / "rl"),
+        use_system_instruction=False,
+    )
+    logger = ErrorLogger(cfg)
+    om = OutputManager(cfg, logger)
+    agent = RecursiveAgent(
+        config=cfg,
+        error_logger=logger,
+        command_executor=CommandExecutor(logger),
+        context_manager=ContextManager(cfg, logger, om),
+        output_manager=om,
+        agent_state=AgentState(cfg, logger),
+        model_name="dummy",
+        topic="glacier melt",
+        loops=6,
+        temperature=0.0,
+        seed=None,
+        rpm=60000,
+        api_key="x",
+    )
+    responses = iter(
+        [
+            "Glacier melt accelerates when albedo drops; key finding ALBEDO-42.",
+            "Filler about unrelated matters.",
+            "More filler text.",
+            "Yet another filler.",
+            "Final glacier summary.",
+            "done",
+        ]
+    )
+    prompts = []
+
+    class FakeClient:
+        def generate_content(self, prompt, stream=True):
+            prompts.append(prompt)
+            return iter([types.SimpleNamespace(text=next(responses))])
+
+    agent.client = FakeClient()
+    list(agent.run())
+    # Loop 1 has left the 3-entry history by loop 5 but is still recalled
+    assert "ALBEDO-42" in prompts[4].split("## Relevant Memory")[1]
@@ -0,0 +1,84 @@
+import os
+import sys
+import time
+import types
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "laser_lens"))
+sys.path.insert(0, ROOT)
+
+# Stub google modules
+google = types.ModuleType("google")
+generativeai = types.ModuleType("generativeai")
+class DummyModel:
+    def __init__(self, *a, **k):
+        pass
+
+generativeai.GenerativeModel = DummyModel
+google.generativeai = generativeai
+sys.modules.setdefault("google", google)
+sys.modules.setdefault("google.generativeai", generativeai)
+
+from recursive_agent import RecursiveAgent  # noqa: E402
+from metrics import format_metrics  # noqa: E402
+from command_executor import CommandExecutor  # noqa: E402
+from context_manager import ContextManager  # noqa: E402
+from output_manager import OutputManager  # noqa: E402
+from agent_state import AgentState  # noqa: E402
+from error_logger import ErrorLogger  # noqa: E402
+from config import Config  # noqa: E402
+
+
+def test_metrics_event_precedes_loop_end(tmp_path):
+    cfg = Config(
+        safe_output_dir=str(tmp_path / "out"),
+        agent_state_dir=str(tmp_path / "state"),
+        rate_limit_dir=str(tmp_path / "rl"),
+        backoff_base_seconds=0.0,
+    )
+    logger = ErrorLogger(cfg)
+    ce = CommandExecutor(logger)
+    ce.register_command("NAP", lambda a: time.sleep(0.05) or "rested")
+    om = OutputManager(cfg, logger)
+    agent = RecursiveAgent(
+        config=cfg,
+        error_logger=logger,
+        command_executor=ce,
+        context_manager=ContextManager(cfg, logger, om),
+        output_manager=om,
+        agent_state=AgentState(cfg, logger),
+        model_name="dummy",
+        topic="t",
+        loops=1,
+        temperature=0.0,
+        seed=None,
+        rpm=60000,
+        api_key="x",
+    )
+    attempts = []
+
+    def failing():
+        raise Exception("500 internal")
+        yield
+
+    def chunks():
+        time.sleep(0.05)
+        yield types.SimpleNamespace(text="thinking ")
+        yield types.SimpleNamespace(text="[[COMMAND: NAP]]")
+
+    class FakeClient:
+        def generate_content(self, prompt, stream=True):
+            attempts.append(1)
+            return failing() if len(attempts) == 1 else chunks()
+
+    agent.client = FakeClient()
+    events = list(agent.run())
+    assert [e[0] for e in events] == ["retry", "chunk", "chunk", "metrics", "loop_end"]
+    m = events[3][3]
+    assert m["loop"] == 1
+    assert m["retries"] == 1
+    assert m["ttft_s"] >= 0.05
+    assert m["stream_s"] >= m["ttft_s"]
+    assert m["chunks"] == 2 and m["chars"] == len("thinking [[COMMAND: NAP]]")
+    assert m["chars_per_s"] > 0
+    assert m["commands"][0][0] == "NAP" and m["commands"][0][1] >= 0.05
+    assert "retries 1" in format_metrics(m)
@@ -0,0 +1,105 @@
+import os
+import sys
+import types
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "laser_lens"))
+sys.path.insert(0, ROOT)
+
+# Stub google modules
+google = types.ModuleType("google")
+generativeai = types.ModuleType("generativeai")
+class DummyModel:
+    def __init__(self, *a, **k):
+        pass
+
+generativeai.GenerativeModel = DummyModel
+google.generativeai = generativeai
+sys.modules.setdefault("google", google)
+sys.modules.setdefault("google.generativeai", generativeai)
+
+import prompt_budget  # noqa: E402
+from prompt_budget import BudgetPlanner, fit_to_budget, model_input_limit  # noqa: E402
+from recursive_agent import RecursiveAgent  # noqa: E402
+from utils import count_tokens  # noqa: E402
+from command_executor import CommandExecutor  # noqa: E402
+from context_manager import ContextManager  # noqa: E402
+from output_manager import OutputManager  # noqa: E402
+from agent_state import AgentState  # noqa: E402
+from error_logger import ErrorLogger  # noqa: E402
+from config import Config  # noqa: E402
+
+
+def test_plan_respects_needs_and_weights():
+    planner = BudgetPlanner({"a": 1.0, "b": 3.0, "c": 1.0}, {"a": 10})
+    plan = planner.plan(1000, {"a": 50, "b": 5000, "c": 5000})
+    assert plan["a"] == 50  # small section fully served
+    assert plan["b"] > plan["c"] * 2.5
+    assert sum(plan.values()) <= 1000
+    assert sum(plan.values()) >= 990  # leftovers are redistributed
+
+
+def test_plan_scales_minimums_when_over_budget():
+    planner = BudgetPlanner({"a": 1.0, "b": 1.0}, {"a": 100, "b": 100})
+    plan = planner.plan(100, {"a": 500, "b": 500})
+    assert plan == {"a": 50, "b": 50}
+
+
+def test_fit_to_budget_keeps_head_and_tail():
+    text = "A" * 500 + " " + "B" * 500
+    fitted = fit_to_budget(text, 50)
+    assert count_tokens(fitted) <= 50
+    assert fitted.startswith("A") and fitted.endswith("B") and "truncated" in fitted
+    assert fit_to_budget("short", 100) == "short"
+
+
+def test_model_limit_lookup_and_fallback(monkeypatch):
+    monkeypatch.setattr(prompt_budget, "_limits", {})
+    genai_module = sys.modules["google.generativeai"]
+    monkeypatch.setattr(
+        genai_module,
+        "get_model",
+        lambda name: types.SimpleNamespace(input_token_limit=1234),
+        raising=False,
+    )
+    assert model_input_limit("known", Config()) == 1234
+    monkeypatch.delattr(genai_module, "get_model")
+    assert model_input_limit("known", Config()) == 1234  # cached
+    assert model_input_limit("other", Config(default_input_token_limit=77)) == 77
+
+
+def test_agent_prompt_fits_model_budget(tmp_path, monkeypatch):
+    monkeypatch.setattr(prompt_budget, "_limits", {"small-model": 6000})
+    cfg = Config(
+        safe_output_dir=str(tmp_path / "out"),
+        agent_state_dir=str(tmp_path / "state"),
+        rate_limit_dir=str(tmp_path / "rl"),
+        use_system_instruction=False,
+    )
+    logger = ErrorLogger(cfg)
+    om = OutputManager(cfg, logger)
+    cm = ContextManager(cfg, logger, om)
+    cm.upload_context("big.md", "".join(f"x{i:05d}xx\n" for i in range(8000)).encode())
+    state = AgentState(cfg, logger)
+    state.update_state("command_results", [("READ_FILE", "r" * 12000)])
+    agent = RecursiveAgent(
+        config=cfg,
+        error_logger=logger,
+        command_executor=CommandExecutor(logger),
+        context_manager=cm,
+        output_manager=om,
+        agent_state=state,
+        model_name="small-model",
+        topic="t",
+        loops=1,
+        temperature=0.0,
+        seed=None,
+        rpm=60000,
+        api_key="x",
+    )
+    agent.last_thought = "y" * 20000
+    prompt = agent._prepare_prompt()
+    # headers are unbudgeted
+    assert count_tokens(prompt, "small-model") <= 6000 * cfg.prompt_budget_fraction + 200
+    tool_output = prompt.split("READ_FILE: ")[1]
+    assert 500 < len(tool_output) < 12000  # beyond the old 500-char cut, still trimmed
+    assert agent._metrics.budget["context"] > agent._metrics.budget["tools"]
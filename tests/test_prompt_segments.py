@@ -0,0 +1,110 @@
+import os
+import sys
+import types
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "laser_lens"))
+sys.path.insert(0, ROOT)
+
+# Stub google modules
+google = types.ModuleType("google")
+generativeai = types.ModuleType("generativeai")
+class DummyModel:
+    def __init__(self, *a, **k):
+        pass
+
+generativeai.GenerativeModel = DummyModel
+google.generativeai = generativeai
+sys.modules.setdefault("google", google)
+sys.modules.setdefault("google.generativeai", generativeai)
+
+import recursive_agent  # noqa: E402
+from recursive_agent import RecursiveAgent  # noqa: E402
+from command_executor import CommandExecutor  # noqa: E402
+from context_manager import ContextManager  # noqa: E402
+from output_manager import OutputManager  # noqa: E402
+from agent_state import AgentState  # noqa: E402
+from error_logger import ErrorLogger  # noqa: E402
+from config import Config  # noqa: E402
+
+
+class RecordingModel:
+    created = []
+
+    def __init__(self, model_name, **kwargs):
+        self.kwargs = kwargs
+        self.prompts = []
+        RecordingModel.created.append(self)
+
+    def generate_content(self, prompt, stream=True):
+        self.prompts.append(prompt)
+        return iter([types.SimpleNamespace(text="ok")])
+
+
+class LegacyModel(RecordingModel):
+    def __init__(self, model_name):
+        super().__init__(model_name)
+
+
+def make_agent(tmp_path, monkeypatch, model_cls, loops=2):
+    monkeypatch.setattr(recursive_agent.genai, "GenerativeModel", model_cls, raising=False)
+    cfg = Config(
+        safe_output_dir=str(tmp_path / "out"),
+        agent_state_dir=str(tmp_path / "state"),
+        rate_limit_dir=str(tmp_path / "rl"),
+    )
+    logger = ErrorLogger(cfg)
+    om = OutputManager(cfg, logger)
+    cm = ContextManager(cfg, logger, om)
+    cm.upload_context("notes.md", b"background facts")
+    agent = RecursiveAgent(
+        config=cfg,
+        error_logger=logger,
+        command_executor=CommandExecutor(logger),
+        context_manager=cm,
+        output_manager=om,
+        agent_state=AgentState(cfg, logger),
+        model_name="dummy",
+        topic="t",
+        loops=loops,
+        temperature=0.0,
+        seed=None,
+        rpm=60000,
+        api_key="x",
+    )
+    return agent, cm
+
+
+def test_system_instruction_sent_once(tmp_path, monkeypatch):
+    agent, cm = make_agent(tmp_path, monkeypatch, RecordingModel)
+    system = agent._system_segment()
+    assert agent.client.kwargs["system_instruction"] == system
+
+    calls = []
+    original = cm.get_context
+    monkeypatch.setattr(cm, "get_context", lambda: calls.append(1) or original())
+    events = list(agent.run())
+
+    prompts = agent.client.prompts
+    assert len(prompts) == 2
+    assert all(system not in p and "background facts" in p for p in prompts)
+    assert "Loop 2 of 2" in prompts[1]
+    assert len(calls) == 1  # context unchanged between loops
+    metrics = [e[3] for e in events if e[0] == "metrics"]
+    assert metrics[0]["segment_chars"]["system"] == len(system)
+    assert metrics[0]["request_chars"] == len(prompts[0])
+
+
+def test_context_change_rebuilds_segment(tmp_path, monkeypatch):
+    agent, cm = make_agent(tmp_path, monkeypatch, RecordingModel, loops=1)
+    first = agent._prepare_prompt()
+    cm.add_inline_context("late addition")
+    second = agent._prepare_prompt()
+    assert "late addition" not in first and "late addition" in second
+
+
+def test_legacy_sdk_gets_full_prompt(tmp_path, monkeypatch):
+    agent, _ = make_agent(tmp_path, monkeypatch, LegacyModel, loops=1)
+    list(agent.run())
+    prompt = agent.client.prompts[0]
+    assert prompt.startswith(agent._system_segment() + "\n---\n")
+    assert "background facts" in prompt and "Loop 1 of 1" in prompt
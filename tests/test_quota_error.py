@@ -37,15 +37,21 @@ from error_logger import ErrorLogger  # noqa: E402
 from config import Config  # noqa: E402
 
 
-def test_quota_error_aborts(monkeypatch, tmp_path):
-    cfg = Config(safe_output_dir=str(tmp_path))
+def make_agent(tmp_path):
+    cfg = Config(
+        safe_output_dir=str(tmp_path),
+        agent_state_dir=str(tmp_path / "state"),
+        rate_limit_dir=str(tmp_path / "rl"),
+        backoff_base_seconds=0.0,
+        overload_backoff_seconds=0.0,
+    )
     logger = ErrorLogger(cfg)
     om = OutputManager(cfg, logger)
     cm = ContextManager(cfg, logger, om)
     ce = CommandExecutor(logger)
     state = AgentState(cfg, logger)
 
-    agent = RecursiveAgent(
+    return RecursiveAgent(
         config=cfg,
         error_logger=logger,
         command_executor=ce,
@@ -61,12 +67,39 @@ def test_quota_error_aborts(monkeypatch, tmp_path):
         api_key="x",
     )
 
+
+def test_quota_error_aborts(monkeypatch, tmp_path):
+    agent = make_agent(tmp_path)
     monkeypatch.setattr(
         agent,
         "_stream_generation",
-        lambda prompt: (_ for _ in ()).throw(QuotaError("quota exceeded")),
+        lambda prompt, cached=None: (_ for _ in ()).throw(
+            QuotaError("429 Quota exceeded for quota metric 'requests per day'")
+        ),
     )
 
     events = list(agent.run())
     assert events and events[0][0] == "error"
-    assert "quota" in events[0][3][0].lower()
+    assert events[0][3][0] == "API quota limit reached. Stopping agent."
+
+
+def test_per_minute_limit_slows_down_and_retries(tmp_path):
+    agent = make_agent(tmp_path)
+    attempts = []
+
+    class FakeClient:
+        def generate_content(self, prompt, stream=True):
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise QuotaError(
+                    "429 Quota exceeded for quota metric 'Generate Content API "
+                    "requests per minute'"
+                )
+            return iter([types.SimpleNamespace(text="ok")])
+
+    agent.client = FakeClient()
+    rate = agent.rate_controller.rate
+    events = [e for e in agent.run() if e[0] != "metrics"]
+    assert events[-1] == ("loop_end", 1, 1, "ok")
+    assert len(attempts) == 2
+    assert agent.rate_controller.rate < rate
@@ -0,0 +1,51 @@
+import multiprocessing
+import os
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "laser_lens"))
+sys.path.insert(0, ROOT)
+
+from rate_limiter import TokenBucketLimiter  # noqa: E402
+from config import Config  # noqa: E402
+
+
+def test_burst_then_wait(tmp_path):
+    cfg = Config(rate_limit_dir=str(tmp_path), rate_limit_burst=2)
+    limiter = TokenBucketLimiter(cfg, "key", rpm=60)
+    assert limiter.reserve() == 0
+    assert limiter.reserve() == 0
+    wait = limiter.reserve()
+    assert 0.9 < wait <= 1.0
+
+
+def test_instances_share_budget_per_key(tmp_path):
+    cfg = Config(rate_limit_dir=str(tmp_path), rate_limit_burst=1)
+    first = TokenBucketLimiter(cfg, "key", rpm=60)
+    second = TokenBucketLimiter(cfg, "key", rpm=60)
+    other_key = TokenBucketLimiter(cfg, "other", rpm=60)
+    assert first.reserve() == 0
+    assert second.reserve() > 0.9
+    assert other_key.reserve() == 0
+
+
+def test_token_budget(tmp_path):
+    cfg = Config(rate_limit_dir=str(tmp_path), rate_limit_burst=10)
+    limiter = TokenBucketLimiter(cfg, "key", rpm=600, tpm=600)
+    assert limiter.reserve(600) == 0
+    wait = limiter.reserve(60)
+    assert 5.9 < wait <= 6.0
+
+
+def _reserve_in_child(path, queue):
+    cfg = Config(rate_limit_dir=path, rate_limit_burst=1)
+    queue.put(TokenBucketLimiter(cfg, "key", rpm=60).reserve())
+
+
+def test_budget_shared_across_processes(tmp_path):
+    cfg = Config(rate_limit_dir=str(tmp_path), rate_limit_burst=1)
+    assert TokenBucketLimiter(cfg, "key", rpm=60).reserve() == 0
+    queue = multiprocessing.Queue()
+    proc = multiprocessing.Process(target=_reserve_in_child, args=(str(tmp_path), queue))
+    proc.start()
+    proc.join(10)
+    assert queue.get(timeout=1) > 0.5
@@ -0,0 +1,119 @@
+import os
+import sys
+import time
+import types
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "laser_lens"))
+sys.path.insert(0, ROOT)
+
+# Stub google modules
+google = types.ModuleType("google")
+generativeai = types.ModuleType("generativeai")
+class DummyModel:
+    def __init__(self, *a, **k):
+        pass
+
+generativeai.GenerativeModel = DummyModel
+google.generativeai = generativeai
+sys.modules.setdefault("google", google)
+sys.modules.setdefault("google.generativeai", generativeai)
+
+from recursive_agent import RecursiveAgent  # noqa: E402
+from response_cache import ResponseCache  # noqa: E402
+from command_executor import CommandExecutor  # noqa: E402
+from context_manager import ContextManager  # noqa: E402
+from output_manager import OutputManager  # noqa: E402
+from agent_state import AgentState  # noqa: E402
+from error_logger import ErrorLogger  # noqa: E402
+from config import Config  # noqa: E402
+
+
+def test_cache_roundtrip_and_counters(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_bytes=1_000_000)
+    key = ResponseCache.make_key("m", "prompt", {"temperature": 0.1})
+    assert cache.get(key) is None
+    cache.put(key, ["a", "b"])
+    assert cache.get(key) == ["a", "b"]
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+    assert key != ResponseCache.make_key("m", "prompt", {"temperature": 0.2})
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_bytes=250)
+    cache.put("old", ["x" * 100])
+    cache.put("new", ["y" * 100])
+    past = time.time() - 60
+    os.utime(os.path.join(str(tmp_path), "new.json"), (past, past))
+    os.utime(os.path.join(str(tmp_path), "old.json"), (past - 60, past - 60))
+    assert cache.get("old") is not None  # refreshes its mtime
+    cache.put("third", ["z" * 100])
+    assert cache.get("new") is None
+    assert cache.get("old") is not None
+    assert cache.stats()["bytes"] <= 250
+
+
+def make_agent(tmp_path, cache):
+    cfg = Config(
+        safe_output_dir=str(tmp_path / "out"),
+        agent_state_dir=str(tmp_path / "state"),
+        rate_limit_dir=str(tmp_path / "rl"),
+    )
+    logger = ErrorLogger(cfg)
+    om = OutputManager(cfg, logger)
+    return RecursiveAgent(
+        config=cfg,
+        error_logger=logger,
+        command_executor=CommandExecutor(logger),
+        context_manager=ContextManager(cfg, logger, om),
+        output_manager=om,
+        agent_state=AgentState(cfg, logger),
+        model_name="dummy",
+        topic="t",
+        loops=1,
+        temperature=0.0,
+        seed=1,
+        rpm=60000,
+        api_key="x",
+        response_cache=cache,
+    )
+
+
+def test_agent_replays_cached_stream(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache"), max_bytes=1_000_000)
+    calls = []
+
+    class FakeClient:
+        def generate_content(self, prompt, stream=True):
+            calls.append(prompt)
+            return iter([types.SimpleNamespace(text=t) for t in ("one ", "two")])
+
+    first = make_agent(tmp_path / "a", cache)
+    first.client = FakeClient()
+    second = make_agent(tmp_path / "b", cache)
+    second.client = FakeClient()
+
+    events_first = [e for e in first.run() if e[0] != "metrics"]
+    events_second = [e for e in second.run() if e[0] != "metrics"]
+    assert events_first == events_second
+    assert [e[0] for e in events_second] == ["chunk", "chunk", "loop_end"]
+    assert len(calls) == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_cache_hit_skips_rate_limit_and_breaker(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache"), max_bytes=1_000_000)
+    agent = make_agent(tmp_path / "a", cache)
+    cache.put(agent._cache_key(agent._prepare_prompt()), ["cached"])
+
+    def fail(*a, **k):
+        raise AssertionError("cache hit reached the API path")
+
+    agent.rate_limiter.reserve = fail
+    agent.rate_controller.reserve = fail
+    agent.rate_controller.on_success = fail
+    agent.circuit_breaker.allow = fail
+    agent.circuit_breaker.record = fail
+
+    events = [e for e in agent.run() if e[0] != "metrics"]
+    assert events[0] == ("chunk", 1, 1, "cached")
+    assert events[-1][0] == "loop_end"
@@ -0,0 +1,118 @@
+import asyncio
+import os
+import sys
+import types
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "laser_lens"))
+sys.path.insert(0, ROOT)
+
+# Stub google modules
+google = types.ModuleType("google")
+generativeai = types.ModuleType("generativeai")
+class DummyModel:
+    def __init__(self, *a, **k):
+        pass
+
+generativeai.GenerativeModel = DummyModel
+google.generativeai = generativeai
+sys.modules.setdefault("google", google)
+sys.modules.setdefault("google.generativeai", generativeai)
+
+from recursive_agent import RecursiveAgent  # noqa: E402
+from command_executor import CommandExecutor  # noqa: E402
+from context_manager import ContextManager  # noqa: E402
+from output_manager import OutputManager  # noqa: E402
+from agent_state import AgentState  # noqa: E402
+from error_logger import ErrorLogger  # noqa: E402
+from config import Config  # noqa: E402
+
+
+class Chunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class AsyncStream:
+    def __init__(self, parts):
+        self._parts = list(parts)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self._parts:
+            raise StopAsyncIteration
+        await asyncio.sleep(0)
+        return Chunk(self._parts.pop(0))
+
+
+class FakeClient:
+    def generate_content(self, prompt, stream=True):
+        return iter([Chunk("hello "), Chunk("world")])
+
+    async def generate_content_async(self, prompt, stream=True):
+        return AsyncStream(["hello ", "world"])
+
+
+def make_agent(tmp_path, loops=2):
+    cfg = Config(
+        safe_output_dir=str(tmp_path / "out"),
+        agent_state_dir=str(tmp_path / "state"),
+        rate_limit_dir=str(tmp_path / "ratelimit"),
+    )
+    logger = ErrorLogger(cfg)
+    om = OutputManager(cfg, logger)
+    cm = ContextManager(cfg, logger, om)
+    ce = CommandExecutor(logger)
+    state = AgentState(cfg, logger)
+    agent = RecursiveAgent(
+        config=cfg,
+        error_logger=logger,
+        command_executor=ce,
+        context_manager=cm,
+        output_manager=om,
+        agent_state=state,
+        model_name="dummy",
+        topic="t",
+        loops=loops,
+        temperature=0.0,
+        seed=None,
+        rpm=60000,
+        api_key="x",
+    )
+    agent.client = FakeClient()
+    return agent
+
+
+async def collect(agen):
+    return [event async for event in agen]
+
+
+def test_run_async_matches_run(tmp_path):
+    sync_events = list(make_agent(tmp_path / "sync").run())
+    async_events = asyncio.run(collect(make_agent(tmp_path / "async").run_async()))
+    # metrics payloads hold timings, so compare only their event type
+    assert [e if e[0] != "metrics" else e[0] for e in async_events] == [
+        e if e[0] != "metrics" else e[0] for e in sync_events
+    ]
+    assert [e[0] for e in async_events] == ["chunk", "chunk", "metrics", "loop_end"] * 2
+    assert async_events[3][3] == "hello world"
+
+
+def test_run_async_many_agents_one_loop(tmp_path):
+    agents = [make_agent(tmp_path / str(i), loops=1) for i in range(5)]
+
+    async def drive():
+        return await asyncio.gather(*(collect(a.run_async()) for a in agents))
+
+    results = asyncio.run(drive())
+    assert all(r[-1] == ("loop_end", 1, 1, "hello world") for r in results)
+
+
+def test_run_async_thread_fallback(tmp_path):
+    agent = make_agent(tmp_path)
+    agent.client = types.SimpleNamespace(
+        generate_content=lambda prompt, stream=True: iter([Chunk("sync")])
+    )
+    events = asyncio.run(collect(agent.run_async()))
+    assert events[-1] == ("loop_end", 2, 2, "sync")
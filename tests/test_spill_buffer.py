@@ -0,0 +1,103 @@
+import os
+import sys
+import tracemalloc
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "laser_lens"))
+sys.path.insert(0, ROOT)
+
+from spill_buffer import SpilledText  # noqa: E402
+from context_manager import ContextManager  # noqa: E402
+from error_logger import ErrorLogger  # noqa: E402
+from output_manager import OutputManager  # noqa: E402
+from config import Config  # noqa: E402
+from utils import count_tokens  # noqa: E402
+
+
+def write_big(path, mb):
+    line = ("lorem ipsum dolor sit amet " * 4 + "\n").encode("utf-8")
+    block = line * (1024 * 1024 // len(line))
+    with open(path, "wb") as f:
+        f.write(b"HEAD-MARKER\n")
+        for _ in range(mb):
+            f.write(block)
+        f.write("TAIL-MARKER ✓\n".encode("utf-8"))
+
+
+def test_view_slices_and_limits(tmp_path):
+    path = tmp_path / "big.txt"
+    write_big(path, 2)
+    with SpilledText(str(path)) as view:
+        assert len(view) == os.path.getsize(path)
+        assert view.head(5).startswith("HEAD-MARKER")
+        assert view.tail(5).endswith("TAIL-MARKER ✓\n")
+        assert count_tokens(view.head(1000)) <= 1000
+        assert view.exceeds(1000) and not view.exceeds(10**7)
+
+
+def test_large_upload_keeps_memory_flat(tmp_path):
+    cfg = Config(
+        max_context_tokens=20000,
+        spill_threshold_bytes=1024 * 1024,
+        safe_output_dir=str(tmp_path / "out"),
+    )
+    logger = ErrorLogger(cfg)
+    om = OutputManager(cfg, logger)
+    cm = ContextManager(cfg, logger, om)
+    path = tmp_path / "huge.md"
+    write_big(path, 40)
+
+    tracemalloc.start()
+    cm.upload_file(str(path))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    assert peak < 4 * 1024 * 1024  # the 40 MB upload is never decoded whole
+    ctx = cm.get_context()
+    assert "HEAD-MARKER" in ctx and "TAIL-MARKER" in ctx and "[truncated]" in ctx
+    assert cm.total_tokens <= cfg.max_context_tokens
+    # The spill file is the saved full copy; nothing else is written
+    assert om.list_outputs() == ["full_huge.md"]
+    assert os.path.getsize(tmp_path / "out" / "full_huge.md") == os.path.getsize(path)
+
+
+def test_spilled_upload_that_fits_is_kept_whole(tmp_path):
+    cfg = Config(spill_threshold_bytes=10, safe_output_dir=str(tmp_path))
+    cm = ContextManager(cfg)
+    cm.upload_context("small.txt", b"short but spilled")
+    assert "short but spilled" in cm.get_context()
+    assert not [f for f in os.listdir(tmp_path) if f.endswith(".spill")]
+
+
+def test_windows_cover_the_file_on_character_boundaries(tmp_path):
+    path = tmp_path / "mixed.txt"
+    data = ("première ligne\n\n" + "é" * 50 + "\nfin ✓").encode("utf-8") + b"\xff tail"
+    path.write_bytes(data)
+    with SpilledText(str(path)) as view:
+        windows = list(view.windows(16))
+    assert len(windows) > 3
+    rebuilt = b""
+    for start, text in windows:
+        assert start == len(rebuilt)
+        rebuilt += text.encode("utf-8", "surrogateescape")
+    assert rebuilt == data
+
+
+def test_indexing_a_spilled_upload_keeps_memory_flat(tmp_path):
+    context_index = pytest.importorskip("context_index")
+    if not context_index.available():
+        pytest.skip("numpy is not installed")
+    path = tmp_path / "huge.md"
+    write_big(path, 16)
+    source = context_index.FileSource(str(path))
+
+    tracemalloc.start()
+    index = context_index.ContextIndex([("huge.md", source)], "===")
+    selected = index.select("tail marker", 2000)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    assert "TAIL-MARKER" in selected
+    # The upload is scanned window by window and never decoded whole
+    assert peak < os.path.getsize(path)
@@ -0,0 +1,116 @@
+import asyncio
+import os
+import sys
+import time
+import types
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "laser_lens"))
+sys.path.insert(0, ROOT)
+
+# Stub google modules
+google = types.ModuleType("google")
+generativeai = types.ModuleType("generativeai")
+class DummyModel:
+    def __init__(self, *a, **k):
+        pass
+
+generativeai.GenerativeModel = DummyModel
+google.generativeai = generativeai
+sys.modules.setdefault("google", google)
+sys.modules.setdefault("google.generativeai", generativeai)
+
+from recursive_agent import RecursiveAgent  # noqa: E402
+from stream_watchdog import StreamStallError, watched_aiter, watched_iter  # noqa: E402
+from command_executor import CommandExecutor  # noqa: E402
+from context_manager import ContextManager  # noqa: E402
+from output_manager import OutputManager  # noqa: E402
+from agent_state import AgentState  # noqa: E402
+from error_logger import ErrorLogger  # noqa: E402
+from config import Config  # noqa: E402
+
+
+def stalling():
+    yield "partial"
+    time.sleep(5)
+    yield "never"
+
+
+def test_idle_timeout_trips():
+    seen = []
+    start = time.monotonic()
+    with pytest.raises(StreamStallError):
+        for item in watched_iter(stalling, 0.1, None):
+            seen.append(item)
+    assert seen == ["partial"]
+    assert time.monotonic() - start < 2
+
+
+def test_deadline_trips():
+    def slow():
+        for i in range(100):
+            time.sleep(0.05)
+            yield i
+
+    with pytest.raises(StreamStallError, match="deadline"):
+        list(watched_iter(slow, 1.0, 0.2))
+
+
+def test_async_idle_timeout_trips():
+    async def stream():
+        yield "partial"
+        await asyncio.sleep(5)
+        yield "never"
+
+    async def collect():
+        return [x async for x in watched_aiter(stream(), 0.1, None)]
+
+    with pytest.raises(StreamStallError):
+        asyncio.run(collect())
+
+
+def test_agent_retries_stalled_stream(tmp_path):
+    cfg = Config(
+        safe_output_dir=str(tmp_path / "out"),
+        agent_state_dir=str(tmp_path / "state"),
+        rate_limit_dir=str(tmp_path / "rl"),
+        stream_idle_timeout_seconds=0.1,
+        backoff_base_seconds=0.0,
+    )
+    logger = ErrorLogger(cfg)
+    om = OutputManager(cfg, logger)
+    agent = RecursiveAgent(
+        config=cfg,
+        error_logger=logger,
+        command_executor=CommandExecutor(logger),
+        context_manager=ContextManager(cfg, logger, om),
+        output_manager=om,
+        agent_state=AgentState(cfg, logger),
+        model_name="dummy",
+        topic="t",
+        loops=1,
+        temperature=0.0,
+        seed=None,
+        rpm=60000,
+        api_key="x",
+    )
+    attempts = []
+
+    class FakeClient:
+        def generate_content(self, prompt, stream=True):
+            attempts.append(1)
+            if len(attempts) == 1:
+                return (types.SimpleNamespace(text=t) for t in stalling())
+            return iter([types.SimpleNamespace(text="complete")])
+
+    agent.client = FakeClient()
+    events = [e for e in agent.run() if e[0] != "metrics"]
+    assert [e[0] for e in events] == ["chunk", "retry", "chunk", "loop_end"]
+    assert events[0][3] == "partial"
+    assert isinstance(events[1][3][1], StreamStallError)
+    assert events[-1] == ("loop_end", 1, 1, "complete")
+    assert len(attempts) == 2
+    # The aborted attempt's text is cut from the tmp file before the retry
+    with open(agent.tmp_file.name, "r", encoding="utf-8") as f:
+        assert f.read() == "complete"
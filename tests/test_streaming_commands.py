@@ -0,0 +1,196 @@
+import dataclasses
+import os
+import sys
+import threading
+import types
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "laser_lens"))
+sys.path.insert(0, ROOT)
+
+# Stub google modules
+google = types.ModuleType("google")
+generativeai = types.ModuleType("generativeai")
+class DummyModel:
+    def __init__(self, *a, **k):
+        pass
+
+generativeai.GenerativeModel = DummyModel
+google.generativeai = generativeai
+sys.modules.setdefault("google", google)
+sys.modules.setdefault("google.generativeai", generativeai)
+
+from recursive_agent import RecursiveAgent  # noqa: E402
+from streaming_commands import StreamingCommandDispatcher  # noqa: E402
+from command_executor import ACCESS_READ, CommandExecutor  # noqa: E402
+from context_manager import ContextManager  # noqa: E402
+from output_manager import OutputManager  # noqa: E402
+from agent_state import AgentState  # noqa: E402
+from error_logger import ErrorLogger  # noqa: E402
+from config import Config  # noqa: E402
+
+
+def make_executor():
+    logger = ErrorLogger(Config())
+    ce = CommandExecutor(logger)
+    ce.register_command("ECHO", lambda a: a.get("text"))
+    return ce, logger
+
+
+def test_split_markers_match_full_parse():
+    ce, logger = make_executor()
+    text = 'a [[COMMAND: ECHO text="one"]] b [[COMMAND: NOPE]] [[COMMAND: ECHO text="t]wo"]] c'
+    dispatcher = StreamingCommandDispatcher(ce, logger)
+    for i in range(0, len(text), 3):
+        dispatcher.feed(text[i : i + 3])
+    assert dispatcher.results() == ce.parse_and_execute(text)
+    dispatcher.close()
+
+
+def test_command_starts_before_stream_ends():
+    ce, logger = make_executor()
+    started = threading.Event()
+    ce.register_command("MARK", lambda a: started.set(), access=ACCESS_READ)
+    dispatcher = StreamingCommandDispatcher(ce, logger)
+    dispatcher.feed("[[COMMAND: MARK]]")
+    assert started.wait(2)
+    dispatcher.feed(" still streaming")
+    assert dispatcher.results() == [("MARK", None)]
+    dispatcher.close()
+
+
+def test_side_effects_wait_for_stream_end():
+    ce, logger = make_executor()
+    calls = []
+    ce.register_command("WRITE", lambda a: calls.append(a["n"]) or a["n"])
+    ce.register_command("PEEK", lambda a: "peek", access=ACCESS_READ)
+    dispatcher = StreamingCommandDispatcher(ce, logger)
+    dispatcher.feed('[[COMMAND: PEEK]] [[COMMAND: WRITE n="1"]] [[COMMAND: PEEK]]')
+    assert calls == []
+    assert dispatcher.results() == [("PEEK", "peek"), ("WRITE", "1"), ("PEEK", "peek")]
+    assert calls == ["1"]
+    dispatcher.close()
+
+
+def make_agent(tmp_path, ce, logger):
+    cfg = Config(
+        safe_output_dir=str(tmp_path / "out"),
+        agent_state_dir=str(tmp_path / "state"),
+        rate_limit_dir=str(tmp_path / "rl"),
+        backoff_base_seconds=0.0,
+    )
+    om = OutputManager(cfg, logger)
+    return RecursiveAgent(
+        config=cfg,
+        error_logger=logger,
+        command_executor=ce,
+        context_manager=ContextManager(cfg, logger, om),
+        output_manager=om,
+        agent_state=AgentState(cfg, logger),
+        model_name="dummy",
+        topic="t",
+        loops=1,
+        temperature=0.0,
+        seed=None,
+        rpm=60000,
+        api_key="x",
+    )
+
+
+def test_retried_stream_runs_side_effects_once(tmp_path):
+    ce, logger = make_executor()
+    calls = []
+    ce.register_command("APPEND", lambda a: calls.append(1) or len(calls))
+    agent = make_agent(tmp_path, ce, logger)
+    attempts = []
+
+    def flaky():
+        yield types.SimpleNamespace(text='[[COMMAND: APPEND]]')
+        raise RuntimeError("stream dropped")
+
+    class FakeClient:
+        def generate_content(self, prompt, stream=True):
+            attempts.append(1)
+            if len(attempts) == 1:
+                return flaky()
+            return iter([types.SimpleNamespace(text='[[COMMAND: APPEND]] done')])
+
+    agent.client = FakeClient()
+    events = list(agent.run())
+    assert events[-1][0] == "loop_end"
+    assert len(attempts) == 2
+    assert calls == [1]
+    assert agent.agent_state.get_state("command_results") == [("APPEND", 1)]
+
+
+def test_agent_runs_commands_while_streaming(tmp_path):
+    cfg = Config(
+        safe_output_dir=str(tmp_path / "out"),
+        agent_state_dir=str(tmp_path / "state"),
+        rate_limit_dir=str(tmp_path / "rl"),
+    )
+    ce, logger = make_executor()
+    executed = threading.Event()
+    ce.register_command("MARK", lambda a: executed.set() or "done", access=ACCESS_READ)
+    om = OutputManager(cfg, logger)
+    agent = RecursiveAgent(
+        config=cfg,
+        error_logger=logger,
+        command_executor=ce,
+        context_manager=ContextManager(cfg, logger, om),
+        output_manager=om,
+        agent_state=AgentState(cfg, logger),
+        model_name="dummy",
+        topic="t",
+        loops=1,
+        temperature=0.0,
+        seed=None,
+        rpm=60000,
+        api_key="x",
+    )
+
+    def chunks():
+        yield types.SimpleNamespace(text="[[COMMAND: MARK]]")
+        assert executed.wait(2)
+        yield types.SimpleNamespace(text=" tail")
+
+    class FakeClient:
+        def generate_content(self, prompt, stream=True):
+            return chunks()
+
+    agent.client = FakeClient()
+    events = list(agent.run())
+    assert events[-1][0] == "loop_end"
+    assert agent.agent_state.get_state("command_results") == [("MARK", "done")]
+
+
+def test_dispatcher_closed_when_loop_ends_early(tmp_path):
+    ce, logger = make_executor()
+    finished = []
+
+    def slow_read(args):
+        threading.Event().wait(0.2)
+        finished.append(1)
+
+    ce.register_command("SLOW", slow_read, access=ACCESS_READ)
+
+    def broken():
+        yield types.SimpleNamespace(text="[[COMMAND: SLOW]]")
+        raise RuntimeError("stream dropped")
+
+    class FakeClient:
+        def generate_content(self, prompt, stream=True):
+            return broken()
+
+    failing = make_agent(tmp_path / "error", ce, logger)
+    failing.config = dataclasses.replace(failing.config, max_retries=0)
+    failing.client = FakeClient()
+    assert list(failing.run())[-1][0] == "error"
+    assert finished == [1]
+
+    cancelled = make_agent(tmp_path / "cancel", ce, logger)
+    cancelled.client = FakeClient()
+    for event in cancelled.run():
+        if event[0] == "chunk":
+            cancelled.request_cancel("stop")
+    assert finished == [1, 1]
+    assert not [t for t in threading.enumerate() if t.name.startswith("laser-cmd")]
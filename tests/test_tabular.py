@@ -0,0 +1,66 @@
+import io
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "laser_lens"))
+sys.path.insert(0, ROOT)
+
+pd = pytest.importorskip("pandas")
+
+from tabular import summarize_table  # noqa: E402
+from context_manager import ContextManager  # noqa: E402
+from config import Config  # noqa: E402
+from utils import count_tokens  # noqa: E402
+
+REGIONS = ["north", "south", "east", "west"]
+
+
+def write_sales(path, rows, sep=","):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(sep.join(["id", "region", "price", "note"]) + "\n")
+        for i in range(rows):
+            price = "" if i % 100 == 0 else str(i % 50)
+            f.write(sep.join([str(i), REGIONS[i % 4], price, f"order {i}"]) + "\n")
+
+
+def test_csv_summary_stats_and_stratified_sample(tmp_path):
+    path = tmp_path / "sales.csv"
+    write_sales(path, 200000)
+    summary = summarize_table(str(path), "sales.csv", chunk_rows=30000, sample_rows=8)
+
+    assert summary.startswith("Table summary of sales.csv: 200000 rows, 4 columns")
+    price = next(line for line in summary.splitlines() if line.startswith("| price |"))
+    assert "| 198000 | 2000 |" in price and "min 0, max 49" in price
+    region = next(line for line in summary.splitlines() if line.startswith("| region |"))
+    assert "distinct 4" in region and "north (50000)" in region
+    note = next(line for line in summary.splitlines() if line.startswith("| note |"))
+    assert "distinct" in note
+
+    sample = pd.read_csv(io.StringIO(summary.split("```csv\n")[1].split("\n```")[0]))
+    assert len(sample) == 8
+    assert "stratified by region" in summary
+    assert set(sample["region"]) == set(REGIONS)
+    assert count_tokens(summary) < 2000
+
+
+def test_context_manager_stores_summary_not_rows(tmp_path):
+    cm = ContextManager(Config(safe_output_dir=str(tmp_path), tabular_chunk_rows=5000))
+    path = tmp_path / "sales.tsv"
+    write_sales(path, 20000, sep="\t")
+    cm.upload_file(str(path))
+    ctx = cm.get_context()
+    assert "Context from: sales.tsv" in ctx and "20000 rows" in ctx
+    assert ctx.count("order ") < 100
+
+    cm.upload_context("small.csv", b"a,b\n1,x\n2,y\n")
+    assert "Table summary of small.csv: 2 rows, 2 columns" in cm.get_context()
+
+
+def test_parquet_summary(tmp_path):
+    pytest.importorskip("pyarrow")
+    path = tmp_path / "t.parquet"
+    pd.DataFrame({"x": range(1000), "g": ["a", "b"] * 500}).to_parquet(path)
+    summary = summarize_table(str(path), "t.parquet", chunk_rows=300)
+    assert "1000 rows, 2 columns" in summary and "stratified by g" in summary
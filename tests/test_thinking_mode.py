@@ -27,7 +27,12 @@ from config import Config  # noqa: E402
 
 
 def test_thinking_mode_prompt(tmp_path):
-    cfg = Config(safe_output_dir=str(tmp_path))
+    # Keep the system segment inline so the prompt shows what thinking mode left out
+    cfg = Config(
+        safe_output_dir=str(tmp_path),
+        agent_state_dir=str(tmp_path / "state"),
+        use_system_instruction=False,
+    )
     logger = ErrorLogger(cfg)
     om = OutputManager(cfg, logger)
     cm = ContextManager(cfg, logger, om)
@@ -51,6 +56,6 @@ def test_thinking_mode_prompt(tmp_path):
         thinking_mode=True,
     )
 
-    prompt = agent._build_prompt("")
+    prompt = agent._prepare_prompt()
     assert "sandbox" not in prompt
     assert "HELP" not in prompt
@@ -0,0 +1,66 @@
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "laser_lens"))
+sys.path.insert(0, ROOT)
+
+from utils import iter_tmp_chunks, parse_tmp  # noqa: E402
+from context_manager import ContextManager  # noqa: E402
+from config import Config  # noqa: E402
+
+
+def test_stream_matches_parse_tmp_across_blocks():
+    delim = "<<END>>"
+    raw = "first\n<<END>>  \n<<END>>second chunk<<END>>third<<END>>partial"
+    expected, _ = parse_tmp(raw, delim)
+    for block in (1, 3, 7, 1000):
+        assert list(iter_tmp_chunks(io.StringIO(raw), delim, block)) == expected
+
+
+def test_long_segments_stream_in_linear_time(tmp_path):
+    delim = "<<END>>"
+    path = tmp_path / "nodelim.tmp"
+    with open(path, "w", encoding="utf-8") as f:
+        for _ in range(256):
+            f.write("x" * (64 * 1024 - 7) + "<<END")  # near-misses at block edges
+        f.write(">>tail")
+    start = time.perf_counter()
+    with open(path, "r", encoding="utf-8") as f:
+        chunks = list(iter_tmp_chunks(f, delim))
+    assert time.perf_counter() - start < 1.0
+    assert len(chunks) == 1 and len(chunks[0]) == os.path.getsize(path) - len("<<END>>tail")
+
+    tracemalloc.start()
+    with open(path, "r", encoding="utf-8") as f:
+        capped = list(iter_tmp_chunks(f, delim, max_segment_chars=100000))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert peak < 1024 * 1024
+    assert 100000 <= len(capped[0]) < 100000 + 2 * 64 * 1024
+    assert chunks[0].endswith(capped[0])
+
+
+def test_resume_keeps_recent_chunks_with_flat_memory(tmp_path):
+    cfg = Config(max_context_tokens=5000, safe_output_dir=str(tmp_path))
+    delim = cfg.default_prompt_delim
+    path = tmp_path / "run.tmp"
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(60000):
+            f.write(f"Loop {i} reflection on the recursive analysis so far.\n{delim}")
+        f.write("unfinished")
+    assert os.path.getsize(path) > 3 * 1024 * 1024
+
+    cm = ContextManager(cfg)
+    tracemalloc.start()
+    cm.upload_file(str(path), "run.tmp")
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    assert peak < 2 * 1024 * 1024
+    ctx = cm.get_context()
+    assert "Loop 59999 " in ctx and "Loop 0 " not in ctx
+    assert "unfinished" not in ctx and "[truncated]" not in ctx
+    assert cm.total_tokens <= cfg.max_context_tokens
@@ -0,0 +1,177 @@
+import os
+import subprocess
+import sys
+import textwrap
+import time
+import types
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "laser_lens"))
+sys.path.insert(0, ROOT)
+
+# Stub google modules
+google = types.ModuleType("google")
+generativeai = types.ModuleType("generativeai")
+class DummyModel:
+    def __init__(self, *a, **k):
+        pass
+
+generativeai.GenerativeModel = DummyModel
+google.generativeai = generativeai
+sys.modules.setdefault("google", google)
+sys.modules.setdefault("google.generativeai", generativeai)
+
+from tmp_writer import BackgroundTmpWriter  # noqa: E402
+from recursive_agent import RecursiveAgent  # noqa: E402
+from command_executor import CommandExecutor  # noqa: E402
+from context_manager import ContextManager  # noqa: E402
+from output_manager import OutputManager  # noqa: E402
+from agent_state import AgentState  # noqa: E402
+from error_logger import ErrorLogger  # noqa: E402
+from config import Config  # noqa: E402
+
+
+class SlowFile:
+    """File stand-in that records each write call and is slow to write."""
+
+    def __init__(self):
+        self.writes = []
+        self.flushes = 0
+
+    def write(self, text):
+        time.sleep(0.05)
+        self.writes.append(text)
+
+    def flush(self):
+        self.flushes += 1
+
+
+def test_write_does_not_block_and_batches():
+    f = SlowFile()
+    writer = BackgroundTmpWriter(f, ErrorLogger(Config()), interval_ms=50)
+    start = time.monotonic()
+    for i in range(20):
+        writer.write(f"{i},")
+    assert time.monotonic() - start < 0.05
+    writer.sync()
+    assert "".join(f.writes) == "".join(f"{i}," for i in range(20))
+    assert len(f.writes) < 20
+    assert f.flushes >= 1
+
+
+def test_flush_policy_reaches_disk_without_sync(tmp_path):
+    path = tmp_path / "stream.md"
+    with open(path, "a+", encoding="utf-8") as f:
+        writer = BackgroundTmpWriter(f, ErrorLogger(Config()), durability="flush", interval_ms=10)
+        writer.write("hello")
+        deadline = time.monotonic() + 2
+        while path.read_text(encoding="utf-8") != "hello" and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert path.read_text(encoding="utf-8") == "hello"
+
+
+def test_write_after_idle_pause_flushes_within_interval(tmp_path):
+    path = tmp_path / "stream.md"
+    with open(path, "a+", encoding="utf-8") as f:
+        writer = BackgroundTmpWriter(f, ErrorLogger(Config()), durability="flush", interval_ms=50)
+        expected = ""
+        for text in ("one", "two", "three"):
+            writer.write(text)
+            expected += text
+            start = time.monotonic()
+            while path.read_text(encoding="utf-8") != expected and time.monotonic() - start < 2:
+                time.sleep(0.005)
+            assert time.monotonic() - start < 0.4
+            time.sleep(0.3)  # idle, but shorter than the thread's idle exit
+
+
+def test_fsync_policy_and_sync(tmp_path):
+    path = tmp_path / "stream.md"
+    with open(path, "a+", encoding="utf-8") as f:
+        writer = BackgroundTmpWriter(f, ErrorLogger(Config()), durability="fsync")
+        writer.write("a")
+        writer.write("b")
+        writer.sync()
+        assert path.read_text(encoding="utf-8") == "ab"
+
+
+def test_rewind_drops_text_after_mark(tmp_path):
+    path = tmp_path / "stream.md"
+    with open(path, "w+", encoding="utf-8") as f:
+        writer = BackgroundTmpWriter(f, ErrorLogger(Config()), interval_ms=60000)
+        writer.write("kept ")
+        mark = writer.mark()
+        writer.write("dropped")
+        writer.rewind(mark)
+        writer.write("retried")
+        writer.sync()
+        assert path.read_text(encoding="utf-8") == "kept retried"
+
+
+def test_unknown_policy_rejected():
+    with pytest.raises(ValueError):
+        BackgroundTmpWriter(SlowFile(), ErrorLogger(Config()), durability="sometimes")
+
+
+def test_queued_text_is_written_at_exit(tmp_path):
+    path = tmp_path / "stream.md"
+    script = textwrap.dedent(
+        f"""
+        import sys
+        sys.path.insert(0, {ROOT!r})
+        from tmp_writer import BackgroundTmpWriter
+        from error_logger import ErrorLogger
+        from config import Config
+
+        f = open({str(path)!r}, "a+", encoding="utf-8")
+        writer = BackgroundTmpWriter(f, ErrorLogger(Config()), interval_ms=60000)
+        writer.write("streamed before exit")
+        sys.exit(1)
+        """
+    )
+    proc = subprocess.run([sys.executable, "-c", script], cwd=tmp_path)
+    assert proc.returncode == 1
+    assert path.read_text(encoding="utf-8") == "streamed before exit"
+
+
+def test_error_event_follows_a_sync(tmp_path):
+    cfg = Config(
+        safe_output_dir=str(tmp_path / "out"),
+        agent_state_dir=str(tmp_path / "state"),
+        rate_limit_dir=str(tmp_path / "rl"),
+        tmp_flush_interval_ms=60000,
+        max_retries=0,
+    )
+    logger = ErrorLogger(cfg)
+    om = OutputManager(cfg, logger)
+    agent = RecursiveAgent(
+        config=cfg,
+        error_logger=logger,
+        command_executor=CommandExecutor(logger),
+        context_manager=ContextManager(cfg, logger, om),
+        output_manager=om,
+        agent_state=AgentState(cfg, logger),
+        model_name="dummy",
+        topic="t",
+        loops=1,
+        temperature=0.0,
+        seed=None,
+        rpm=60000,
+        api_key="x",
+    )
+
+    def failing():
+        yield types.SimpleNamespace(text="partial answer")
+        raise RuntimeError("stream broke")
+
+    class FakeClient:
+        def generate_content(self, prompt, stream=True):
+            return failing()
+
+    agent.client = FakeClient()
+    for event in agent.run():
+        if event[0] == "error":
+            break
+    with open(agent.tmp_file.name, "r", encoding="utf-8") as f:
+        assert "partial answer" in f.read()
@@ -0,0 +1,68 @@
+import os
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "laser_lens"))
+sys.path.insert(0, ROOT)
+
+from token_counter import TokenCounter, count_tokens, profile_for  # noqa: E402
+from context_manager import ContextManager  # noqa: E402
+from error_logger import ErrorLogger  # noqa: E402
+from output_manager import OutputManager  # noqa: E402
+from config import Config  # noqa: E402
+
+PROSE = "The quick brown fox jumps over the lazy dog, again and again. "
+
+
+def test_prose_counts_well_below_characters():
+    text = PROSE * 100
+    tokens = count_tokens(text, "models/gemini-2.0-pro")
+    assert len(text) / 6 < tokens < len(text) / 3
+
+
+def test_families_are_calibrated():
+    assert profile_for("models/gemini-1.5-flash") != profile_for("unknown-model")
+    assert count_tokens("1234567", "gpt-4o") == 3
+    assert count_tokens("1234567", "models/gemini-2.0-pro") == 7
+    assert count_tokens("日本語") == 3
+
+
+def test_counts_memoized_by_content():
+    counter = TokenCounter(max_entries=2)
+    text = PROSE * 10
+    first = counter.count(text)
+    assert counter.count(str(text)) == first
+    assert (counter.hits, counter.misses) == (1, 1)
+    counter.count(text, "models/gemini-2.0-pro")  # separate entry per family
+    counter.count(PROSE * 11)
+    assert counter.misses == 3 and len(counter._memo) == 2
+    counter.count("short")  # below the memo threshold
+    assert counter.misses == 3
+
+
+def test_context_keeps_prose_that_fits_in_tokens(tmp_path):
+    cfg = Config(max_context_tokens=2000, safe_output_dir=str(tmp_path))
+    logger = ErrorLogger(cfg)
+    cm = ContextManager(cfg, logger, OutputManager(cfg, logger))
+    text = PROSE * 100  # ~6k chars, well under 2000 tokens
+    cm.upload_context("notes.txt", text.encode("utf-8"))
+    assert "[truncated]" not in cm.get_context()
+
+
+def test_context_limits_use_the_model_calibration(tmp_path):
+    cfg = Config(max_context_tokens=1500, safe_output_dir=str(tmp_path))
+    digits = "1234567 " * 300  # ~900 tokens for gpt-4o, ~2100 by default
+    cm = ContextManager(cfg, model_name="gpt-4o")
+    cm.upload_context("ids.txt", digits.encode("utf-8"))
+    assert "[truncated]" not in cm.get_context()
+    assert cm.total_tokens < 1500
+
+    default = ContextManager(cfg)
+    default.upload_context("ids.txt", digits.encode("utf-8"))
+    assert "[truncated]" in default.get_context()
+
+    # A copy handed to an agent on another model is re-counted and re-limited
+    clone = cm.copy()
+    before = cm.total_tokens
+    clone.set_model("models/gemini-2.0-pro")
+    assert "[truncated]" in clone.get_context()
+    assert "[truncated]" not in cm.get_context() and cm.total_tokens == before
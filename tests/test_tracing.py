@@ -0,0 +1,106 @@
+import json
+import os
+import sys
+import types
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "laser_lens"))
+sys.path.insert(0, ROOT)
+
+# Stub google modules
+google = types.ModuleType("google")
+generativeai = types.ModuleType("generativeai")
+class DummyModel:
+    def __init__(self, *a, **k):
+        pass
+
+generativeai.GenerativeModel = DummyModel
+google.generativeai = generativeai
+sys.modules.setdefault("google", google)
+sys.modules.setdefault("google.generativeai", generativeai)
+
+from recursive_agent import RecursiveAgent  # noqa: E402
+from tracing import NullTracer, Tracer, get_tracer, set_tracer  # noqa: E402
+from command_executor import CommandExecutor  # noqa: E402
+from context_manager import ContextManager  # noqa: E402
+from output_manager import OutputManager  # noqa: E402
+from agent_state import AgentState  # noqa: E402
+from error_logger import ErrorLogger  # noqa: E402
+from config import Config  # noqa: E402
+
+
+def test_spans_nest_and_export(tmp_path):
+    tracer = Tracer()
+    track = tracer.new_track("worker")
+    with tracer.span("outer", track=track):
+        with tracer.span("inner", track=track, detail=1):
+            pass
+    out = tmp_path / "trace.json"
+    tracer.export(str(out))
+    data = json.loads(out.read_text(encoding="utf-8"))
+    spans = {e["name"]: e for e in data["traceEvents"] if e["ph"] == "X"}
+    outer, inner = spans["outer"], spans["inner"]
+    assert outer["ts"] <= inner["ts"]
+    assert inner["ts"] + inner["dur"] <= outer["ts"] + outer["dur"]
+    assert inner["args"] == {"detail": 1} and inner["tid"] == track
+
+
+def test_tracing_off_by_default():
+    assert isinstance(get_tracer(), NullTracer)
+    with get_tracer().span("ignored"):
+        pass
+    assert get_tracer().events() == []
+
+
+def test_agent_run_spans(tmp_path):
+    cfg = Config(
+        safe_output_dir=str(tmp_path / "out"),
+        agent_state_dir=str(tmp_path / "state"),
+        rate_limit_dir=str(tmp_path / "rl"),
+        stream_commands=False,
+    )
+    logger = ErrorLogger(cfg)
+    ce = CommandExecutor(logger)
+    ce.register_command("NOTE", lambda a: "noted")
+    om = OutputManager(cfg, logger)
+    agent = RecursiveAgent(
+        config=cfg,
+        error_logger=logger,
+        command_executor=ce,
+        context_manager=ContextManager(cfg, logger, om),
+        output_manager=om,
+        agent_state=AgentState(cfg, logger),
+        model_name="dummy",
+        topic="t",
+        loops=2,
+        temperature=0.0,
+        seed=None,
+        rpm=60000,
+        api_key="x",
+    )
+
+    class FakeClient:
+        def generate_content(self, prompt, stream=True):
+            return iter([types.SimpleNamespace(text="hi [[COMMAND: NOTE]]")])
+
+    agent.client = FakeClient()
+    tracer = Tracer()
+    set_tracer(tracer)
+    try:
+        list(agent.run())
+    finally:
+        set_tracer(None)
+
+    spans = [e for e in tracer.events() if e["ph"] == "X"]
+    names = [e["name"] for e in spans]
+    for expected in (
+        "loop", "get_context", "build_prompt", "rate_limit_wait",
+        "attempt", "stream", "NOTE", "save_state",
+    ):
+        assert expected in names
+    assert names.count("loop") == 2
+    loop = next(e for e in spans if e["name"] == "loop")
+    nested = [
+        e["name"] for e in spans
+        if e["tid"] == loop["tid"] and loop["ts"] <= e["ts"] < loop["ts"] + loop["dur"]
+    ]
+    assert {"get_context", "attempt", "stream", "NOTE"} <= set(nested)